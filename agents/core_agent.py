@@ -3,8 +3,8 @@ from dataclasses import dataclass, field
 from typing import Any, Callable, Dict, List, Optional, AsyncGenerator
 
 from logging_config import logger
+import inspect
 import json
-import asyncio
 
 from vocode.streaming.agent.chat_gpt_agent import ChatGPTAgent
 from vocode.streaming.agent.base_agent import (
@@ -25,7 +25,7 @@ from server.settings import Settings
 from server.database import get_agent_config
 from tools import registry
 from tools.safety import safety_check
-from server.state_manager import StateManager
+from server.state_manager import AsyncStateManager, StateManager
 from tools.language import get_engines_for_language
 from tools.calendar import AuthError
 from requests.exceptions import RequestException
@@ -58,7 +58,7 @@ class FunctionCallingAgent(ChatGPTAgent):
         self,
         agent_config: FunctionChatGPTAgentConfig,
         function_map: Optional[Dict[str, Callable[..., Any]]] = None,
-        state_manager: Optional[StateManager] = None,
+        state_manager: Optional[StateManager | AsyncStateManager] = None,
         call_sid: str | None = None,
         **kwargs: Any,
     ) -> None:
@@ -88,7 +88,10 @@ class FunctionCallingAgent(ChatGPTAgent):
         try:
             params = json.loads(function_call.arguments or "{}")
             if self.state_manager and self.call_sid:
-                session = self.state_manager.get_session(self.call_sid)
+                if isinstance(self.state_manager, AsyncStateManager):
+                    session = await self.state_manager.get_session(self.call_sid)
+                else:
+                    session = self.state_manager.get_session(self.call_sid)
                 user_phone = session.get("from")
                 twilio_phone = session.get("to")
                 if user_phone and twilio_phone:
@@ -103,7 +106,7 @@ class FunctionCallingAgent(ChatGPTAgent):
         
         try:
             result = func(**params)
-            if asyncio.iscoroutine(result):
+            if inspect.isawaitable(result):
                 result = await result
             
             # Record successful tool call
@@ -237,7 +240,9 @@ class SafeAgentFactory(DefaultAgentFactory):
 
 
 def build_core_agent(
-    state_manager: StateManager, call_sid: str | None = None, language: str = "en"
+    state_manager: StateManager | AsyncStateManager,
+    call_sid: str | None = None,
+    language: str = "en",
 ) -> CoreAgentConfig:
     """Return TEL3SIS ChatGPT agent with STT and TTS providers configured."""
 
@@ -280,7 +285,9 @@ def build_core_agent(
 
 
 def get_core_agent(
-    state_manager: StateManager, call_sid: str | None = None, language: str = "en"
+    state_manager: StateManager | AsyncStateManager,
+    call_sid: str | None = None,
+    language: str = "en",
 ) -> AgentConfig:
     """Return just the Vocode ``AgentConfig`` for the core agent."""
 
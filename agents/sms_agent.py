@@ -3,16 +3,16 @@ from __future__ import annotations
 from typing import List, Optional
 import re
 
-from server.database import set_user_preference
+from server.database import set_user_preference_async
 
 from agents.core_agent import SafeFunctionCallingAgent, build_core_agent
-from server.state_manager import StateManager
+from server.state_manager import AsyncStateManager
 
 
 class SMSAgent:
     """Simple agent wrapper for processing SMS conversations."""
 
-    def __init__(self, state_manager: StateManager, session_id: str) -> None:
+    def __init__(self, state_manager: AsyncStateManager, session_id: str) -> None:
         self._state_manager = state_manager
         self._session_id = session_id
         config = build_core_agent(state_manager, session_id).agent
@@ -20,15 +20,15 @@ class SMSAgent:
             config, state_manager=state_manager, call_sid=session_id
         )
 
-    def _command_response(self, text: str) -> Optional[str]:
+    async def _command_response(self, text: str) -> Optional[str]:
         """Return response text if ``text`` is a command."""
         m = re.match(r"\s*(?:lang|language)[:\s]+([a-zA-Z-]+)", text)
         if m:
             code = m.group(1)
-            session = self._state_manager.get_session(self._session_id)
+            session = await self._state_manager.get_session(self._session_id)
             from_number = session.get("from")
             if from_number:
-                set_user_preference(from_number, "language", code)
+                await set_user_preference_async(from_number, "language", code)
             return f"Language set to {code}"
         m = re.match(r"\s*/translate\s+([a-zA-Z-]+)\s+(.+)", text)
         if m:
@@ -43,7 +43,7 @@ class SMSAgent:
 
     async def handle_message(self, text: str) -> str:
         """Return agent response text for ``text``."""
-        cmd = self._command_response(text)
+        cmd = await self._command_response(text)
         if cmd is not None:
             return cmd
         parts: List[str] = []
@@ -0,0 +1,26 @@
+"""Add session_archives table for ended Redis sessions"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003_add_session_archives"
+down_revision = "0002_add_sentiment"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "session_archives",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("call_sid", sa.String(), nullable=False),
+        sa.Column("data", sa.JSON(), nullable=True),
+        sa.Column("history", sa.JSON(), nullable=True),
+        sa.Column("ended_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_session_archives_call_sid", "session_archives", ["call_sid"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_session_archives_call_sid", table_name="session_archives")
+    op.drop_table("session_archives")
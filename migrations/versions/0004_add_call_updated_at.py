@@ -0,0 +1,20 @@
+"""Add updated_at column to Call for incremental vector sync"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004_add_call_updated_at"
+down_revision = "0003_add_session_archives"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("calls", sa.Column("updated_at", sa.DateTime(), nullable=True))
+    op.execute("UPDATE calls SET updated_at = created_at")
+    op.create_index("ix_calls_updated_at", "calls", ["updated_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_calls_updated_at", table_name="calls")
+    op.drop_column("calls", "updated_at")
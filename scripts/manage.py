@@ -64,6 +64,16 @@ def generate_api_key_cmd(owner: str) -> None:
     click.echo(key)
 
 
+@cli.command("reencrypt-tokens")
+@click.option("--batch-size", default=500, show_default=True, help="Keys per SCAN page")
+def reencrypt_tokens_cmd(batch_size: int) -> None:
+    """Re-encrypt stored OAuth tokens with the current key."""
+    from server.state_manager import StateManager
+
+    rotated = StateManager().reencrypt_tokens(batch_size=batch_size)
+    click.echo(f"Re-encrypted {rotated} tokens.")
+
+
 @cli.command()
 def migrate() -> None:
     """Apply database migrations."""
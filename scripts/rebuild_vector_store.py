@@ -1,33 +1,179 @@
-"""Utility to rebuild ChromaDB vectors from stored call summaries."""
+"""Utility to rebuild ChromaDB vectors from stored call summaries.
+
+Summaries are streamed from the ``calls`` table in ``id`` order and upserted
+in fixed-size batches into a shadow collection, which replaces the live
+collection only once every row is in. Progress is checkpointed after each
+batch so an interrupted rebuild can continue with ``--resume``. Promoting
+rewinds the incremental sync to the rebuild's start, so calls changed while
+it ran reach the new collection too.
+"""
 
 from __future__ import annotations
 
-import shutil
+import asyncio
+import json
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import UTC, datetime
 from pathlib import Path
+from typing import Any, AsyncIterator, Deque, List, Optional, Sequence, Tuple
 
 import click
+from sqlalchemy import select
 
 from server import database as db
-from server.vector_db import VectorDB
+from server.vector_db import VectorDB, get_embedding_function
+from server.vector_sync import rewind_sync, summary_metadata
 from server.settings import Settings
 
+COLLECTION = "summaries"
+SHADOW = f"{COLLECTION}__rebuild"
 
-@click.command(help="Recreate vector embeddings from existing call summaries")
-def cli() -> None:
-    """Load summaries from the database and rebuild the vector store."""
+Row = Tuple[int, str, str, str, Optional[datetime]]
 
-    vector_path = Path(Settings().vector_db_path)
-    if vector_path.exists():
-        shutil.rmtree(vector_path)
 
-    with db.get_session() as session:
-        rows = session.query(db.Call.call_sid, db.Call.summary).all()
+def _embed(texts: Sequence[str]) -> List[List[float]]:
+    """Embed ``texts`` in a pool worker, loading the model once per process."""
+    return [list(v) for v in get_embedding_function()(list(texts))]
+
+
+async def _pages(after_id: int, batch_size: int) -> AsyncIterator[List[Row]]:
+    """Yield calls with ``id > after_id`` in pages from a server-side cursor."""
+    query = (
+        select(
+            db.Call.id,
+            db.Call.call_sid,
+            db.Call.summary,
+            db.Call.from_number,
+            db.Call.created_at,
+        )
+        .where(db.Call.id > after_id)
+        .order_by(db.Call.id)
+        .execution_options(yield_per=batch_size)
+    )
+    async with db.get_session_async() as session:
+        result = await session.stream(query)
+        async for page in result.partitions(batch_size):
+            yield [tuple(row) for row in page]
+
+
+def _load_checkpoint(path: Path) -> dict[str, Any]:
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_checkpoint(path: Path, last_id: int, count: int, started_at: str) -> None:
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(
+        json.dumps({"last_id": last_id, "count": count, "started_at": started_at})
+    )
+    tmp.replace(path)
+
 
-    vdb = VectorDB(persist_directory=str(vector_path), collection_name="summaries")
-    if rows:
-        vdb.add_texts([summary for _, summary in rows], ids=[sid for sid, _ in rows])
+class _Writer:
+    """Upsert batches into the shadow collection and checkpoint after each."""
 
-    click.echo(f"Rebuilt vectors for {len(rows)} summaries")
+    def __init__(
+        self, vdb: VectorDB, checkpoint: Path, count: int, started_at: str
+    ) -> None:
+        self.vdb = vdb
+        self.checkpoint = checkpoint
+        self.count = count
+        self.started_at = started_at
+
+    def write(self, rows: List[Row], embeddings: Optional[List[List[float]]]) -> None:
+        self.vdb.upsert_texts(
+            [row[2] for row in rows],
+            ids=[row[1] for row in rows],
+            metadatas=[summary_metadata(row[3], row[4]) for row in rows],
+            embeddings=embeddings,
+        )
+        self.count += len(rows)
+        _save_checkpoint(self.checkpoint, rows[-1][0], self.count, self.started_at)
+
+
+async def rebuild(
+    vector_path: Path,
+    checkpoint: Path,
+    *,
+    batch_size: int = 256,
+    workers: int = 0,
+    resume: bool = False,
+) -> int:
+    """Rebuild the summaries collection and return the number of vectors."""
+    checkpoint.parent.mkdir(parents=True, exist_ok=True)
+    state = _load_checkpoint(checkpoint) if resume else {}
+    shadow = VectorDB(persist_directory=str(vector_path), collection_name=SHADOW)
+    if not state or "started_at" not in state:
+        shadow.reset()
+        state = {"last_id": 0, "count": 0}
+        state["started_at"] = datetime.now(UTC).isoformat()
+        _save_checkpoint(checkpoint, **state)
+    writer = _Writer(shadow, checkpoint, state["count"], state["started_at"])
+
+    if workers > 0:
+        # Embed batches in parallel, but write them in order so the
+        # checkpoint only ever advances past fully stored rows.
+        pending: Deque[Tuple[List[Row], Future]] = deque()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            async for rows in _pages(state["last_id"], batch_size):
+                texts = [row[2] for row in rows]
+                pending.append((rows, pool.submit(_embed, texts)))
+                if len(pending) >= workers * 2:
+                    done, future = pending.popleft()
+                    writer.write(done, future.result())
+            while pending:
+                done, future = pending.popleft()
+                writer.write(done, future.result())
+    else:
+        async for rows in _pages(state["last_id"], batch_size):
+            writer.write(rows, None)
+
+    shadow.promote(COLLECTION)
+    rewind_sync(datetime.fromisoformat(writer.started_at), vector_path)
+    checkpoint.unlink(missing_ok=True)
+    return writer.count
+
+
+@click.command(help="Recreate vector embeddings from existing call summaries")
+@click.option("--batch-size", default=256, show_default=True, help="Rows per batch.")
+@click.option(
+    "--workers",
+    default=0,
+    show_default=True,
+    help="Processes used to compute embeddings (0 embeds in-process).",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Continue an interrupted rebuild from its checkpoint.",
+)
+@click.option(
+    "--checkpoint",
+    type=click.Path(path_type=Path),
+    default=None,
+    help="Checkpoint file (default: <VECTOR_DB_PATH>/rebuild_checkpoint.json).",
+)
+def cli(
+    batch_size: int, workers: int, resume: bool, checkpoint: Optional[Path]
+) -> None:
+    """Stream summaries from the database into a fresh vector collection."""
+
+    vector_path = Path(Settings().vector_db_path)
+    vector_path.mkdir(parents=True, exist_ok=True)
+    checkpoint = checkpoint or vector_path / "rebuild_checkpoint.json"
+    count = asyncio.run(
+        rebuild(
+            vector_path,
+            checkpoint,
+            batch_size=batch_size,
+            workers=workers,
+            resume=resume,
+        )
+    )
+    click.echo(f"Rebuilt vectors for {count} summaries")
 
 
 if __name__ == "__main__":
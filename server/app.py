@@ -22,7 +22,7 @@ from fastapi.templating import Jinja2Templates
 from apispec import APISpec
 from pydantic import BaseModel, Field, HttpUrl, ValidationError
 from sqlalchemy import select, func
-from datetime import datetime
+from datetime import UTC, datetime
 from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from logging_config import logger
 from starlette.middleware.sessions import SessionMiddleware
@@ -50,7 +50,7 @@ from .database import (
 )
 from .settings import Settings, ConfigError
 from .handoff import dial_twiml
-from .state_manager import StateManager
+from .state_manager import AsyncStateManager, StateManager
 from .tasks import echo, reprocess_call, delete_call_record, process_recording
 from agents.sms_agent import SMSAgent
 from tools.notifications import send_sms, start_call
@@ -62,7 +62,7 @@ from agents.core_agent import (
 )
 from .chat import manager as chat_manager, uuid4
 from .latency_logging import log_call
-from .metrics import metrics_middleware
+from .metrics import cache_hit_ratios, metrics_middleware
 
 
 class AgentConfigPayload(BaseModel):
@@ -136,6 +136,14 @@ class ListCallsQuery(BaseModel):
     sort: str = "-timestamp"
 
 
+class ListSessionsQuery(BaseModel):
+    """Parameters for paginating active sessions."""
+
+    page: int = Field(1, ge=1)
+    page_size: int = Field(20, ge=1, le=100)
+    active_within: int | None = Field(None, ge=1)
+
+
 class SearchQuery(BaseModel):
     """Parameters for search endpoint."""
 
@@ -278,6 +286,7 @@ def create_app(cfg: Settings | None = None) -> FastAPI:
 
     try:
         state_manager = StateManager()
+        async_state_manager = AsyncStateManager()
     except ConfigError as exc:
         raise RuntimeError(str(exc)) from exc
 
@@ -633,16 +642,55 @@ def create_app(cfg: Settings | None = None) -> FastAPI:
     )
     async def agent_status(user: str = Depends(_require_user)) -> dict:
         """Return counts of active sessions and websockets."""
-        sessions = []
+        count = 0
         try:
-            sessions = state_manager.list_sessions()
+            count = await async_state_manager.count_sessions()
         except Exception:
             pass
         return {
-            "active_sessions": len(sessions),
+            "active_sessions": count,
             "active_websockets": len(chat_manager.active),
         }
 
+    @app.get(
+        "/v1/admin/cache_stats",
+        summary="Function cache hit ratios",
+        tags=["admin"],
+    )
+    async def cache_stats(user: str = Depends(_require_user)) -> dict:
+        """Return per-function cache hit/miss counts for this process."""
+        return {"functions": cache_hit_ratios()}
+
+    @app.get(
+        "/v1/admin/sessions",
+        summary="List active sessions",
+        tags=["admin"],
+    )
+    async def list_active_sessions(
+        request: Request,
+        user: str = Depends(_require_user),
+    ):
+        """Return active sessions ordered by most recent activity."""
+        try:
+            params = ListSessionsQuery(**request.query_params)
+        except ValidationError as exc:
+            return _json_validation_error(exc)
+
+        total = await async_state_manager.count_sessions(params.active_within)
+        rows = await async_state_manager.recent_sessions(
+            offset=(params.page - 1) * params.page_size,
+            limit=params.page_size,
+            within=params.active_within,
+        )
+        items = [
+            {
+                "session_id": sid,
+                "last_active": datetime.fromtimestamp(score, UTC).isoformat(),
+            }
+            for sid, score in rows
+        ]
+        return {"total": total, "items": items}
+
     @app.get("/v1/admin/config", summary="Get agent config", tags=["admin"])
     async def get_config(user: str = Depends(_require_user)) -> AgentConfigPayload:
         """Return the editable prompt and voice settings."""
@@ -698,7 +746,9 @@ def create_app(cfg: Settings | None = None) -> FastAPI:
             return _json_validation_error(exc)
 
         call_sid = data.CallSid
-        state_manager.create_session(call_sid, {"from": data.From, "to": data.To})
+        await async_state_manager.create_session(
+            call_sid, {"from": data.From, "to": data.To}
+        )
         echo.delay(f"Call {call_sid} started")
 
         language = await get_user_preference_async(data.From, "language")
@@ -712,10 +762,10 @@ def create_app(cfg: Settings | None = None) -> FastAPI:
 
             language = guess_language_from_number(data.From)
             await set_user_preference_async(data.From, "language", language)
-        if hasattr(state_manager, "update_session"):
-            state_manager.update_session(call_sid, language=language)
+        if hasattr(async_state_manager, "update_session"):
+            await async_state_manager.update_session(call_sid, language=language)
 
-        config_obj = build_core_agent(state_manager, call_sid, language=language)
+        config_obj = build_core_agent(async_state_manager, call_sid, language=language)
         inbound_route = telephony_server.create_inbound_route(
             TwilioInboundCallConfig(
                 url="/v1/inbound_call",
@@ -725,7 +775,7 @@ def create_app(cfg: Settings | None = None) -> FastAPI:
         )
 
         async def escalate():
-            summary = state_manager.get_summary(call_sid) or ""
+            summary = await async_state_manager.get_summary(call_sid) or ""
             send_sms(
                 to_phone=config.escalation_phone_number,
                 from_phone=data.From,
@@ -734,7 +784,7 @@ def create_app(cfg: Settings | None = None) -> FastAPI:
             xml = dial_twiml(data.From)
             return Response(content=xml, media_type="text/xml")
 
-        if state_manager.is_escalation_required(call_sid):
+        if await async_state_manager.is_escalation_required(call_sid):
             return await escalate()
 
         response = await inbound_route(
@@ -743,7 +793,7 @@ def create_app(cfg: Settings | None = None) -> FastAPI:
             twilio_to=data.To,
         )
 
-        if state_manager.is_escalation_required(call_sid):
+        if await async_state_manager.is_escalation_required(call_sid):
             return await escalate()
 
         return Response(
@@ -761,10 +811,13 @@ def create_app(cfg: Settings | None = None) -> FastAPI:
             return _json_validation_error(exc)
 
         sms_id = data.MessageSid
-        state_manager.create_session(sms_id, {"from": data.From, "to": data.To})
-        agent = SMSAgent(state_manager, sms_id)
+        await async_state_manager.create_session(
+            sms_id, {"from": data.From, "to": data.To}
+        )
+        agent = SMSAgent(async_state_manager, sms_id)
         response_text = await agent.handle_message(data.Body)
         send_sms(data.From, data.To, response_text)
+        await async_state_manager.end_session(sms_id)
         return Response(status_code=204)
 
     @app.post("/v1/inbound_sms", summary="Handle inbound SMS", tags=["sms"])
@@ -819,13 +872,15 @@ def create_app(cfg: Settings | None = None) -> FastAPI:
             recording_sid=data.RecordingSid,
             url=str(data.RecordingUrl),
         ).info("recording_callback")
-        session = state_manager.get_session(data.CallSid)
+        session = await async_state_manager.get_session(data.CallSid)
         process_recording.delay(
             data.RecordingUrl,
             data.CallSid,
             session.get("from", ""),
             session.get("to", ""),
         )
+        # The task ends the session once the summary is stored, so the
+        # archived row includes it and no write lands after the delete.
         return Response(status_code=204)
 
     @app.websocket("/chat/ws")
@@ -839,9 +894,9 @@ def create_app(cfg: Settings | None = None) -> FastAPI:
 
         sid = session_id or str(uuid4())
         await chat_manager.connect(sid, websocket)
-        config_obj = build_core_agent(state_manager, sid)
+        config_obj = build_core_agent(async_state_manager, sid)
         agent = SafeFunctionCallingAgent(
-            config_obj.agent, state_manager=state_manager, call_sid=sid
+            config_obj.agent, state_manager=async_state_manager, call_sid=sid
         )
 
         await websocket.send_json({"session_id": sid})
@@ -852,7 +907,7 @@ def create_app(cfg: Settings | None = None) -> FastAPI:
         try:
             while True:
                 text = await websocket.receive_text()
-                state_manager.append_history(sid, "user", text)
+                await async_state_manager.append_history(sid, "user", text)
                 # signal the agent is processing and about to speak
                 await chat_manager.broadcast_json(
                     {"event": "agent_state", "session_id": sid, "state": "speaking"}
@@ -860,7 +915,9 @@ def create_app(cfg: Settings | None = None) -> FastAPI:
                 async for resp in agent.generate_response(text, sid):
                     if hasattr(resp.message, "text"):
                         msg_text = getattr(resp.message, "text")
-                        state_manager.append_history(sid, "assistant", msg_text)
+                        await async_state_manager.append_history(
+                            sid, "assistant", msg_text
+                        )
                         await chat_manager.send_text(sid, msg_text)
                 await chat_manager.broadcast_json(
                     {"event": "agent_state", "session_id": sid, "state": "listening"}
@@ -897,7 +954,7 @@ def create_app(cfg: Settings | None = None) -> FastAPI:
         status: dict[str, str] = {}
 
         try:
-            state_manager._redis.ping()  # type: ignore[attr-defined]
+            await async_state_manager._redis.ping()  # type: ignore[attr-defined]
             status["redis"] = "ok"
         except Exception:
             status["redis"] = "error"
@@ -912,7 +969,8 @@ def create_app(cfg: Settings | None = None) -> FastAPI:
             status["database"] = "error"
 
         try:
-            state_manager._summary_db.client.heartbeat()  # type: ignore[attr-defined]
+            summary_db = async_state_manager._summary_db  # type: ignore[attr-defined]
+            summary_db.client.heartbeat()
             status["chromadb"] = "ok"
         except Exception:
             status["chromadb"] = "error"
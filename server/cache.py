@@ -1,22 +1,71 @@
 """Redis-backed caching utilities for function results."""
 
+import asyncio
 import hashlib
+import inspect
 import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
-from typing import Any, Callable
+from typing import Any, Awaitable, Callable, Optional
 
 import redis
+import redis.asyncio as aioredis
+from redis.asyncio.cluster import RedisCluster as AsyncRedisCluster
+from redis.client import NEVER_DECODE
+from redis.cluster import RedisCluster
 import fakeredis
 
+from logging_config import logger
+
+from .metrics import (
+    cache_bytes_stored,
+    cache_errors,
+    cache_lookup_latency,
+    cache_requests,
+)
+from .near_cache import NearCache
+from .payload_codec import PayloadCodec
+from .redis_scripts import RELEASE_LOCK
 from .settings import Settings
 
-__all__ = ["redis_cache", "clear_cache"]
+__all__ = [
+    "redis_cache",
+    "clear_cache",
+    "invalidate_tags",
+    "negative",
+    "uncacheable",
+]
 
 cfg = Settings()
 if cfg.use_fake_services:
-    _redis = fakeredis.FakeRedis(decode_responses=True)
+    _fake_server = fakeredis.FakeServer()
+    _redis = fakeredis.FakeRedis(server=_fake_server, decode_responses=True)
+    _aredis = fakeredis.FakeAsyncRedis(server=_fake_server, decode_responses=True)
+elif cfg.redis_cluster:
+    _redis = RedisCluster.from_url(cfg.redis_url, decode_responses=True)
+    _aredis = AsyncRedisCluster.from_url(cfg.redis_url, decode_responses=True)
 else:
     _redis = redis.Redis.from_url(cfg.redis_url, decode_responses=True)
+    _aredis = aioredis.Redis.from_url(cfg.redis_url, decode_responses=True)
+
+# Seconds between checks while another worker fills a key.
+_POLL_INTERVAL = 0.05
+# Upper bound on SCAN sweeps by ``clear_cache`` while keys keep turning up.
+_CLEAR_PASSES = 3
+# Keys or glob patterns published here are dropped from every local tier;
+# ``tag:<name>`` messages drop the local tiers of functions with that tag.
+_INVALIDATION_CHANNEL = "cache:invalidate"
+_TAG_MESSAGE = "tag:"
+
+# Local (L1) caches of every decorated function, and the pub/sub thread
+# that keeps them coherent with Redis.
+_local_caches: list[NearCache] = []
+_tagged_caches: dict[str, list[NearCache]] = {}
+_listener: Any = None
+_listener_lock = threading.Lock()
 
 
 def _make_key(prefix: str, args: tuple[Any, ...], kwargs: dict[str, Any]) -> str:
@@ -25,33 +74,574 @@ def _make_key(prefix: str, args: tuple[Any, ...], kwargs: dict[str, Any]) -> str
     return f"cache:{prefix}:{digest}"
 
 
-def redis_cache(ttl: int = 3600) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
-    """Cache the result of a function in Redis for ``ttl`` seconds."""
+def _lock_key(key: str) -> str:
+    return f"{key}:lock"
+
+
+def _tag_key(tag: str) -> str:
+    # Outside the ``cache:`` namespace so pattern clears never reset versions.
+    return f"cache_tag:{tag}"
+
+
+def _versioned_key(key: str, versions: list[Optional[str]]) -> str:
+    return key + ":v" + ".".join(v or "0" for v in versions)
+
+
+def _tag_versions(tags: tuple[str, ...]) -> list[Optional[str]]:
+    keys = [_tag_key(t) for t in tags]
+    if cfg.redis_cluster and not cfg.use_fake_services:
+        return _redis.mget_nonatomic(keys)
+    return _redis.mget(keys)
+
+
+async def _tag_versions_async(tags: tuple[str, ...]) -> list[Optional[str]]:
+    keys = [_tag_key(t) for t in tags]
+    if cfg.redis_cluster and not cfg.use_fake_services:
+        return await _aredis.mget_nonatomic(keys)
+    return await _aredis.mget(keys)
+
+
+def _ensure_listener() -> None:
+    """Subscribe to cache invalidations from other workers."""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return
+        pubsub = _redis.pubsub()
+        pubsub.subscribe(**{_INVALIDATION_CHANNEL: _on_invalidate})
+        _listener = pubsub.run_in_thread(
+            sleep_time=1.0, daemon=True, exception_handler=_on_listener_error
+        )
+
+
+def _on_invalidate(message: dict[str, Any]) -> None:
+    if message.get("type") != "message":
+        return
+    data = message["data"]
+    if data.startswith(_TAG_MESSAGE):
+        for local in _tagged_caches.get(data[len(_TAG_MESSAGE) :], []):
+            local.clear()
+        return
+    for local in _local_caches:
+        local.invalidate_matching(data)
+
+
+def _on_listener_error(exc: Exception, pubsub: Any, thread: Any) -> None:
+    # Invalidations may have been missed: drop local entries and resubscribe
+    # on the next call.
+    global _listener
+    logger.bind(error=str(exc)).warning("cache_listener_failed")
+    thread.stop()
+    pubsub.close()
+    with _listener_lock:
+        _listener = None
+    for local in _local_caches:
+        local.clear()
+
+
+def _local_cache(
+    ttl: int,
+    local_size: Optional[int],
+    local_ttl: Optional[float],
+    tags: tuple[str, ...],
+) -> Optional[NearCache]:
+    size = cfg.cache_local_size if local_size is None else local_size
+    if size <= 0:
+        return None
+    lifetime = cfg.cache_local_ttl if local_ttl is None else local_ttl
+    local = NearCache(size, min(lifetime, ttl))
+    _local_caches.append(local)
+    for tag in tags:
+        _tagged_caches.setdefault(tag, []).append(local)
+    return local
+
+
+class _Uncacheable:
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
+
+class _Negative:
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
+
+def uncacheable(value: Any) -> Any:
+    """Return ``value`` from a cached function without storing it."""
+    return _Uncacheable(value)
+
+
+def negative(value: Any) -> Any:
+    """Return a failure ``value`` that is cached only for ``negative_ttl``."""
+    return _Negative(value)
+
+
+_MISS = object()
+
+
+class _Policy:
+    """Per-decorator settings shared by the read, fill and refresh helpers."""
+
+    def __init__(
+        self,
+        prefix: str,
+        ttl: int,
+        stale_ttl: int,
+        negative_ttl: int,
+        lock_timeout: float,
+        codec: PayloadCodec,
+    ) -> None:
+        self.prefix = prefix
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.lock_timeout = lock_timeout
+        self.codec = codec
+        # Read undecoded from the ``decode_responses`` clients: an entry may
+        # have been written by a binary codec before the decorator switched.
+        self.read_options = {NEVER_DECODE: True}
+
+    def expiry(self, result: Any) -> tuple[Any, Optional[int]]:
+        """Unwrap ``result`` and return it with its Redis lifetime, if any."""
+        if isinstance(result, _Uncacheable):
+            return result.value, None
+        if isinstance(result, _Negative):
+            if not self.negative_ttl:
+                return result.value, None
+            return result.value, self.negative_ttl
+        return result, self.ttl + self.stale_ttl
+
+    def encode(self, value: Any) -> Optional[bytes | str]:
+        """Serialise ``value`` for storage, or return ``None`` if it cannot be."""
+        try:
+            payload = self.codec.dumps(value)
+        except (TypeError, ValueError, OverflowError):
+            cache_errors.labels(self.prefix, "serialize").inc()
+            return None
+        cache_bytes_stored.labels(self.prefix).inc(len(payload))
+        return payload
+
+    def decode(self, payload: bytes | str) -> Any:
+        """Deserialise a stored value, or return ``_MISS`` if it is unreadable."""
+        try:
+            return self.codec.loads(payload)
+        except Exception:  # noqa: BLE001
+            cache_errors.labels(self.prefix, "deserialize").inc()
+            return _MISS
+
+    def is_stale(self, remaining_ms: int) -> bool:
+        return 0 <= remaining_ms <= self.stale_ttl * 1000
+
+
+class _Flight:
+    """An in-process computation that concurrent callers wait on."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+_flights: dict[str, _Flight] = {}
+_flights_lock = threading.Lock()
+_async_flights: dict[str, "asyncio.Future[Any]"] = {}
+_refresh_pool: ThreadPoolExecutor | None = None
+_pending_refreshes: set["asyncio.Task[Any]"] = set()
+
+
+def _refresh_executor() -> ThreadPoolExecutor:
+    """Return the shared thread pool for stale-while-revalidate refreshes."""
+    global _refresh_pool
+    if _refresh_pool is None:
+        _refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache")
+    return _refresh_pool
+
+
+def _record(prefix: str, result: str, start: float) -> None:
+    cache_requests.labels(prefix, result).inc()
+    cache_lookup_latency.labels(prefix).observe(time.perf_counter() - start)
+
+
+def _lookup(key: str, policy: _Policy) -> tuple[Any, bool]:
+    """Return the cached value for ``key`` (or ``_MISS``) and whether it is stale."""
+    if not policy.stale_ttl:
+        cached = _redis.execute_command("GET", key, **policy.read_options)
+        stale = False
+    else:
+        with _redis.pipeline(transaction=False) as pipe:
+            pipe.execute_command("GET", key, **policy.read_options)
+            pipe.pttl(key)
+            cached, remaining = pipe.execute()
+        stale = policy.is_stale(remaining)
+    if cached is None:
+        return _MISS, False
+    return policy.decode(cached), stale
+
+
+async def _lookup_async(key: str, policy: _Policy) -> tuple[Any, bool]:
+    """Async counterpart of :func:`_lookup`."""
+    if not policy.stale_ttl:
+        cached = await _aredis.execute_command("GET", key, **policy.read_options)
+        stale = False
+    else:
+        async with _aredis.pipeline(transaction=False) as pipe:
+            pipe.execute_command("GET", key, **policy.read_options)
+            pipe.pttl(key)
+            cached, remaining = await pipe.execute()
+        stale = policy.is_stale(remaining)
+    if cached is None:
+        return _MISS, False
+    return policy.decode(cached), stale
+
+
+def _store(key: str, result: Any, policy: _Policy) -> tuple[Any, bool]:
+    value, seconds = policy.expiry(result)
+    payload = None if seconds is None else policy.encode(value)
+    if payload is None:
+        return value, False
+    try:
+        _redis.setex(key, seconds, payload)
+    except Exception:  # noqa: BLE001
+        cache_errors.labels(policy.prefix, "store").inc()
+        return value, False
+    return value, True
+
+
+async def _store_async(key: str, result: Any, policy: _Policy) -> tuple[Any, bool]:
+    value, seconds = policy.expiry(result)
+    payload = None if seconds is None else policy.encode(value)
+    if payload is None:
+        return value, False
+    try:
+        await _aredis.setex(key, seconds, payload)
+    except Exception:  # noqa: BLE001
+        cache_errors.labels(policy.prefix, "store").inc()
+        return value, False
+    return value, True
+
+
+def _fill(key: str, func: Callable[[], Any], policy: _Policy) -> tuple[Any, bool]:
+    """Compute ``func`` once across workers and store the result at ``key``.
+
+    The worker holding the Redis lock computes; the others poll for its result
+    and only compute themselves if the lock lapses without one appearing.
+    Returns the value and whether it is now cached in Redis.
+    """
+    lock = _lock_key(key)
+    token = uuid.uuid4().hex
+    timeout = policy.lock_timeout
+    try:
+        locked = _redis.set(lock, token, nx=True, px=int(timeout * 1000))
+    except Exception:  # noqa: BLE001
+        return policy.expiry(func())[0], False
+    if not locked:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            time.sleep(_POLL_INTERVAL)
+            value, _ = _lookup(key, policy)
+            if value is not _MISS:
+                return value, True
+            if not _redis.exists(lock):
+                break
+        return policy.expiry(func())[0], False
+    try:
+        return _store(key, func(), policy)
+    finally:
+        try:
+            RELEASE_LOCK(_redis, [lock], [token])
+        except Exception:  # noqa: BLE001
+            pass
+
+
+async def _fill_async(
+    key: str, func: Callable[[], Awaitable[Any]], policy: _Policy
+) -> tuple[Any, bool]:
+    """Async counterpart of :func:`_fill`."""
+    lock = _lock_key(key)
+    token = uuid.uuid4().hex
+    timeout = policy.lock_timeout
+    try:
+        locked = await _aredis.set(lock, token, nx=True, px=int(timeout * 1000))
+    except Exception:  # noqa: BLE001
+        return policy.expiry(await func())[0], False
+    if not locked:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(_POLL_INTERVAL)
+            value, _ = await _lookup_async(key, policy)
+            if value is not _MISS:
+                return value, True
+            if not await _aredis.exists(lock):
+                break
+        return policy.expiry(await func())[0], False
+    try:
+        return await _store_async(key, await func(), policy)
+    finally:
+        try:
+            await RELEASE_LOCK.call_async(_aredis, [lock], [token])
+        except Exception:  # noqa: BLE001
+            pass
+
+
+def _refresh(key: str, func: Callable[[], Any], policy: _Policy) -> None:
+    """Recompute a stale entry unless another worker is already doing so."""
+    lock = _lock_key(key)
+    token = uuid.uuid4().hex
+    try:
+        if not _redis.set(lock, token, nx=True, px=int(policy.lock_timeout * 1000)):
+            return
+        try:
+            result = func()
+            # A failed refresh keeps serving the stale value until it expires.
+            if not isinstance(result, (_Negative, _Uncacheable)):
+                _store(key, result, policy)
+        finally:
+            RELEASE_LOCK(_redis, [lock], [token])
+    except Exception as exc:  # noqa: BLE001
+        logger.bind(key=key, error=str(exc)).warning("cache_refresh_failed")
+
+
+async def _refresh_async(
+    key: str, func: Callable[[], Awaitable[Any]], policy: _Policy
+) -> None:
+    """Async counterpart of :func:`_refresh`."""
+    lock = _lock_key(key)
+    token = uuid.uuid4().hex
+    px = int(policy.lock_timeout * 1000)
+    try:
+        if not await _aredis.set(lock, token, nx=True, px=px):
+            return
+        try:
+            result = await func()
+            if not isinstance(result, (_Negative, _Uncacheable)):
+                await _store_async(key, result, policy)
+        finally:
+            await RELEASE_LOCK.call_async(_aredis, [lock], [token])
+    except Exception as exc:  # noqa: BLE001
+        logger.bind(key=key, error=str(exc)).warning("cache_refresh_failed")
+
+
+def redis_cache(
+    ttl: int = 3600,
+    *,
+    stale_ttl: int = 0,
+    negative_ttl: int = 60,
+    lock_timeout: float = 10.0,
+    local_size: Optional[int] = None,
+    local_ttl: Optional[float] = None,
+    tags: tuple[str, ...] = (),
+    codec: str = "json",
+    compress_threshold: int = 0,
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Cache the result of a function in Redis for ``ttl`` seconds.
+
+    Both plain and ``async def`` functions are supported. Concurrent misses
+    for one key are coalesced: callers in a process share a single in-flight
+    call, and across processes a Redis lock (held at most ``lock_timeout``
+    seconds) lets one worker compute while the rest wait for its result.
+
+    With ``stale_ttl`` set, entries are kept that many seconds past ``ttl``;
+    a caller hitting such a stale entry gets it immediately while one worker
+    refreshes it in the background. The wrapped function may return
+    :func:`negative` to cache a failure for ``negative_ttl`` seconds only
+    (0 disables negative caching) or :func:`uncacheable` to skip the cache.
+    Negative entries get no stale extension (so one inside the stale window
+    is served while a retry runs), and a background refresh that returns
+    either leaves the stale entry in place.
+
+    With ``local_size`` (default ``CACHE_LOCAL_SIZE``) above zero, up to that
+    many results are also kept in process for ``local_ttl`` seconds (default
+    ``CACHE_LOCAL_TTL``). Locally cached values are shared between callers
+    and must not be mutated.
+
+    ``tags`` name groups that :func:`invalidate_tags` can drop in O(1): each
+    tag has a version counter folded into the key, at the cost of one extra
+    ``MGET`` per lookup.
+
+    ``codec`` selects how values are stored (``json`` or ``msgpack``, which
+    also handles bytes and timezone-aware datetimes); with ``msgpack``, values
+    larger than ``compress_threshold`` bytes are zstd-compressed. Entries
+    written by either codec stay readable after switching.
+    """
+
+    payload_codec = PayloadCodec(
+        codec,
+        compress_threshold,
+        codec_option="codec",
+        threshold_option="compress_threshold",
+    )
 
     def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
         prefix = f"{func.__module__}.{func.__name__}"
+        policy = _Policy(
+            prefix, ttl, stale_ttl, negative_ttl, lock_timeout, payload_codec
+        )
+        local = _local_cache(ttl, local_size, local_ttl, tags)
+
+        def local_get(key: str) -> tuple[Any, Optional[int]]:
+            """Return ``(value, generation)``; ``value`` is ``_MISS`` if absent."""
+            if local is None:
+                return _MISS, None
+            _ensure_listener()
+            generation = local.generation
+            value = local.get(key)
+            return (_MISS if value is None else value), generation
+
+        def local_set(key: str, value: Any, generation: Optional[int]) -> None:
+            if local is not None and value is not None:
+                local.set(key, value, generation)
+
+        if inspect.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                start = time.perf_counter()
+                base = _make_key(prefix, args, kwargs)
+                value, generation = local_get(base)
+                if value is not _MISS:
+                    _record(prefix, "local_hit", start)
+                    return value
+                key = base
+                if tags:
+                    key = _versioned_key(base, await _tag_versions_async(tags))
+                value, stale = await _lookup_async(key, policy)
+                if value is not _MISS:
+                    _record(prefix, "stale" if stale else "hit", start)
+                    if stale:
+                        task = asyncio.create_task(
+                            _refresh_async(key, lambda: func(*args, **kwargs), policy)
+                        )
+                        _pending_refreshes.add(task)
+                        task.add_done_callback(_pending_refreshes.discard)
+                    else:
+                        local_set(base, value, generation)
+                    return value
+                _record(prefix, "miss", start)
+                flight = _async_flights.get(key)
+                if flight is not None:
+                    return await asyncio.shield(flight)
+                flight = asyncio.get_running_loop().create_future()
+                _async_flights[key] = flight
+                try:
+                    result, stored = await _fill_async(
+                        key, lambda: func(*args, **kwargs), policy
+                    )
+                except asyncio.CancelledError:
+                    flight.cancel()
+                    raise
+                except Exception as exc:
+                    flight.set_exception(exc)
+                    # Mark it retrieved so a flight without followers stays quiet.
+                    flight.exception()
+                    raise
+                else:
+                    flight.set_result(result)
+                    if stored:
+                        local_set(base, result, generation)
+                    return result
+                finally:
+                    _async_flights.pop(key, None)
+
+            return async_wrapper
 
         @wraps(func)
         def wrapper(*args: Any, **kwargs: Any) -> Any:
-            key = _make_key(prefix, args, kwargs)
-            cached = _redis.get(key)
-            if cached is not None:
-                return json.loads(cached)
-            result = func(*args, **kwargs)
+            start = time.perf_counter()
+            base = _make_key(prefix, args, kwargs)
+            value, generation = local_get(base)
+            if value is not _MISS:
+                _record(prefix, "local_hit", start)
+                return value
+            key = base
+            if tags:
+                key = _versioned_key(base, _tag_versions(tags))
+            value, stale = _lookup(key, policy)
+            if value is not _MISS:
+                _record(prefix, "stale" if stale else "hit", start)
+                if stale:
+                    _refresh_executor().submit(
+                        _refresh, key, lambda: func(*args, **kwargs), policy
+                    )
+                else:
+                    local_set(base, value, generation)
+                return value
+            _record(prefix, "miss", start)
+            with _flights_lock:
+                flight = _flights.get(key)
+                leader = flight is None
+                if flight is None:
+                    flight = _flights[key] = _Flight()
+            if not leader:
+                flight.done.wait()
+                if flight.error is not None:
+                    raise flight.error
+                return flight.result
             try:
-                _redis.setex(key, ttl, json.dumps(result))
-            except Exception:  # noqa: BLE001
-                pass
-            return result
+                flight.result, stored = _fill(
+                    key, lambda: func(*args, **kwargs), policy
+                )
+                if stored:
+                    local_set(base, flight.result, generation)
+                return flight.result
+            except BaseException as exc:
+                flight.error = exc
+                raise
+            finally:
+                with _flights_lock:
+                    _flights.pop(key, None)
+                flight.done.set()
 
         return wrapper
 
     return decorator
 
 
-def clear_cache(pattern: str = "cache:*") -> int:
-    """Delete cache keys matching ``pattern`` and return number removed."""
-    keys = _redis.keys(pattern)
-    if keys:
-        _redis.delete(*keys)
-    return len(keys)
+def clear_cache(pattern: str = "cache:*", batch_size: int = 500) -> int:
+    """Delete cache keys matching ``pattern`` and return number removed.
+
+    Keys are found with incremental ``SCAN`` and removed ``batch_size`` at a
+    time with ``UNLINK`` as the scan goes, so neither Redis nor this process
+    handles the whole keyspace at once. Keys a pass misses, such as ones
+    written meanwhile, are picked up by another, up to ``_CLEAR_PASSES``.
+    """
+    removed = 0
+    for _ in range(_CLEAR_PASSES):
+        swept = 0
+        batch: list[Any] = []
+        for key in _redis.scan_iter(match=pattern, count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                swept += _redis.unlink(*batch)
+                batch.clear()
+        if batch:
+            swept += _redis.unlink(*batch)
+        removed += swept
+        if not swept:
+            break
+    for local in _local_caches:
+        local.invalidate_matching(pattern)
+    # Other processes may hold near caches even if this one does not.
+    _redis.publish(_INVALIDATION_CHANNEL, pattern)
+    return removed
+
+
+def invalidate_tags(*tags: str) -> None:
+    """Invalidate every entry cached under any of ``tags``.
+
+    Bumping a tag's version changes the key of every entry using it, so this
+    costs one ``INCR`` per tag; orphaned entries expire with their TTL.
+    """
+    if not tags:
+        return
+    with _redis.pipeline(transaction=False) as pipe:
+        for tag in tags:
+            pipe.incr(_tag_key(tag))
+        pipe.execute()
+    for tag in tags:
+        for local in _tagged_caches.get(tag, []):
+            local.clear()
+        _redis.publish(_INVALIDATION_CHANNEL, _TAG_MESSAGE + tag)
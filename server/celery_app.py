@@ -2,6 +2,7 @@
 from __future__ import annotations
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_process_init
 
 from server.settings import Settings
 
@@ -27,8 +28,21 @@ def create_celery_app(cfg: Settings | None = None) -> Celery:
             "task": "server.tasks.refresh_tokens_task",
             "schedule": crontab(minute="*/10"),
         },
+        "sync-vectors": {
+            "task": "server.tasks.sync_vectors_task",
+            "schedule": crontab(minute="*/5"),
+        },
     }
     return celery
 
 
 celery_app = create_celery_app()
+
+
+@worker_process_init.connect
+def _warm_up_embeddings(**_: object) -> None:
+    """Load the embedding model in each worker process when enabled."""
+    if Settings().embedding_warmup:
+        from server.vector_db import warm_up_embeddings
+
+        warm_up_embeddings()
@@ -54,6 +54,7 @@ class Call(Base):
     __table_args__ = (
         Index("ix_calls_created_at", "created_at"),
         Index("ix_calls_from_number", "from_number"),
+        Index("ix_calls_updated_at", "updated_at"),
     )
 
     id = Column(Integer, primary_key=True)
@@ -65,6 +66,11 @@ class Call(Base):
     self_critique = Column(String, nullable=True)
     sentiment = Column(Float, nullable=True)
     created_at = Column(DateTime, default=lambda: datetime.now(UTC))
+    updated_at = Column(
+        DateTime,
+        default=lambda: datetime.now(UTC),
+        onupdate=lambda: datetime.now(UTC),
+    )
 
 
 class UserPreference(Base):
@@ -94,6 +100,19 @@ class APIKey(Base):
     key_hash = Column(String, nullable=False, unique=True)
 
 
+class SessionArchive(Base):
+    """Snapshot of a Redis call session taken when the call ends."""
+
+    __tablename__ = "session_archives"
+    __table_args__ = (Index("ix_session_archives_call_sid", "call_sid"),)
+
+    id = Column(Integer, primary_key=True)
+    call_sid = Column(String, nullable=False)
+    data = Column(JSON, default=dict)
+    history = Column(JSON, default=list)
+    ended_at = Column(DateTime, default=lambda: datetime.now(UTC))
+
+
 async def init_db_async() -> None:
     """Create database tables if they do not exist."""
     _ensure_engine()
@@ -134,8 +153,8 @@ async def save_call_summary_async(
     summary: str,
     self_critique: str | None = None,
     sentiment: float | None = None,
-) -> None:
-    """Persist a completed call with summary to the database."""
+) -> datetime:
+    """Persist a completed call with summary and return its ``created_at``."""
     async with get_session_async() as session:
         call = Call(
             call_sid=call_sid,
@@ -148,11 +167,26 @@ async def save_call_summary_async(
         )
         session.add(call)
         await session.commit()
+        return call.created_at
 
 
-def save_call_summary(*args: Any, **kwargs: Any) -> None:
+def save_call_summary(*args: Any, **kwargs: Any) -> datetime:
     """Synchronous wrapper for ``save_call_summary_async``."""
-    asyncio.run(save_call_summary_async(*args, **kwargs))
+    return asyncio.run(save_call_summary_async(*args, **kwargs))
+
+
+async def archive_session_async(
+    call_sid: str, data: dict[str, Any], history: list[dict[str, str]]
+) -> None:
+    """Persist the final state of a call session."""
+    async with get_session_async() as session:
+        session.add(SessionArchive(call_sid=call_sid, data=data, history=history))
+        await session.commit()
+
+
+def archive_session(*args: Any, **kwargs: Any) -> None:
+    """Synchronous wrapper for ``archive_session_async``."""
+    asyncio.run(archive_session_async(*args, **kwargs))
 
 
 async def create_user_async(username: str, password: str, role: str = "user") -> None:
@@ -0,0 +1,114 @@
+"""Persistent SQLite cache of text embeddings keyed by model and content."""
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+from array import array
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+from chromadb.api.types import EmbeddingFunction, Embeddings
+
+__all__ = ["EmbeddingCache", "CachedEmbeddingFunction", "text_digest"]
+
+
+def text_digest(text: str) -> str:
+    """Return the cache key for ``text``."""
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class EmbeddingCache:
+    """Store vectors in SQLite under ``(model, sha256(text))``.
+
+    Vectors are kept as float32 blobs. The database runs in WAL mode so
+    several worker processes can share one file.
+    """
+
+    def __init__(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, digest TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, digest))"
+            )
+
+    def get_many(self, model: str, digests: Sequence[str]) -> Dict[str, List[float]]:
+        """Return cached vectors for the given text digests."""
+        unique = list(set(digests))
+        found: Dict[str, List[float]] = {}
+        # Stay well below SQLite's bound-parameter limit.
+        for start in range(0, len(unique), 500):
+            chunk = unique[start : start + 500]
+            marks = ",".join("?" * len(chunk))
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT digest, vector FROM embeddings "
+                    f"WHERE model = ? AND digest IN ({marks})",
+                    [model, *chunk],
+                ).fetchall()
+            for digest, blob in rows:
+                found[digest] = array("f", blob).tolist()
+        return found
+
+    def put_many(
+        self,
+        model: str,
+        digests: Sequence[str],
+        vectors: Sequence[Sequence[float]],
+    ) -> None:
+        """Store ``vectors`` under the matching text digests."""
+        rows = [(model, d, array("f", v).tobytes()) for d, v in zip(digests, vectors)]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, digest, vector) "
+                "VALUES (?, ?, ?)",
+                rows,
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddingFunction(EmbeddingFunction):
+    """Embed through ``cache``, calling ``inner`` only for unseen texts."""
+
+    def __init__(
+        self, inner: EmbeddingFunction, cache: EmbeddingCache, model: str
+    ) -> None:
+        self.inner = inner
+        self.cache = cache
+        self.model = model
+
+    def __call__(self, texts: Sequence[str]) -> Embeddings:
+        digests = [text_digest(t) for t in texts]
+        found = self.cache.get_many(self.model, digests)
+        missing: Dict[str, str] = {}
+        for text, digest in zip(texts, digests):
+            if digest not in found:
+                missing.setdefault(digest, text)
+        if missing:
+            vectors = [list(v) for v in self.inner(list(missing.values()))]
+            fresh = [(d, v) for d, v in zip(missing, vectors) if _is_real(v)]
+            if fresh:
+                self.cache.put_many(
+                    self.model, [d for d, _ in fresh], [v for _, v in fresh]
+                )
+            found.update(zip(missing, vectors))
+        return [found[d] for d in digests]
+
+
+def _is_real(vector: Sequence[float]) -> bool:
+    # The embedding functions fall back to all-zero vectors when the backend
+    # is unavailable; those must not be persisted.
+    return any(vector)
@@ -27,24 +27,38 @@ def contains_keyword(text: str, keywords: Iterable[str] = ESCALATION_KEYWORDS) -
 def check_and_flag(state_manager: "StateManager", call_sid: str, text: str) -> bool:
     """Update session state if escalation is requested."""
     if contains_keyword(text, ESCALATION_KEYWORDS):
-        state_manager.update_session(call_sid, escalation_required="true")
-        summarize_conversation(state_manager, call_sid)
+        # Only the request that flips the flag pays for the summary.
+        if state_manager.flag_escalation(call_sid):
+            summarize_conversation(state_manager, call_sid)
         return True
     return False
 
 
-def summarize_conversation(
-    state_manager: "StateManager", call_sid: str, max_words: int = 50
-) -> str:
-    """Generate and persist a summary of the call history."""
-    history = state_manager.get_history(call_sid)
-    text = " ".join(entry.get("text", "") for entry in history)
+def _summarize(text: str, max_words: int) -> str:
     # ``summarize_text`` is a Celery task; ``.run`` executes the underlying
     # function synchronously.
     try:
-        summary = summarize_text.run(text, max_words=max_words)
+        return summarize_text.run(text, max_words=max_words)
     except AttributeError:  # pragma: no cover - fallback if not a task
-        summary = summarize_text(text, max_words=max_words)
+        return summarize_text(text, max_words=max_words)
+
+
+def roll_summary(
+    previous: str, entries: Iterable[dict[str, str]], max_words: int = 150
+) -> str:
+    """Fold ``entries`` into the running summary ``previous``."""
+    turns = " ".join(entry.get("text", "") for entry in entries)
+    return _summarize(f"{previous} {turns}".strip(), max_words)
+
+
+def summarize_conversation(
+    state_manager: "StateManager", call_sid: str, max_words: int = 50
+) -> str:
+    """Generate and persist a summary of the call history."""
+    window = state_manager.get_history_window(call_sid)
+    turns = " ".join(entry.get("text", "") for entry in window["turns"])
+    text = f"{window['summary']} {turns}".strip()
+    summary = _summarize(text, max_words)
     session = state_manager.get_session(call_sid)
     from_number = session.get("from")
     state_manager.set_summary(call_sid, summary, from_number=from_number)
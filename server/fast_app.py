@@ -7,7 +7,7 @@ from uuid import uuid4
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 
 from .chat import manager as chat_manager
-from .state_manager import StateManager
+from .state_manager import AsyncStateManager
 from .settings import Settings, ConfigError
 from agents.core_agent import build_core_agent, SafeFunctionCallingAgent
 
@@ -22,7 +22,7 @@ def create_app(cfg: Optional[Settings] = None) -> FastAPI:
 
     app = FastAPI(title="TEL3SIS Chat API", version="1.0")
 
-    state_manager = StateManager()
+    state_manager = AsyncStateManager()
 
     @app.websocket("/chat/ws")
     async def chat_ws(websocket: WebSocket, session_id: str | None = None) -> None:
@@ -34,7 +34,7 @@ def create_app(cfg: Optional[Settings] = None) -> FastAPI:
         """
         sid = session_id or str(uuid4())
         await chat_manager.connect(sid, websocket)
-        state_manager.create_session(sid, {})
+        await state_manager.create_session(sid, {})
 
         config_obj = build_core_agent(state_manager, sid)
         agent = SafeFunctionCallingAgent(
@@ -45,11 +45,11 @@ def create_app(cfg: Optional[Settings] = None) -> FastAPI:
         try:
             while True:
                 text = await websocket.receive_text()
-                state_manager.append_history(sid, "user", text)
+                await state_manager.append_history(sid, "user", text)
                 async for resp in agent.generate_response(text, sid):
                     if hasattr(resp.message, "text"):
                         msg_text = getattr(resp.message, "text")
-                        state_manager.append_history(sid, "assistant", msg_text)
+                        await state_manager.append_history(sid, "assistant", msg_text)
                         await chat_manager.send_text(sid, msg_text)
         except WebSocketDisconnect:
             chat_manager.disconnect(sid)
@@ -28,6 +28,14 @@ __all__ = [
     "record_call_metrics",
     "record_conversation_metrics",
     "record_business_metrics",
+    # Function cache metrics
+    "cache_requests",
+    "cache_errors",
+    "cache_bytes_stored",
+    "cache_lookup_latency",
+    "cache_hit_ratios",
+    # Vector store metrics
+    "vector_writes",
 ]
 
 http_requests_total = Counter(
@@ -109,6 +117,65 @@ system_health = Gauge(
     ["component"],
 )
 
+# Function cache (``server.cache.redis_cache``) metrics, labelled by the
+# cached function's prefix (``module.function``).
+cache_requests = Counter(
+    "tel3sis_cache_requests_total",
+    "Cached function lookups by result (local_hit, hit, stale, miss)",
+    ["prefix", "result"],
+)
+
+cache_errors = Counter(
+    "tel3sis_cache_errors_total",
+    "Cached values that could not be serialised or stored",
+    ["prefix", "kind"],
+)
+
+cache_bytes_stored = Counter(
+    "tel3sis_cache_bytes_stored_total",
+    "Bytes of serialised values written to the function cache",
+    ["prefix"],
+)
+
+cache_lookup_latency = Histogram(
+    "tel3sis_cache_lookup_seconds",
+    "Time to resolve a cache lookup to a hit or a miss",
+    ["prefix"],
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+
+
+# Texts passed to ``VectorDB.add_texts`` by outcome: ``added``/``updated``
+# were embedded and written, ``unchanged`` and ``duplicate`` were skipped.
+vector_writes = Counter(
+    "tel3sis_vector_writes_total",
+    "Texts written to the vector store by outcome",
+    ["collection", "result"],
+)
+
+
+def cache_hit_ratios() -> Dict[str, Dict[str, float]]:
+    """Summarise ``cache_requests`` per prefix for this process.
+
+    Stale serves count as hits since the caller did not wait for upstream.
+    """
+    counts: Dict[str, Dict[str, float]] = {}
+    for metric in cache_requests.collect():
+        for sample in metric.samples:
+            if not sample.name.endswith("_total"):
+                continue
+            row = counts.setdefault(sample.labels["prefix"], {})
+            row[sample.labels["result"]] = sample.value
+    summary: Dict[str, Dict[str, float]] = {}
+    for prefix, row in counts.items():
+        hits = row.get("local_hit", 0) + row.get("hit", 0) + row.get("stale", 0)
+        total = hits + row.get("miss", 0)
+        summary[prefix] = {
+            **{k: row.get(k, 0) for k in ("local_hit", "hit", "stale", "miss")},
+            "hit_ratio": hits / total if total else 0.0,
+        }
+    return summary
+
 
 @contextmanager
 def record_external_api(api: str, user_type: str = "unknown"):
@@ -0,0 +1,72 @@
+"""Process-local LRU cache with a TTL bound for hot Redis reads."""
+from __future__ import annotations
+
+import fnmatch
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+__all__ = ["NearCache"]
+
+
+class NearCache:
+    """Thread-safe LRU mapping whose entries also expire after ``ttl`` seconds.
+
+    ``generation`` is bumped on every invalidation. Read-through callers
+    capture it before fetching from Redis and pass it to :meth:`set`, so a
+    value read before a concurrent invalidation is never stored.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for ``key`` or ``None`` on a miss."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, generation: Optional[int] = None) -> bool:
+        """Store ``value`` unless an invalidation happened since ``generation``."""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return False
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return True
+
+    def invalidate(self, key: str) -> None:
+        """Drop ``key`` from the cache."""
+        with self._lock:
+            self.generation += 1
+            self._data.pop(key, None)
+
+    def invalidate_matching(self, pattern: str) -> None:
+        """Drop every key matching the glob ``pattern``."""
+        with self._lock:
+            self.generation += 1
+            for key in fnmatch.filter(list(self._data), pattern):
+                del self._data[key]
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
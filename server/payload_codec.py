@@ -0,0 +1,86 @@
+"""Serialisation for conversation payloads stored in Redis."""
+from __future__ import annotations
+
+import json
+from typing import Any
+
+from .settings import ConfigError
+
+try:  # pragma: no cover - optional dependency
+    import msgpack
+except Exception:  # pragma: no cover - msgpack may not be installed
+    msgpack = None
+
+try:  # pragma: no cover - optional dependency
+    import zstandard
+except Exception:  # pragma: no cover - zstandard may not be installed
+    zstandard = None
+
+__all__ = ["PayloadCodec"]
+
+# Leading marker bytes. JSON text never starts with a control byte, so
+# values written before a codec was configured stay readable.
+MSGPACK = b"\x01"
+MSGPACK_ZSTD = b"\x02"
+
+
+class PayloadCodec:
+    """Encode values as JSON or msgpack, compressing large ones with zstd.
+
+    msgpack also round-trips ``bytes`` and timezone-aware datetimes.
+
+    ``loads`` accepts any format regardless of the configured one, so the
+    codec can be switched without migrating stored data.
+
+    ``codec_option`` and ``threshold_option`` name the setting or argument
+    the values came from, for configuration errors.
+    """
+
+    def __init__(
+        self,
+        name: str = "json",
+        compress_threshold: int = 0,
+        *,
+        codec_option: str = "STATE_CODEC",
+        threshold_option: str = "STATE_COMPRESS_THRESHOLD",
+    ) -> None:
+        self.name = name.lower()
+        if self.name not in {"json", "msgpack"}:
+            raise ConfigError(f"Unknown {codec_option}: {name}")
+        if self.name == "msgpack" and msgpack is None:
+            raise ConfigError(f"{codec_option}=msgpack requires the msgpack package")
+        if compress_threshold and self.name != "msgpack":
+            raise ConfigError(f"{threshold_option} requires {codec_option}=msgpack")
+        if compress_threshold and zstandard is None:
+            raise ConfigError(f"{threshold_option} requires the zstandard package")
+        self.compress_threshold = compress_threshold
+        self._compressor = zstandard.ZstdCompressor() if compress_threshold else None
+        self._decompressor = zstandard.ZstdDecompressor() if zstandard else None
+
+    def dumps(self, value: Any) -> bytes | str:
+        """Serialise ``value`` with the configured codec."""
+        if self.name == "json":
+            return json.dumps(value)
+        packed = msgpack.packb(value, use_bin_type=True, datetime=True)
+        if self._compressor is not None and len(packed) > self.compress_threshold:
+            return MSGPACK_ZSTD + self._compressor.compress(packed)
+        return MSGPACK + packed
+
+    def loads(self, raw: bytes | str) -> Any:
+        """Deserialise a value written by any codec."""
+        if isinstance(raw, str):
+            return json.loads(raw)
+        marker, body = raw[:1], raw[1:]
+        if marker == MSGPACK:
+            return self._unpack(body)
+        if marker == MSGPACK_ZSTD:
+            if self._decompressor is None:
+                raise ConfigError("zstandard is required to read compressed payloads")
+            return self._unpack(self._decompressor.decompress(body))
+        return json.loads(raw)
+
+    @staticmethod
+    def _unpack(body: bytes) -> Any:
+        if msgpack is None:
+            raise ConfigError("msgpack is required to read msgpack-encoded payloads")
+        return msgpack.unpackb(body, raw=False, timestamp=3)
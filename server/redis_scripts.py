@@ -0,0 +1,158 @@
+"""Lua scripts for atomic session operations, invoked with ``EVALSHA``."""
+from __future__ import annotations
+
+import hashlib
+from typing import Any, Sequence
+
+from redis.exceptions import NoScriptError
+
+__all__ = [
+    "LuaScript",
+    "GET_AND_DELETE",
+    "APPEND_TRIM",
+    "FLAG_ESCALATION",
+    "RELEASE_LOCK",
+    "HSET_IF_EXISTS",
+    "COMMIT_COMPACTION",
+]
+
+
+class LuaScript:
+    """A script addressed by its SHA1 and loaded on the first ``NOSCRIPT``.
+
+    The digest is computed locally, so the common path is one ``EVALSHA``
+    round trip with no ``SCRIPT EXISTS`` probe.
+    """
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self.sha = hashlib.sha1(source.encode()).hexdigest()
+
+    def queue(self, pipe: Any, keys: Sequence[Any], args: Sequence[Any]) -> None:
+        """Queue the script on ``pipe``; see :meth:`__call__` for retries."""
+        pipe.evalsha(self.sha, len(keys), *keys, *args)
+
+    def __call__(self, client: Any, keys: Sequence[Any], args: Sequence[Any]) -> Any:
+        try:
+            return client.evalsha(self.sha, len(keys), *keys, *args)
+        except NoScriptError:
+            client.script_load(self.source)
+            return client.evalsha(self.sha, len(keys), *keys, *args)
+
+    async def call_async(
+        self, client: Any, keys: Sequence[Any], args: Sequence[Any]
+    ) -> Any:
+        try:
+            return await client.evalsha(self.sha, len(keys), *keys, *args)
+        except NoScriptError:
+            await client.script_load(self.source)
+            return await client.evalsha(self.sha, len(keys), *keys, *args)
+
+
+# KEYS[1] = key. Returns the old value (nil if absent) and deletes it.
+GET_AND_DELETE = LuaScript(
+    """
+local value = redis.call('GET', KEYS[1])
+if value then
+  redis.call('DEL', KEYS[1])
+end
+return value
+"""
+)
+
+# KEYS[1] = history list, KEYS[2] = session hash.
+# ARGV[1] = entry, ARGV[2] = max entries (0 = unbounded), ARGV[3] = idle TTL.
+# Returns {length, legacy hash history present, created_at}.
+APPEND_TRIM = LuaScript(
+    """
+local length = redis.call('RPUSH', KEYS[1], ARGV[1])
+local cap = tonumber(ARGV[2])
+if cap > 0 and length > cap then
+  redis.call('LTRIM', KEYS[1], -cap, -1)
+  length = cap
+end
+local ttl = tonumber(ARGV[3])
+if ttl > 0 then
+  redis.call('EXPIRE', KEYS[1], ttl)
+  redis.call('EXPIRE', KEYS[2], ttl)
+end
+return {
+  length,
+  redis.call('HEXISTS', KEYS[2], 'history'),
+  redis.call('HGET', KEYS[2], 'created_at') or false,
+}
+"""
+)
+
+# KEYS[1] = session hash. ARGV[1] = summary ('' to skip),
+# ARGV[2] = invalidation channel ('' to skip), ARGV[3] = call SID.
+# Returns 1 if this call set the flag, 0 if it was already set.
+FLAG_ESCALATION = LuaScript(
+    """
+if redis.call('HGET', KEYS[1], 'escalation_required') == 'true' then
+  return 0
+end
+redis.call('HSET', KEYS[1], 'escalation_required', 'true')
+if ARGV[1] ~= '' then
+  redis.call('HSET', KEYS[1], 'summary', ARGV[1])
+end
+if ARGV[2] ~= '' then
+  redis.call('PUBLISH', ARGV[2], ARGV[3])
+end
+return 1
+"""
+)
+
+# KEYS[1] = lock key, ARGV[1] = owner token.
+# Deletes the lock only if it is still held by this owner.
+RELEASE_LOCK = LuaScript(
+    """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+)
+
+# KEYS[1] = hash. ARGV[1] = field, ARGV[2] = value,
+# ARGV[3] = invalidation channel ('' to skip), ARGV[4] = message.
+# Sets the field only while the hash exists, so late background writes
+# cannot recreate an ended session. Returns 1 if the field was written.
+HSET_IF_EXISTS = LuaScript(
+    """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+if ARGV[3] ~= '' then
+  redis.call('PUBLISH', ARGV[3], ARGV[4])
+end
+return 1
+"""
+)
+
+# KEYS[1] = compaction lock, KEYS[2] = history list, KEYS[3] = session hash.
+# ARGV[1] = owner token, ARGV[2] = number of folded entries, ARGV[3] = first
+# and ARGV[4] = last folded entry as read, ARGV[5] = rolling summary,
+# ARGV[6] = invalidation channel ('' to skip), ARGV[7] = message.
+# Stores the summary and trims the folded entries only while the lock is
+# still ours and the head of the list is unchanged. Returns 1 if committed.
+COMMIT_COMPACTION = LuaScript(
+    """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+  return 0
+end
+local fold = tonumber(ARGV[2])
+if redis.call('LLEN', KEYS[2]) < fold
+    or redis.call('LINDEX', KEYS[2], 0) ~= ARGV[3]
+    or redis.call('LINDEX', KEYS[2], fold - 1) ~= ARGV[4] then
+  return 0
+end
+redis.call('HSET', KEYS[3], 'rolling_summary', ARGV[5])
+redis.call('LTRIM', KEYS[2], fold, -1)
+if ARGV[6] ~= '' then
+  redis.call('PUBLISH', ARGV[6], ARGV[7])
+end
+return 1
+"""
+)
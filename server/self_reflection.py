@@ -4,7 +4,7 @@ from typing import Any
 
 
 from server.settings import Settings
-from server.cache import redis_cache
+from server.cache import negative, redis_cache, uncacheable
 from logging_config import logger
 from util import call_with_retries
 
@@ -18,14 +18,14 @@ def generate_self_critique(transcript: str, *, client: Any | None = None) -> str
     api_key = Settings().openai_api_key
     if client is None:
         if not api_key:
-            return ""
+            return uncacheable("")
         try:
             from openai import OpenAI
 
             client = OpenAI(api_key=api_key)
         except Exception as exc:  # noqa: BLE001
             logger.bind(error=str(exc)).error("openai_init_failed")
-            return ""
+            return negative("")
 
     try:
         resp = call_with_retries(
@@ -49,4 +49,4 @@ def generate_self_critique(transcript: str, *, client: Any | None = None) -> str
         return resp["choices"][0]["message"]["content"].strip()
     except Exception as exc:  # noqa: BLE001
         logger.bind(error=str(exc)).error("self_reflection_failed")
-        return ""
+        return negative("")
@@ -22,15 +22,22 @@ class Settings(BaseSettings):
     sendgrid_from_email: str = ""
     notify_email: str = ""
     redis_url: str = "redis://redis:6379/0"
+    redis_cluster: bool = False
+    redis_replica_url: str = ""
+    history_read_replica: bool = False
     database_url: str = "sqlite:///tel3sis.db"
     embedding_provider: str = "sentence_transformers"
     embedding_model_name: str = "all-MiniLM-L6-v2"
     openai_embedding_model: str = "text-embedding-3-small"
+    embedding_warmup: bool = False
+    embedding_cache_path: str = ""
     openai_api_key: str = ""
     eleven_labs_api_key: str = ""
     celery_broker_url: str | None = None
     celery_result_backend: str | None = None
     token_encryption_key: str = ""
+    token_encryption_key_version: int = 1
+    token_encryption_old_keys: str = ""
     google_client_id: str = ""
     google_client_secret: str = ""
     escalation_phone_number: str = ""
@@ -47,6 +54,21 @@ class Settings(BaseSettings):
     log_rotation: str = "10 MB"
     log_file: str = "logs/tel3sis.log"
     slack_webhook_url: str = ""
+    history_backend: str = "list"
+    history_max_entries: int = 0
+    history_window: int = 0
+    rolling_summary_words: int = 150
+    state_codec: str = "json"
+    state_compress_threshold: int = 0
+    similar_summaries_timeout: float = 2.0
+    session_idle_ttl: int = 3600
+    session_max_ttl: int = 86400
+    archive_sessions: bool = True
+    session_cache_size: int = 0
+    session_cache_ttl: float = 30.0
+    cache_local_size: int = 0
+    cache_local_ttl: float = 5.0
+    token_refresh_concurrency: int = 8
     use_fake_services: bool = False
 
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
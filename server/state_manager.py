@@ -1,21 +1,116 @@
 """Manage call session data and OAuth tokens in Redis."""
 from __future__ import annotations
 
-import base64
+import asyncio
+import functools
 import json
-import os
-from typing import Any, Dict, Optional, List, Iterable, cast
+import threading
+import time
+import uuid
+import weakref
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime
+from typing import Any, AsyncIterator, Dict, Optional, List, Iterable, cast
 
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 import redis
+import redis.asyncio as aioredis
+from redis.asyncio.cluster import RedisCluster as AsyncRedisCluster
+from redis.client import NEVER_DECODE
+from redis.cluster import RedisCluster
+from redis.exceptions import NoScriptError
 import fakeredis
 
+from logging_config import logger
+
+from . import database
 from .vector_db import VectorDB
-from .settings import Settings, ConfigError
+from .near_cache import NearCache
+from .payload_codec import PayloadCodec
+from .redis_scripts import (
+    APPEND_TRIM,
+    COMMIT_COMPACTION,
+    FLAG_ESCALATION,
+    GET_AND_DELETE,
+    HSET_IF_EXISTS,
+    RELEASE_LOCK,
+)
+from .settings import ConfigError, Settings
+from .token_codec import TokenCodec, load_key, parse_key_ring
+from .vector_sync import summary_metadata
 
 
-class StateManager:
-    """Simple wrapper around Redis for call session state."""
+# Shared in-memory server so sync and async managers see the same fake data.
+_fake_server = fakeredis.FakeServer()
+_async_pools: Dict[str, aioredis.ConnectionPool] = {}
+_async_clusters: Dict[tuple[str, bool], AsyncRedisCluster] = {}
+_compaction_pool: Optional[ThreadPoolExecutor] = None
+# One pub/sub thread per Redis URL and channel feeds the near caches of every
+# sync manager in the process, so short-lived managers add no threads.
+_session_listeners: Dict[tuple[str, str], Any] = {}
+_session_caches: Dict[tuple[str, str], weakref.WeakSet[NearCache]] = {}
+_session_listener_lock = threading.Lock()
+
+
+def _compaction_executor() -> ThreadPoolExecutor:
+    """Return the shared thread pool for background history compaction."""
+    global _compaction_pool
+    if _compaction_pool is None:
+        _compaction_pool = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="history-compact"
+        )
+    return _compaction_pool
+
+
+def _session_caches_for(key: tuple[str, str]) -> List[NearCache]:
+    with _session_listener_lock:
+        return list(_session_caches.get(key, ()))
+
+
+def _on_session_invalidate(key: tuple[str, str], message: Dict[str, Any]) -> None:
+    if message.get("type") != "message":
+        return
+    for cache in _session_caches_for(key):
+        cache.invalidate(message["data"])
+
+
+def _on_session_listener_error(
+    key: tuple[str, str], exc: Exception, pubsub: Any, thread: Any
+) -> None:
+    # Invalidations may have been missed: drop everything and resubscribe
+    # on the next read.
+    logger.bind(error=str(exc)).warning("session_cache_listener_failed")
+    thread.stop()
+    pubsub.close()
+    with _session_listener_lock:
+        if _session_listeners.get(key) is thread:
+            del _session_listeners[key]
+    for cache in _session_caches_for(key):
+        cache.clear()
+
+
+def get_async_pool(url: str) -> aioredis.ConnectionPool:
+    """Return the process-wide ``redis.asyncio`` connection pool for ``url``."""
+    pool = _async_pools.get(url)
+    if pool is None:
+        pool = aioredis.ConnectionPool.from_url(url, decode_responses=True)
+        _async_pools[url] = pool
+    return pool
+
+
+def get_async_cluster(url: str, read_from_replicas: bool = False) -> AsyncRedisCluster:
+    """Return the process-wide async Redis Cluster client for ``url``."""
+    client = _async_clusters.get((url, read_from_replicas))
+    if client is None:
+        client = AsyncRedisCluster.from_url(
+            url, decode_responses=True, read_from_replicas=read_from_replicas
+        )
+        _async_clusters[(url, read_from_replicas)] = client
+    return client
+
+
+class _BaseStateManager(ABC):
+    """Configuration, key layout and encryption shared by both managers."""
 
     def __init__(
         self,
@@ -27,51 +122,260 @@ class StateManager:
         cfg = Settings()
         self.url = url or cfg.redis_url
         self.prefix = prefix
-        if cfg.use_fake_services:
-            self._redis = fakeredis.FakeRedis(decode_responses=True)
-        else:
-            self._redis = redis.Redis.from_url(self.url, decode_responses=True)
-
-        self._summary_db = summary_db or VectorDB(collection_name="summaries")
-
-        self._encryption_key = self._load_encryption_key(cfg.token_encryption_key)
-
-    def _load_encryption_key(self, key_b64: str) -> bytes:
-        """Return the AES key from ``TOKEN_ENCRYPTION_KEY`` env variable."""
-        if not key_b64:
+        self.history_backend = cfg.history_backend.lower()
+        self.history_max_entries = cfg.history_max_entries
+        self.history_window = cfg.history_window
+        self.rolling_summary_words = cfg.rolling_summary_words
+        if self.history_window and self.history_max_entries:
             raise ConfigError(
-                "Missing required environment variable: TOKEN_ENCRYPTION_KEY"
+                "HISTORY_WINDOW and HISTORY_MAX_ENTRIES cannot be combined"
             )
-        try:
-            key_bytes = base64.b64decode(key_b64)
-        except Exception as exc:  # pragma: no cover - invalid base64 rare
-            raise ConfigError("Invalid TOKEN_ENCRYPTION_KEY format") from exc
-        if len(key_bytes) != 16:
+        self.cluster = cfg.redis_cluster
+        if self.cluster and self.history_backend == "hash":
             raise ConfigError(
-                "TOKEN_ENCRYPTION_KEY must decode to 16 bytes (128-bit AES key)"
+                "HISTORY_BACKEND=hash is not supported with REDIS_CLUSTER"
             )
-        return key_bytes
+        self._redis = self._connect(cfg)
+        self._replica_client = (
+            self._connect(cfg, replica=True) if cfg.history_read_replica else None
+        )
+
+        self.similar_summaries_timeout = cfg.similar_summaries_timeout
+        self.session_idle_ttl = cfg.session_idle_ttl
+        self.session_max_ttl = cfg.session_max_ttl
+        self.archive_sessions = cfg.archive_sessions
+        self._payload = PayloadCodec(cfg.state_codec, cfg.state_compress_threshold)
+
+        # Optional per-process cache of session hashes; peers invalidate it by
+        # publishing the call SID on ``_invalidation_channel()``.
+        self._near_cache: Optional[NearCache] = None
+        if cfg.session_cache_size > 0:
+            self._near_cache = NearCache(cfg.session_cache_size, cfg.session_cache_ttl)
+        self._listener: Any = None
+
+        self._summary_db = summary_db or VectorDB(collection_name="summaries")
+
+        self._codec = TokenCodec(
+            load_key(cfg.token_encryption_key),
+            cfg.token_encryption_key_version,
+            parse_key_ring(cfg.token_encryption_old_keys),
+        )
+
+    @abstractmethod
+    def _connect(self, cfg: Settings, replica: bool = False) -> Any:
+        """Return the Redis client (or replica client) for this manager."""
+
+    @property
+    def _replica(self) -> Any:
+        """Client for history reads that tolerate replication lag."""
+        return self._replica_client or self._redis
+
+    def _tag(self, call_sid: str) -> str:
+        # In cluster mode the braces pin a call's keys to one hash slot so
+        # per-call pipelines never span nodes.
+        return f"{{{call_sid}}}" if self.cluster else call_sid
+
+    def _mget(self, keys: List[str]) -> Any:
+        if self.cluster:
+            return self._redis.mget_nonatomic(keys)
+        return self._redis.mget(keys)
+
+    @staticmethod
+    def _raw(client: Any, *args: Any) -> Any:
+        """Run a command returning undecoded bytes, for binary payloads."""
+        return client.execute_command(*args, **{NEVER_DECODE: True})
 
     def _key(self, call_sid: str) -> str:
-        return f"{self.prefix}:{call_sid}"
+        return f"{self.prefix}:{self._tag(call_sid)}"
+
+    def _index_key(self) -> str:
+        return f"{self.prefix}_active"
+
+    def _invalidation_channel(self) -> str:
+        return f"{self.prefix}_invalidate"
+
+    def _history_key(self, call_sid: str) -> str:
+        return f"history:{self._tag(call_sid)}"
+
+    def _compact_lock_key(self, call_sid: str) -> str:
+        return f"history_compact:{self._tag(call_sid)}"
+
+    def _needs_compaction(self, length: int) -> bool:
+        # Compact once the list reaches twice the window so it stays between
+        # N and 2N entries and summarisation runs once every N turns.
+        return bool(self.history_window) and length >= 2 * self.history_window
 
     def _token_key(self, user_id: str) -> str:
         return f"token:{user_id}"
 
+    def _token_expiry_key(self) -> str:
+        return "token_expiry"
+
+    def _token_backfill_key(self) -> str:
+        # Set once every pre-index token has been indexed. The index itself
+        # can exist earlier because set_token adds to it.
+        return "token_expiry:backfilled"
+
+    def _queue_set_token(self, pipe: Any, user_id: str, data: Dict[str, Any]) -> None:
+        """Queue the encrypted token write and its expiry-index update."""
+        pipe.set(self._token_key(user_id), self._encrypt(json.dumps(data)))
+        if data.get("expires_at"):
+            pipe.zadd(self._token_expiry_key(), {user_id: int(data["expires_at"])})
+        else:
+            pipe.zrem(self._token_expiry_key(), user_id)
+
+    def _token_page(self, keys: List[Any]) -> List[str]:
+        """Return the user IDs for a page of scanned token keys."""
+        return [
+            (key.decode() if isinstance(key, bytes) else key).split(":", 1)[1]
+            for key in keys
+        ]
+
+    def _decode_tokens(
+        self, user_ids: List[str], blobs: List[Any]
+    ) -> List[tuple[str, Dict[str, str]]]:
+        """Decrypt an ``MGET`` page, skipping keys that vanished meanwhile."""
+        return [
+            (user_id, cast(Dict[str, str], json.loads(self._decrypt(blob))))
+            for user_id, blob in zip(user_ids, blobs)
+            if blob
+        ]
+
     def _oauth_key(self, state: str) -> str:
         return f"oauth:{state}"
 
-    def _encrypt(self, data: str) -> str:
-        aesgcm = AESGCM(self._encryption_key)
-        nonce = os.urandom(12)
-        ciphertext = aesgcm.encrypt(nonce, data.encode(), None)
-        return base64.b64encode(nonce + ciphertext).decode()
+    def _encrypt(self, data: str) -> bytes | str:
+        # Raw envelopes only round-trip when the client returns bytes.
+        binary = not self._redis.get_connection_kwargs().get("decode_responses")
+        return self._codec.encrypt(data, binary=binary)
+
+    def _decrypt(self, blob: bytes | str) -> str:
+        return self._codec.decrypt(blob)
+
+    def _queue_touch(self, pipe: Any, call_sid: str) -> None:
+        """Queue TTL and activity-index updates; the last result is ``created_at``."""
+        if self.session_idle_ttl:
+            pipe.expire(self._key(call_sid), self.session_idle_ttl)
+            pipe.expire(self._history_key(call_sid), self.session_idle_ttl)
+        pipe.zadd(self._index_key(), {call_sid: time.time()})
+        pipe.hget(self._key(call_sid), "created_at")
+
+    def _queue_invalidate(self, pipe: Any, call_sid: str) -> None:
+        """Queue a near-cache invalidation for other workers."""
+        if self._near_cache is not None:
+            pipe.publish(self._invalidation_channel(), call_sid)
+
+    def _invalidate_local(self, call_sid: str) -> None:
+        if self._near_cache is not None:
+            self._near_cache.invalidate(call_sid)
+
+    def _on_invalidate(self, message: Dict[str, Any]) -> None:
+        """Handle a pub/sub invalidation published by any worker."""
+        if self._near_cache is not None and message.get("type") == "message":
+            self._near_cache.invalidate(message["data"])
+
+    def _append_trim_args(
+        self, call_sid: str, entry: Dict[str, str], max_entries: int
+    ) -> tuple[list[str], list[Any]]:
+        keys = [self._history_key(call_sid), self._key(call_sid)]
+        args = [self._payload.dumps(entry), max_entries, self.session_idle_ttl]
+        return keys, args
+
+    def _flag_escalation_args(
+        self, call_sid: str, summary: Optional[str]
+    ) -> tuple[list[str], list[Any]]:
+        channel = self._invalidation_channel() if self._near_cache is not None else ""
+        return [self._key(call_sid)], [summary or "", channel, call_sid]
+
+    def _similar_summaries_args(
+        self, call_sid: str, sims: List[str]
+    ) -> tuple[list[str], list[Any]]:
+        channel = self._invalidation_channel() if self._near_cache is not None else ""
+        return [self._key(call_sid)], [
+            "similar_summaries",
+            json.dumps(sims),
+            channel,
+            call_sid,
+        ]
+
+    def _compaction_args(
+        self, call_sid: str, owner: str, folded: List[Any], summary: str
+    ) -> tuple[list[str], list[Any]]:
+        channel = self._invalidation_channel() if self._near_cache is not None else ""
+        keys = [
+            self._compact_lock_key(call_sid),
+            self._history_key(call_sid),
+            self._key(call_sid),
+        ]
+        return keys, [
+            owner,
+            len(folded),
+            folded[0],
+            folded[-1],
+            summary,
+            channel,
+            call_sid,
+        ]
+
+    @staticmethod
+    def _summary_metadatas(
+        from_number: str | None,
+        created_at: Optional[datetime],
+        started: Optional[str],
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Return vector metadata for a summary, dated like ``sync_vectors``."""
+        if not from_number:
+            return None
+        if created_at is None and started:
+            created_at = datetime.fromtimestamp(int(float(started)), UTC)
+        return [summary_metadata(from_number, created_at)]
+
+    def _active_cutoff(self, within: Optional[int] = None) -> float | str:
+        """Return the oldest activity score still considered active.
+
+        Without an idle TTL, ``SESSION_MAX_TTL`` bounds how long a session can
+        outlive its last activity, so the index is still trimmed.
+        """
+        window = within or self.session_idle_ttl or self.session_max_ttl
+        return time.time() - window if window else "-inf"
+
+    def _live_sessions(
+        self, rows: list[tuple[str, float]], alive: list[Any]
+    ) -> tuple[list[tuple[str, float]], list[str]]:
+        """Split index rows into live ones and members whose hash expired."""
+        gone = [sid for (sid, _), ok in zip(rows, alive) if not ok]
+        return [row for row, ok in zip(rows, alive) if ok], gone
+
+    def _deadline(self, created_at: Optional[str]) -> Optional[int]:
+        """Return the absolute expiry if it comes before the idle expiry."""
+        if not self.session_max_ttl or not created_at:
+            return None
+        deadline = int(float(created_at)) + self.session_max_ttl
+        if self.session_idle_ttl and deadline > time.time() + self.session_idle_ttl:
+            return None
+        return deadline
+
+    def _slice_history(
+        self, history_json: Optional[str], start: int, end: int
+    ) -> List[Dict[str, str]]:
+        if not history_json:
+            return []
+        history = cast(List[Dict[str, str]], json.loads(history_json))
+        return history[start : None if end == -1 else end + 1]
 
-    def _decrypt(self, blob: str) -> str:
-        raw = base64.b64decode(blob)
-        nonce, ciphertext = raw[:12], raw[12:]
-        aesgcm = AESGCM(self._encryption_key)
-        return aesgcm.decrypt(nonce, ciphertext, None).decode()
+
+class StateManager(_BaseStateManager):
+    """Simple wrapper around Redis for call session state."""
+
+    def _connect(self, cfg: Settings, replica: bool = False) -> redis.Redis:
+        if cfg.use_fake_services:
+            return fakeredis.FakeRedis(server=_fake_server, decode_responses=True)
+        if self.cluster:
+            return RedisCluster.from_url(
+                self.url, decode_responses=True, read_from_replicas=replica
+            )
+        url = cfg.redis_replica_url if replica and cfg.redis_replica_url else self.url
+        return redis.Redis.from_url(url, decode_responses=True)
 
     def create_session(
         self, call_sid: str, data: Optional[Dict[str, Any]] = None
@@ -83,20 +387,95 @@ class StateManager:
         with self._redis.pipeline() as pipe:
             if data:
                 pipe.hset(key, mapping=data)
-            from_number = data.get("from")
-            if from_number:
-                sims = self._summary_db.search(
-                    "",
-                    where={"from_number": from_number},
-                    n_results=3,
-                )
-                if sims:
-                    pipe.hset(key, "similar_summaries", json.dumps(sims))
+            pipe.hsetnx(key, "created_at", int(time.time()))
+            pipe.zremrangebyscore(
+                self._index_key(), "-inf", f"({self._active_cutoff()}"
+            )
+            self._queue_invalidate(pipe, call_sid)
+            self._queue_touch(pipe, call_sid)
+            created_at = pipe.execute()[-1]
+        self._invalidate_local(call_sid)
+        self._apply_deadline(call_sid, created_at)
+
+    def touch_session(self, call_sid: str) -> None:
+        """Refresh the idle TTL of a session and its history."""
+        with self._redis.pipeline() as pipe:
+            self._queue_touch(pipe, call_sid)
+            created_at = pipe.execute()[-1]
+        self._apply_deadline(call_sid, created_at)
+
+    def _apply_deadline(self, call_sid: str, created_at: Optional[str]) -> None:
+        deadline = self._deadline(created_at)
+        if deadline is None:
+            return
+        with self._redis.pipeline(transaction=False) as pipe:
+            pipe.expireat(self._key(call_sid), deadline)
+            pipe.expireat(self._history_key(call_sid), deadline)
             pipe.execute()
 
+    def load_similar_summaries(
+        self, call_sid: str, from_number: Optional[str] = None
+    ) -> List[str]:
+        """Return the caller's most recent past summaries, looking them up once.
+
+        This is a metadata lookup, so nothing is embedded. The result is
+        stored on the session as ``similar_summaries`` so later calls are
+        served from Redis.
+        """
+        key = self._key(call_sid)
+        cached = self._redis.hget(key, "similar_summaries")
+        if cached is not None:
+            return cast(List[str], json.loads(cached))
+        from_number = from_number or self._redis.hget(key, "from")
+        if not from_number:
+            return []
+        sims = self._summary_db.caller_memory(from_number, limit=3)
+        # The session may have ended while the lookup ran; never recreate it.
+        HSET_IF_EXISTS(self._redis, *self._similar_summaries_args(call_sid, sims))
+        self._invalidate_local(call_sid)
+        return sims
+
     def get_session(self, call_sid: str) -> Dict[str, str]:
-        """Return all fields for a session."""
-        return self._redis.hgetall(self._key(call_sid))
+        """Return all fields for a session.
+
+        With ``SESSION_CACHE_SIZE`` set, hashes are served from the
+        process-local near-cache until a write invalidates them.
+        """
+        if self._near_cache is None:
+            return self._redis.hgetall(self._key(call_sid))
+        self._ensure_listener()
+        cached = self._near_cache.get(call_sid)
+        if cached is not None:
+            return dict(cached)
+        generation = self._near_cache.generation
+        session = self._redis.hgetall(self._key(call_sid))
+        if session:
+            self._near_cache.set(call_sid, dict(session), generation)
+        return session
+
+    def _ensure_listener(self) -> None:
+        """Register the near cache with the process-wide invalidation thread."""
+        key = (self.url, self._invalidation_channel())
+        if self._listener is not None and _session_listeners.get(key) is self._listener:
+            return
+        with _session_listener_lock:
+            caches = _session_caches.setdefault(key, weakref.WeakSet())
+            caches.add(cast(NearCache, self._near_cache))
+            listener = _session_listeners.get(key)
+            if listener is None:
+                pubsub = self._redis.pubsub()
+                pubsub.subscribe(
+                    **{key[1]: functools.partial(_on_session_invalidate, key)}
+                )
+                listener = pubsub.run_in_thread(
+                    sleep_time=1.0,
+                    daemon=True,
+                    exception_handler=functools.partial(
+                        _on_session_listener_error, key
+                    ),
+                )
+                _session_listeners[key] = listener
+            self._listener = listener
 
     def update_session(self, call_sid: str, **fields: Any) -> None:
         """Update fields in a session."""
@@ -104,11 +483,40 @@ class StateManager:
             return
         with self._redis.pipeline() as pipe:
             pipe.hset(self._key(call_sid), mapping=fields)
-            pipe.execute()
+            self._queue_invalidate(pipe, call_sid)
+            self._queue_touch(pipe, call_sid)
+            created_at = pipe.execute()[-1]
+        self._invalidate_local(call_sid)
+        self._apply_deadline(call_sid, created_at)
 
     def delete_session(self, call_sid: str) -> None:
         """Remove a session completely."""
-        self._redis.delete(self._key(call_sid))
+        with self._redis.pipeline() as pipe:
+            pipe.delete(self._key(call_sid), self._history_key(call_sid))
+            pipe.zrem(self._index_key(), call_sid)
+            self._queue_invalidate(pipe, call_sid)
+            pipe.execute()
+        self._invalidate_local(call_sid)
+
+    def end_session(self, call_sid: str) -> None:
+        """Archive a finished session to SQL and remove it from Redis.
+
+        If archiving fails the keys are left to expire via their TTL.
+        """
+        session = self.get_session(call_sid)
+        history = self.get_history(call_sid)
+        if not session and not history:
+            return
+        session.pop("history", None)
+        if self.archive_sessions:
+            try:
+                database.archive_session(call_sid, session, history)
+            except Exception as exc:  # noqa: BLE001
+                logger.bind(call_sid=call_sid, error=str(exc)).error(
+                    "session_archive_failed"
+                )
+                return
+        self.delete_session(call_sid)
 
     # --- Token CRUD -------------------------------------------------
 
@@ -124,35 +532,127 @@ class StateManager:
             data["refresh_token"] = refresh_token
         if expires_at is not None:
             data["expires_at"] = str(expires_at)
-        encrypted = self._encrypt(json.dumps(data))
-        self._redis.set(self._token_key(user_id), encrypted)
+        with self._redis.pipeline() as pipe:
+            self._queue_set_token(pipe, user_id, data)
+            pipe.execute()
 
     def get_token(self, user_id: str) -> Optional[Dict[str, str]]:
         blob = self._redis.get(self._token_key(user_id))
         if not blob:
             return None
         decrypted = self._decrypt(blob)
+        if self._codec.is_stale(blob):
+            self._rotate_token(user_id, blob)
         return json.loads(decrypted)
 
+    def _rotate_token(self, user_id: str, blob: Any) -> bool:
+        """Re-encrypt ``blob`` with the current key unless it changed meanwhile."""
+        key = self._token_key(user_id)
+        if self.cluster:
+            # Cluster clients cannot WATCH, so the compare is best-effort.
+            if self._redis.get(key) != blob:
+                return False
+            self._redis.set(key, self._encrypt(self._decrypt(blob)))
+            return True
+        with self._redis.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if pipe.get(key) != blob:
+                    return False
+                pipe.multi()
+                pipe.set(key, self._encrypt(self._decrypt(blob)))
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+
+    def _iter_token_pages(
+        self, batch_size: int
+    ) -> Iterable[tuple[List[str], List[Any]]]:
+        """Yield ``(user_ids, blobs)`` pages fetched with ``SCAN`` and ``MGET``."""
+        page: List[str] = []
+        for key in self._redis.scan_iter(match=self._token_key("*"), count=batch_size):
+            page.append(key)
+            if len(page) >= batch_size:
+                yield self._token_page(page), self._mget(page)
+                page = []
+        if page:
+            yield self._token_page(page), self._mget(page)
+
     def delete_token(self, user_id: str) -> None:
-        self._redis.delete(self._token_key(user_id))
+        with self._redis.pipeline() as pipe:
+            pipe.delete(self._token_key(user_id))
+            pipe.zrem(self._token_expiry_key(), user_id)
+            pipe.execute()
 
     def iter_tokens(self) -> Iterable[tuple[str, Dict[str, str]]]:
         """Yield ``(user_id, token_data)`` for all stored tokens."""
-        pattern = self._token_key("*")
-        for key in self._redis.scan_iter(match=pattern):
-            blob = self._redis.get(key)
-            if not blob:
-                continue
-            user_id = key.split(":", 1)[1]
-            data = json.loads(self._decrypt(cast(str, blob)))
-            yield user_id, cast(Dict[str, str], data)
+        for batch in self.iter_token_batches():
+            yield from batch
+
+    def iter_token_batches(
+        self, batch_size: int = 500
+    ) -> Iterable[List[tuple[str, Dict[str, str]]]]:
+        """Yield stored tokens in pages fetched with ``SCAN`` and ``MGET``."""
+        for user_ids, blobs in self._iter_token_pages(batch_size):
+            yield self._decode_tokens(user_ids, blobs)
+
+    def expiring_tokens(
+        self, before: int, batch_size: int = 500
+    ) -> List[tuple[str, Dict[str, str]]]:
+        """Return tokens whose ``expires_at`` is at or before ``before``.
+
+        Tokens written before the expiry index existed are indexed on first use.
+        """
+        index = self._token_expiry_key()
+        if not self._redis.exists(self._token_backfill_key()):
+            self.rebuild_token_index(batch_size)
+            self._redis.set(self._token_backfill_key(), int(time.time()))
+        user_ids = self._redis.zrangebyscore(index, "-inf", before)
+        tokens: List[tuple[str, Dict[str, str]]] = []
+        for i in range(0, len(user_ids), batch_size):
+            page = user_ids[i : i + batch_size]
+            blobs = self._mget([self._token_key(u) for u in page])
+            tokens.extend(self._decode_tokens(page, blobs))
+        return tokens
+
+    def rebuild_token_index(self, batch_size: int = 500) -> int:
+        """Index ``expires_at`` for every stored token and return the count."""
+        indexed = 0
+        for batch in self.iter_token_batches(batch_size):
+            scores = {
+                user_id: int(data["expires_at"])
+                for user_id, data in batch
+                if data.get("expires_at")
+            }
+            if scores:
+                self._redis.zadd(self._token_expiry_key(), scores)
+                indexed += len(scores)
+        return indexed
+
+    def reencrypt_tokens(self, batch_size: int = 500) -> int:
+        """Rewrite tokens not encrypted with the current key; return the count."""
+        rotated = 0
+        for user_ids, blobs in self._iter_token_pages(batch_size):
+            for user_id, blob in zip(user_ids, blobs):
+                if blob and self._codec.is_stale(blob):
+                    rotated += self._rotate_token(user_id, blob)
+        return rotated
 
     # --- Escalation Flags --------------------------------------------
 
-    def flag_escalation(self, call_sid: str) -> None:
-        """Mark that the call requires escalation."""
-        self.update_session(call_sid, escalation_required="true")
+    def flag_escalation(self, call_sid: str, summary: Optional[str] = None) -> bool:
+        """Mark that the call requires escalation.
+
+        The check and both writes run in one Lua script, so exactly one caller
+        sees ``True`` and ``summary`` (if given) is stored with the flag.
+        """
+        keys, args = self._flag_escalation_args(call_sid, summary)
+        flagged = bool(FLAG_ESCALATION(self._redis, keys, args))
+        if flagged:
+            self._invalidate_local(call_sid)
+            self.touch_session(call_sid)
+        return flagged
 
     def is_escalation_required(self, call_sid: str) -> bool:
         """Return ``True`` if escalation was requested for this call."""
@@ -166,22 +666,108 @@ class StateManager:
         self._redis.set(self._oauth_key(state), user_id, ex=ttl)
 
     def pop_oauth_state(self, state: str) -> Optional[str]:
-        """Return user id for state and delete the key."""
-        with self._redis.pipeline() as pipe:
-            pipe.get(self._oauth_key(state))
-            pipe.delete(self._oauth_key(state))
-            user_id, _ = pipe.execute()
+        """Return user id for state and delete the key atomically."""
+        user_id = GET_AND_DELETE(self._redis, [self._oauth_key(state)], [])
         return cast(Optional[str], user_id)
 
     def list_sessions(self) -> list[str]:
-        """Return all active session IDs."""
-        pattern = f"{self.prefix}:*"
-        return [key.split(":", 1)[1] for key in self._redis.scan_iter(match=pattern)]
+        """Return all active session IDs, most recently active first."""
+        return [sid for sid, _ in self.recent_sessions(limit=None)]
+
+    def count_sessions(self, within: Optional[int] = None) -> int:
+        """Return how many sessions were active in the last ``within`` seconds.
+
+        Defaults to the idle TTL window.
+        """
+        return int(
+            self._redis.zcount(self._index_key(), self._active_cutoff(within), "+inf")
+        )
+
+    def recent_sessions(
+        self,
+        offset: int = 0,
+        limit: Optional[int] = 20,
+        within: Optional[int] = None,
+    ) -> list[tuple[str, float]]:
+        """Return ``(session_id, last_activity)`` pairs, newest first.
+
+        Sessions whose hash has expired are skipped and dropped from the index.
+        """
+        rows = self._redis.zrevrangebyscore(
+            self._index_key(),
+            "+inf",
+            self._active_cutoff(within),
+            start=offset,
+            num=-1 if limit is None else limit,
+            withscores=True,
+        )
+        if not rows:
+            return rows
+        with self._redis.pipeline(transaction=False) as pipe:
+            for sid, _ in rows:
+                pipe.exists(self._key(sid))
+            rows, gone = self._live_sessions(rows, pipe.execute())
+        if gone:
+            self._redis.zrem(self._index_key(), *gone)
+        return rows
 
     # --- Conversation History ---------------------------------------
 
-    def append_history(self, call_sid: str, speaker: str, text: str) -> None:
-        """Append an entry to the conversation history."""
+    def append_history(
+        self,
+        call_sid: str,
+        speaker: str,
+        text: str,
+        max_entries: Optional[int] = None,
+    ) -> None:
+        """Append an entry to the conversation history.
+
+        When ``max_entries`` (default ``HISTORY_MAX_ENTRIES``) is set, only the
+        newest entries are kept.
+        """
+        entry = {"speaker": speaker, "text": text}
+        if self.history_backend == "hash":
+            self._append_history_hash(call_sid, entry)
+            return
+        if max_entries is None:
+            max_entries = self.history_max_entries
+        if max_entries:
+            self._append_history_capped(call_sid, entry, max_entries)
+            return
+        with self._redis.pipeline() as pipe:
+            pipe.rpush(self._history_key(call_sid), self._payload.dumps(entry))
+            pipe.hexists(self._key(call_sid), "history")
+            self._queue_touch(pipe, call_sid)
+            results = pipe.execute()
+        self._apply_deadline(call_sid, results[-1])
+        if results[1]:
+            self.migrate_history(call_sid)
+        if self._needs_compaction(results[0]):
+            _compaction_executor().submit(self.compact_history, call_sid)
+        # A websocket listener can subscribe to transcript lines if desired.
+
+    def _append_history_capped(
+        self, call_sid: str, entry: Dict[str, str], max_entries: int
+    ) -> None:
+        """Append and trim in one script call, pipelined with the index update."""
+        keys, args = self._append_trim_args(call_sid, entry, max_entries)
+        for attempt in range(2):
+            try:
+                with self._redis.pipeline(transaction=False) as pipe:
+                    APPEND_TRIM.queue(pipe, keys, args)
+                    pipe.zadd(self._index_key(), {call_sid: time.time()})
+                    (_, legacy, created_at), _ = pipe.execute()
+                break
+            except NoScriptError:
+                if attempt:
+                    raise
+                self._redis.script_load(APPEND_TRIM.source)
+        self._apply_deadline(call_sid, created_at)
+        if legacy:
+            self.migrate_history(call_sid)
+
+    def _append_history_hash(self, call_sid: str, entry: Dict[str, str]) -> None:
+        """Append ``entry`` to the legacy JSON blob stored in the session hash."""
         key = self._key(call_sid)
         while True:
             pipe = self._redis.pipeline()
@@ -193,30 +779,149 @@ class StateManager:
                     history = cast(List[Dict[str, str]], json.loads(history_json))
                 else:
                     history = []
-                history.append({"speaker": speaker, "text": text})
+                history.append(entry)
                 pipe.multi()
                 pipe.hset(key, "history", json.dumps(history))
+                self._queue_invalidate(pipe, call_sid)
                 pipe.execute()
                 break
             except redis.WatchError:
                 continue
             finally:
                 pipe.reset()
-        # A websocket listener can subscribe to transcript lines if desired.
+        self._invalidate_local(call_sid)
+        self.touch_session(call_sid)
 
-    def get_history(self, call_sid: str) -> List[Dict[str, str]]:
-        """Return conversation history for a call."""
+    def get_history(
+        self, call_sid: str, start: int = 0, end: int = -1
+    ) -> List[Dict[str, str]]:
+        """Return conversation history for a call.
+
+        ``start`` and ``end`` are inclusive indexes with ``LRANGE`` semantics,
+        so ``start=-10`` returns the last ten entries.
+        """
+        if self.history_backend != "hash":
+            items = self._raw(
+                self._replica, "LRANGE", self._history_key(call_sid), start, end
+            )
+            if items:
+                return [
+                    cast(Dict[str, str], self._payload.loads(item)) for item in items
+                ]
         history_json = self._redis.hget(self._key(call_sid), "history")
-        if not history_json:
-            return []
-        return cast(List[Dict[str, str]], json.loads(history_json))
+        return self._slice_history(history_json, start, end)
+
+    def get_history_window(self, call_sid: str) -> Dict[str, Any]:
+        """Return the rolling summary plus the last ``HISTORY_WINDOW`` turns.
+
+        Older turns are folded into ``summary`` by :meth:`compact_history`,
+        so the cost of this read does not grow with the call length.
+        """
+        start = -self.history_window if self.history_window else 0
+        summary = self._redis.hget(self._key(call_sid), "rolling_summary")
+        return {"summary": summary or "", "turns": self.get_history(call_sid, start)}
+
+    def compact_history(self, call_sid: str) -> bool:
+        """Fold turns older than the window into the rolling summary.
+
+        Folded turns are removed from the list. A short-lived lock keeps
+        concurrent compactions of the same call from folding twice; the
+        result is only committed if the lock is still held and the folded
+        turns are still at the head of the list.
+        """
+        # Imported lazily: escalation -> tasks -> state_manager.
+        from .escalation import roll_summary
+
+        if not self.history_window or self.history_backend == "hash":
+            return False
+        lock = self._compact_lock_key(call_sid)
+        owner = uuid.uuid4().hex
+        if not self._redis.set(lock, owner, nx=True, ex=60):
+            return False
+        try:
+            key = self._history_key(call_sid)
+            fold = int(self._redis.llen(key)) - self.history_window
+            if fold <= 0:
+                return False
+            folded = self._raw(self._redis, "LRANGE", key, 0, fold - 1)
+            entries = [self._payload.loads(item) for item in folded]
+            previous = self._redis.hget(self._key(call_sid), "rolling_summary")
+            summary = roll_summary(previous or "", entries, self.rolling_summary_words)
+            args = self._compaction_args(call_sid, owner, folded, summary)
+            if not COMMIT_COMPACTION(self._redis, *args):
+                logger.bind(call_sid=call_sid).warning("history_compaction_lost")
+                return False
+            self._invalidate_local(call_sid)
+            return True
+        except Exception as exc:  # noqa: BLE001
+            logger.bind(call_sid=call_sid, error=str(exc)).error(
+                "history_compaction_failed"
+            )
+            return False
+        finally:
+            # The lock may have expired and been taken by another worker.
+            RELEASE_LOCK(self._redis, [lock], [owner])
+
+    def history_length(self, call_sid: str) -> int:
+        """Return the number of history entries stored for a call."""
+        if self.history_backend == "hash":
+            return len(self.get_history(call_sid))
+        return int(self._replica.llen(self._history_key(call_sid)))
+
+    def migrate_history(self, call_sid: str) -> int:
+        """Move a legacy hash-stored history into the append-only list.
+
+        Legacy entries are prepended so they stay ahead of anything appended
+        since. Returns the number of migrated entries. Legacy histories predate
+        cluster support, so this is a no-op in cluster mode.
+        """
+        if self.cluster:
+            return 0
+        key = self._key(call_sid)
+        while True:
+            pipe = self._redis.pipeline()
+            try:
+                pipe.watch(key)
+                history_json = pipe.hget(key, "history")
+                if not history_json:
+                    return 0
+                history = cast(List[Dict[str, str]], json.loads(history_json))
+                pipe.multi()
+                if history:
+                    pipe.lpush(
+                        self._history_key(call_sid),
+                        *[self._payload.dumps(entry) for entry in reversed(history)],
+                    )
+                pipe.hdel(key, "history")
+                self._queue_invalidate(pipe, call_sid)
+                pipe.execute()
+                self._invalidate_local(call_sid)
+                return len(history)
+            except redis.WatchError:
+                continue
+            finally:
+                pipe.reset()
 
     def set_summary(
-        self, call_sid: str, summary: str, from_number: str | None = None
+        self,
+        call_sid: str,
+        summary: str,
+        from_number: str | None = None,
+        created_at: Optional[datetime] = None,
     ) -> None:
-        """Store a summary for later handoff and vector recall."""
-        self._redis.hset(self._key(call_sid), mapping={"summary": summary})
-        metadata = [{"from_number": from_number}] if from_number else None
+        """Store a summary for later handoff and vector recall.
+
+        ``created_at`` is the call's creation time, defaulting to when the
+        session started; reprocessing a call leaves its vector untouched.
+        """
+        with self._redis.pipeline() as pipe:
+            pipe.hset(self._key(call_sid), mapping={"summary": summary})
+            self._queue_invalidate(pipe, call_sid)
+            self._queue_touch(pipe, call_sid)
+            started = pipe.execute()[-1]
+        self._invalidate_local(call_sid)
+        self._apply_deadline(call_sid, started)
+        metadata = self._summary_metadatas(from_number, created_at, started)
         self._summary_db.add_texts(
             [summary],
             ids=[call_sid],
@@ -230,3 +935,595 @@ class StateManager:
     def get_similar_summaries(self, text: str, n_results: int = 3) -> List[str]:
         """Return summaries semantically similar to ``text``."""
         return self._summary_db.search(text, n_results=n_results)
+
+
+class AsyncStateManager(_BaseStateManager):
+    """``StateManager`` counterpart with awaitable methods over ``redis.asyncio``.
+
+    All instances for the same Redis URL share one connection pool so a single
+    worker can serve many concurrent calls without blocking the event loop.
+    Vector store lookups are synchronous and run in a worker thread.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._pending: set[asyncio.Task[Any]] = set()
+        self._lookups: Dict[str, asyncio.Task[Any]] = {}
+
+    def _connect(self, cfg: Settings, replica: bool = False) -> aioredis.Redis:
+        if cfg.use_fake_services:
+            return fakeredis.FakeAsyncRedis(server=_fake_server, decode_responses=True)
+        if self.cluster:
+            return get_async_cluster(self.url, read_from_replicas=replica)
+        url = cfg.redis_replica_url if replica and cfg.redis_replica_url else self.url
+        return aioredis.Redis(connection_pool=get_async_pool(url))
+
+    async def create_session(
+        self, call_sid: str, data: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Create a new session key with optional initial data.
+
+        Similar past summaries for the caller are looked up in a background
+        task so the webhook response is not delayed by embedding latency.
+        """
+        if data is None:
+            data = {}
+        key = self._key(call_sid)
+        async with self._redis.pipeline() as pipe:
+            if data:
+                pipe.hset(key, mapping=data)
+            pipe.hsetnx(key, "created_at", int(time.time()))
+            pipe.zremrangebyscore(
+                self._index_key(), "-inf", f"({self._active_cutoff()}"
+            )
+            self._queue_invalidate(pipe, call_sid)
+            self._queue_touch(pipe, call_sid)
+            created_at = (await pipe.execute())[-1]
+        self._invalidate_local(call_sid)
+        await self._apply_deadline(call_sid, created_at)
+        from_number = data.get("from")
+        if from_number:
+            task = self._spawn(self.load_similar_summaries(call_sid, from_number))
+            self._lookups[call_sid] = task
+            task.add_done_callback(lambda t: self._forget_lookup(call_sid, t))
+
+    def _spawn(self, coro: Any) -> asyncio.Task[Any]:
+        """Run ``coro`` in the background, keeping a reference until done."""
+        task = asyncio.create_task(coro)
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+        return task
+
+    def _forget_lookup(self, call_sid: str, task: asyncio.Task[Any]) -> None:
+        if self._lookups.get(call_sid) is task:
+            del self._lookups[call_sid]
+
+    async def load_similar_summaries(
+        self, call_sid: str, from_number: Optional[str] = None
+    ) -> List[str]:
+        """Return summaries of the caller's past calls, looking them up once.
+
+        The lookup is bounded by ``SIMILAR_SUMMARIES_TIMEOUT``; when the
+        budget is exceeded an empty list is returned and nothing is stored.
+        """
+        key = self._key(call_sid)
+        cached = await self._redis.hget(key, "similar_summaries")
+        if cached is not None:
+            return cast(List[str], json.loads(cached))
+        from_number = from_number or await self._redis.hget(key, "from")
+        if not from_number:
+            return []
+        try:
+            sims = await asyncio.wait_for(
+                asyncio.to_thread(self._summary_db.caller_memory, from_number, limit=3),
+                timeout=self.similar_summaries_timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.bind(call_sid=call_sid).warning("similar_summaries_timeout")
+            return []
+        # The session may have ended while the lookup ran; never recreate it.
+        await HSET_IF_EXISTS.call_async(
+            self._redis, *self._similar_summaries_args(call_sid, sims)
+        )
+        self._invalidate_local(call_sid)
+        return sims
+
+    async def touch_session(self, call_sid: str) -> None:
+        """Refresh the idle TTL of a session and its history."""
+        async with self._redis.pipeline() as pipe:
+            self._queue_touch(pipe, call_sid)
+            created_at = (await pipe.execute())[-1]
+        await self._apply_deadline(call_sid, created_at)
+
+    async def _apply_deadline(self, call_sid: str, created_at: Optional[str]) -> None:
+        deadline = self._deadline(created_at)
+        if deadline is None:
+            return
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.expireat(self._key(call_sid), deadline)
+            pipe.expireat(self._history_key(call_sid), deadline)
+            await pipe.execute()
+
+    async def get_session(self, call_sid: str) -> Dict[str, str]:
+        """Return all fields for a session, via the near-cache if enabled."""
+        if self._near_cache is None:
+            return await self._redis.hgetall(self._key(call_sid))
+        await self._ensure_listener()
+        cached = self._near_cache.get(call_sid)
+        if cached is not None:
+            return dict(cached)
+        generation = self._near_cache.generation
+        session = await self._redis.hgetall(self._key(call_sid))
+        if session:
+            self._near_cache.set(call_sid, dict(session), generation)
+        return session
+
+    async def _ensure_listener(self) -> None:
+        """Subscribe to invalidations from other workers in a background task."""
+        if self._listener is not None:
+            return
+        # Async cluster clients have no pub/sub; PUBLISH is broadcast to every
+        # node, so subscribing through the startup node is enough.
+        source = (
+            aioredis.Redis.from_url(self.url, decode_responses=True)
+            if self.cluster
+            else self._redis
+        )
+        pubsub = source.pubsub()
+        await pubsub.subscribe(self._invalidation_channel())
+        self._listener = asyncio.create_task(self._listen(pubsub))
+
+    async def _listen(self, pubsub: Any) -> None:
+        try:
+            async for message in pubsub.listen():
+                self._on_invalidate(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:  # noqa: BLE001
+            logger.bind(error=str(exc)).warning("session_cache_listener_failed")
+        finally:
+            # Invalidations may have been missed: drop everything and
+            # resubscribe on the next read.
+            self._listener = None
+            if self._near_cache is not None:
+                self._near_cache.clear()
+            await pubsub.aclose()
+
+    async def update_session(self, call_sid: str, **fields: Any) -> None:
+        """Update fields in a session."""
+        if not fields:
+            return
+        async with self._redis.pipeline() as pipe:
+            pipe.hset(self._key(call_sid), mapping=fields)
+            self._queue_invalidate(pipe, call_sid)
+            self._queue_touch(pipe, call_sid)
+            created_at = (await pipe.execute())[-1]
+        self._invalidate_local(call_sid)
+        await self._apply_deadline(call_sid, created_at)
+
+    async def delete_session(self, call_sid: str) -> None:
+        """Remove a session completely."""
+        async with self._redis.pipeline() as pipe:
+            pipe.delete(self._key(call_sid), self._history_key(call_sid))
+            pipe.zrem(self._index_key(), call_sid)
+            self._queue_invalidate(pipe, call_sid)
+            await pipe.execute()
+        self._invalidate_local(call_sid)
+
+    async def end_session(self, call_sid: str) -> None:
+        """Archive a finished session to SQL and remove it from Redis.
+
+        A similar-summaries lookup still running for the call is cancelled.
+        """
+        lookup = self._lookups.pop(call_sid, None)
+        if lookup is not None:
+            lookup.cancel()
+        session = await self.get_session(call_sid)
+        history = await self.get_history(call_sid)
+        if not session and not history:
+            return
+        session.pop("history", None)
+        if self.archive_sessions:
+            try:
+                await database.archive_session_async(call_sid, session, history)
+            except Exception as exc:  # noqa: BLE001
+                logger.bind(call_sid=call_sid, error=str(exc)).error(
+                    "session_archive_failed"
+                )
+                return
+        await self.delete_session(call_sid)
+
+    # --- Token CRUD -------------------------------------------------
+
+    async def set_token(
+        self,
+        user_id: str,
+        access_token: str,
+        refresh_token: Optional[str] = None,
+        expires_at: Optional[int] = None,
+    ) -> None:
+        data: Dict[str, Any] = {"access_token": access_token}
+        if refresh_token is not None:
+            data["refresh_token"] = refresh_token
+        if expires_at is not None:
+            data["expires_at"] = str(expires_at)
+        async with self._redis.pipeline() as pipe:
+            self._queue_set_token(pipe, user_id, data)
+            await pipe.execute()
+
+    async def get_token(self, user_id: str) -> Optional[Dict[str, str]]:
+        blob = await self._redis.get(self._token_key(user_id))
+        if not blob:
+            return None
+        decrypted = self._decrypt(blob)
+        if self._codec.is_stale(blob):
+            await self._rotate_token(user_id, blob)
+        return json.loads(decrypted)
+
+    async def _rotate_token(self, user_id: str, blob: Any) -> bool:
+        """Re-encrypt ``blob`` with the current key unless it changed meanwhile."""
+        key = self._token_key(user_id)
+        if self.cluster:
+            # Cluster clients cannot WATCH, so the compare is best-effort.
+            if await self._redis.get(key) != blob:
+                return False
+            await self._redis.set(key, self._encrypt(self._decrypt(blob)))
+            return True
+        async with self._redis.pipeline() as pipe:
+            try:
+                await pipe.watch(key)
+                if await pipe.get(key) != blob:
+                    return False
+                pipe.multi()
+                pipe.set(key, self._encrypt(self._decrypt(blob)))
+                await pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+
+    async def _iter_token_pages(
+        self, batch_size: int
+    ) -> AsyncIterator[tuple[List[str], List[Any]]]:
+        """Yield ``(user_ids, blobs)`` pages fetched with ``SCAN`` and ``MGET``."""
+        page: List[str] = []
+        async for key in self._redis.scan_iter(
+            match=self._token_key("*"), count=batch_size
+        ):
+            page.append(key)
+            if len(page) >= batch_size:
+                yield self._token_page(page), await self._mget(page)
+                page = []
+        if page:
+            yield self._token_page(page), await self._mget(page)
+
+    async def delete_token(self, user_id: str) -> None:
+        async with self._redis.pipeline() as pipe:
+            pipe.delete(self._token_key(user_id))
+            pipe.zrem(self._token_expiry_key(), user_id)
+            await pipe.execute()
+
+    async def iter_tokens(self) -> AsyncIterator[tuple[str, Dict[str, str]]]:
+        """Yield ``(user_id, token_data)`` for all stored tokens."""
+        async for batch in self.iter_token_batches():
+            for item in batch:
+                yield item
+
+    async def iter_token_batches(
+        self, batch_size: int = 500
+    ) -> AsyncIterator[List[tuple[str, Dict[str, str]]]]:
+        """Yield stored tokens in pages fetched with ``SCAN`` and ``MGET``."""
+        async for user_ids, blobs in self._iter_token_pages(batch_size):
+            yield self._decode_tokens(user_ids, blobs)
+
+    async def expiring_tokens(
+        self, before: int, batch_size: int = 500
+    ) -> List[tuple[str, Dict[str, str]]]:
+        """Return tokens whose ``expires_at`` is at or before ``before``."""
+        index = self._token_expiry_key()
+        if not await self._redis.exists(self._token_backfill_key()):
+            await self.rebuild_token_index(batch_size)
+            await self._redis.set(self._token_backfill_key(), int(time.time()))
+        user_ids = await self._redis.zrangebyscore(index, "-inf", before)
+        tokens: List[tuple[str, Dict[str, str]]] = []
+        for i in range(0, len(user_ids), batch_size):
+            page = user_ids[i : i + batch_size]
+            blobs = await self._mget([self._token_key(u) for u in page])
+            tokens.extend(self._decode_tokens(page, blobs))
+        return tokens
+
+    async def rebuild_token_index(self, batch_size: int = 500) -> int:
+        """Index ``expires_at`` for every stored token and return the count."""
+        indexed = 0
+        async for batch in self.iter_token_batches(batch_size):
+            scores = {
+                user_id: int(data["expires_at"])
+                for user_id, data in batch
+                if data.get("expires_at")
+            }
+            if scores:
+                await self._redis.zadd(self._token_expiry_key(), scores)
+                indexed += len(scores)
+        return indexed
+
+    async def reencrypt_tokens(self, batch_size: int = 500) -> int:
+        """Rewrite tokens not encrypted with the current key; return the count."""
+        rotated = 0
+        async for user_ids, blobs in self._iter_token_pages(batch_size):
+            for user_id, blob in zip(user_ids, blobs):
+                if blob and self._codec.is_stale(blob):
+                    rotated += await self._rotate_token(user_id, blob)
+        return rotated
+
+    # --- Escalation Flags --------------------------------------------
+
+    async def flag_escalation(
+        self, call_sid: str, summary: Optional[str] = None
+    ) -> bool:
+        """Mark that the call requires escalation; ``True`` for the first caller."""
+        keys, args = self._flag_escalation_args(call_sid, summary)
+        flagged = bool(await FLAG_ESCALATION.call_async(self._redis, keys, args))
+        if flagged:
+            self._invalidate_local(call_sid)
+            await self.touch_session(call_sid)
+        return flagged
+
+    async def is_escalation_required(self, call_sid: str) -> bool:
+        """Return ``True`` if escalation was requested for this call."""
+        value = (await self.get_session(call_sid)).get("escalation_required")
+        return str(value).lower() == "true"
+
+    # --- OAuth State -------------------------------------------------
+
+    async def set_oauth_state(self, state: str, user_id: str, ttl: int = 600) -> None:
+        """Persist temporary mapping of OAuth state to user id."""
+        await self._redis.set(self._oauth_key(state), user_id, ex=ttl)
+
+    async def pop_oauth_state(self, state: str) -> Optional[str]:
+        """Return user id for state and delete the key atomically."""
+        user_id = await GET_AND_DELETE.call_async(
+            self._redis, [self._oauth_key(state)], []
+        )
+        return cast(Optional[str], user_id)
+
+    async def list_sessions(self) -> list[str]:
+        """Return all active session IDs, most recently active first."""
+        return [sid for sid, _ in await self.recent_sessions(limit=None)]
+
+    async def count_sessions(self, within: Optional[int] = None) -> int:
+        """Return how many sessions were active in the last ``within`` seconds."""
+        return int(
+            await self._redis.zcount(
+                self._index_key(), self._active_cutoff(within), "+inf"
+            )
+        )
+
+    async def recent_sessions(
+        self,
+        offset: int = 0,
+        limit: Optional[int] = 20,
+        within: Optional[int] = None,
+    ) -> list[tuple[str, float]]:
+        """Return ``(session_id, last_activity)`` pairs, newest first."""
+        rows = await self._redis.zrevrangebyscore(
+            self._index_key(),
+            "+inf",
+            self._active_cutoff(within),
+            start=offset,
+            num=-1 if limit is None else limit,
+            withscores=True,
+        )
+        if not rows:
+            return rows
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for sid, _ in rows:
+                pipe.exists(self._key(sid))
+            rows, gone = self._live_sessions(rows, await pipe.execute())
+        if gone:
+            await self._redis.zrem(self._index_key(), *gone)
+        return rows
+
+    # --- Conversation History ---------------------------------------
+
+    async def append_history(
+        self,
+        call_sid: str,
+        speaker: str,
+        text: str,
+        max_entries: Optional[int] = None,
+    ) -> None:
+        """Append an entry to the conversation history."""
+        entry = {"speaker": speaker, "text": text}
+        if self.history_backend == "hash":
+            await self._append_history_hash(call_sid, entry)
+            return
+        if max_entries is None:
+            max_entries = self.history_max_entries
+        if max_entries:
+            await self._append_history_capped(call_sid, entry, max_entries)
+            return
+        async with self._redis.pipeline() as pipe:
+            pipe.rpush(self._history_key(call_sid), self._payload.dumps(entry))
+            pipe.hexists(self._key(call_sid), "history")
+            self._queue_touch(pipe, call_sid)
+            results = await pipe.execute()
+        await self._apply_deadline(call_sid, results[-1])
+        if results[1]:
+            await self.migrate_history(call_sid)
+        if self._needs_compaction(results[0]):
+            self._spawn(self.compact_history(call_sid))
+
+    async def _append_history_capped(
+        self, call_sid: str, entry: Dict[str, str], max_entries: int
+    ) -> None:
+        """Append and trim in one script call, pipelined with the index update."""
+        keys, args = self._append_trim_args(call_sid, entry, max_entries)
+        for attempt in range(2):
+            try:
+                async with self._redis.pipeline(transaction=False) as pipe:
+                    APPEND_TRIM.queue(pipe, keys, args)
+                    pipe.zadd(self._index_key(), {call_sid: time.time()})
+                    (_, legacy, created_at), _ = await pipe.execute()
+                break
+            except NoScriptError:
+                if attempt:
+                    raise
+                await self._redis.script_load(APPEND_TRIM.source)
+        await self._apply_deadline(call_sid, created_at)
+        if legacy:
+            await self.migrate_history(call_sid)
+
+    async def _append_history_hash(self, call_sid: str, entry: Dict[str, str]) -> None:
+        """Append ``entry`` to the legacy JSON blob stored in the session hash."""
+        key = self._key(call_sid)
+        while True:
+            async with self._redis.pipeline() as pipe:
+                try:
+                    await pipe.watch(key)
+                    history_json = await pipe.hget(key, "history")
+                    history = json.loads(history_json) if history_json else []
+                    history.append(entry)
+                    pipe.multi()
+                    pipe.hset(key, "history", json.dumps(history))
+                    self._queue_invalidate(pipe, call_sid)
+                    await pipe.execute()
+                    break
+                except redis.WatchError:
+                    continue
+        self._invalidate_local(call_sid)
+        await self.touch_session(call_sid)
+
+    async def get_history(
+        self, call_sid: str, start: int = 0, end: int = -1
+    ) -> List[Dict[str, str]]:
+        """Return conversation history for a call."""
+        if self.history_backend != "hash":
+            items = await self._raw(
+                self._replica, "LRANGE", self._history_key(call_sid), start, end
+            )
+            if items:
+                return [
+                    cast(Dict[str, str], self._payload.loads(item)) for item in items
+                ]
+        history_json = await self._redis.hget(self._key(call_sid), "history")
+        return self._slice_history(history_json, start, end)
+
+    async def get_history_window(self, call_sid: str) -> Dict[str, Any]:
+        """Return the rolling summary plus the last ``HISTORY_WINDOW`` turns."""
+        start = -self.history_window if self.history_window else 0
+        summary = await self._redis.hget(self._key(call_sid), "rolling_summary")
+        return {
+            "summary": summary or "",
+            "turns": await self.get_history(call_sid, start),
+        }
+
+    async def compact_history(self, call_sid: str) -> bool:
+        """Fold turns older than the window into the rolling summary."""
+        # Imported lazily: escalation -> tasks -> state_manager.
+        from .escalation import roll_summary
+
+        if not self.history_window or self.history_backend == "hash":
+            return False
+        lock = self._compact_lock_key(call_sid)
+        owner = uuid.uuid4().hex
+        if not await self._redis.set(lock, owner, nx=True, ex=60):
+            return False
+        try:
+            key = self._history_key(call_sid)
+            fold = int(await self._redis.llen(key)) - self.history_window
+            if fold <= 0:
+                return False
+            folded = await self._raw(self._redis, "LRANGE", key, 0, fold - 1)
+            entries = [self._payload.loads(item) for item in folded]
+            previous = await self._redis.hget(self._key(call_sid), "rolling_summary")
+            summary = await asyncio.to_thread(
+                roll_summary, previous or "", entries, self.rolling_summary_words
+            )
+            args = self._compaction_args(call_sid, owner, folded, summary)
+            if not await COMMIT_COMPACTION.call_async(self._redis, *args):
+                logger.bind(call_sid=call_sid).warning("history_compaction_lost")
+                return False
+            self._invalidate_local(call_sid)
+            return True
+        except Exception as exc:  # noqa: BLE001
+            logger.bind(call_sid=call_sid, error=str(exc)).error(
+                "history_compaction_failed"
+            )
+            return False
+        finally:
+            # The lock may have expired and been taken by another worker.
+            await RELEASE_LOCK.call_async(self._redis, [lock], [owner])
+
+    async def history_length(self, call_sid: str) -> int:
+        """Return the number of history entries stored for a call."""
+        if self.history_backend == "hash":
+            return len(await self.get_history(call_sid))
+        return int(await self._replica.llen(self._history_key(call_sid)))
+
+    async def migrate_history(self, call_sid: str) -> int:
+        """Move a legacy hash-stored history into the append-only list."""
+        if self.cluster:
+            return 0
+        key = self._key(call_sid)
+        while True:
+            async with self._redis.pipeline() as pipe:
+                try:
+                    await pipe.watch(key)
+                    history_json = await pipe.hget(key, "history")
+                    if not history_json:
+                        return 0
+                    history = cast(List[Dict[str, str]], json.loads(history_json))
+                    pipe.multi()
+                    if history:
+                        pipe.lpush(
+                            self._history_key(call_sid),
+                            *[
+                                self._payload.dumps(entry)
+                                for entry in reversed(history)
+                            ],
+                        )
+                    pipe.hdel(key, "history")
+                    self._queue_invalidate(pipe, call_sid)
+                    await pipe.execute()
+                    self._invalidate_local(call_sid)
+                    return len(history)
+                except redis.WatchError:
+                    continue
+
+    async def set_summary(
+        self,
+        call_sid: str,
+        summary: str,
+        from_number: str | None = None,
+        created_at: Optional[datetime] = None,
+    ) -> None:
+        """Store a summary for later handoff and vector recall.
+
+        ``created_at`` is the call's creation time, defaulting to when the
+        session started; reprocessing a call leaves its vector untouched.
+        """
+        async with self._redis.pipeline() as pipe:
+            pipe.hset(self._key(call_sid), mapping={"summary": summary})
+            self._queue_invalidate(pipe, call_sid)
+            self._queue_touch(pipe, call_sid)
+            started = (await pipe.execute())[-1]
+        self._invalidate_local(call_sid)
+        await self._apply_deadline(call_sid, started)
+        metadata = self._summary_metadatas(from_number, created_at, started)
+        await asyncio.to_thread(
+            self._summary_db.add_texts,
+            [summary],
+            ids=[call_sid],
+            metadatas=metadata,
+        )
+
+    async def get_summary(self, call_sid: str) -> Optional[str]:
+        """Return saved summary if available."""
+        return cast(
+            Optional[str], await self._redis.hget(self._key(call_sid), "summary")
+        )
+
+    async def get_similar_summaries(self, text: str, n_results: int = 3) -> List[str]:
+        """Return summaries semantically similar to ``text``."""
+        return await asyncio.to_thread(
+            self._summary_db.search, text, n_results=n_results
+        )
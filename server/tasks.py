@@ -7,10 +7,12 @@ from pathlib import Path
 from server.settings import Settings
 
 from datetime import datetime, timedelta, UTC
+import asyncio
 import tarfile
 import time
 import shutil
 import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from contextlib import contextmanager
 
 from .recordings import (
@@ -32,6 +34,7 @@ from tools.sentiment import analyze_sentiment
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
 from .state_manager import StateManager
+from .vector_sync import forget_calls, sync_vectors
 
 from .celery_app import celery_app
 from prometheus_client import Counter, Histogram
@@ -126,7 +129,7 @@ def transcribe_audio(
         summary = summarize_text(text)
         critique = generate_self_critique(text)
         sentiment = analyze_sentiment(text)
-        save_call_summary(
+        created_at = save_call_summary(
             call_sid,
             from_number,
             to_number,
@@ -135,11 +138,27 @@ def transcribe_audio(
             critique,
             sentiment,
         )
+        # The call row is committed; nothing below may fail the task, or a
+        # retry would save it twice.
         try:
             manager = StateManager()
-            manager.set_summary(call_sid, summary, from_number=from_number)
-        except Exception:  # noqa: BLE001 - non-critical failure
-            pass
+        except Exception as exc:  # noqa: BLE001 - non-critical failure
+            logger.bind(call_sid=call_sid, error=str(exc)).warning(
+                "state_manager_unavailable"
+            )
+            return str(path)
+        try:
+            manager.set_summary(
+                call_sid, summary, from_number=from_number, created_at=created_at
+            )
+        except Exception as exc:  # noqa: BLE001 - non-critical failure
+            logger.bind(call_sid=call_sid, error=str(exc)).warning(
+                "summary_store_failed"
+            )
+        try:
+            manager.end_session(call_sid)
+        except Exception as exc:  # noqa: BLE001 - the session TTL still applies
+            logger.bind(call_sid=call_sid, error=str(exc)).warning("session_end_failed")
         return str(path)
 
 
@@ -155,7 +174,7 @@ def cleanup_old_calls(days: int = 30) -> int:
     """Delete call records and files older than ``days`` days."""
     with monitor_task("cleanup_old_calls"):
         cutoff = datetime.now(UTC) - timedelta(days=days)
-        removed = 0
+        removed: list[str] = []
         with get_session() as session:
             old_calls = session.query(Call).filter(Call.created_at < cutoff).all()
             for call in old_calls:
@@ -164,9 +183,10 @@ def cleanup_old_calls(days: int = 30) -> int:
                 transcript.unlink(missing_ok=True)
                 audio.unlink(missing_ok=True)
                 session.delete(call)
-                removed += 1
+                removed.append(call.call_sid)
             session.commit()
-        return removed
+        forget_calls(removed)
+        return len(removed)
 
 
 @celery_app.task
@@ -246,6 +266,23 @@ def restore_data(archive_path: str) -> bool:
         return True
 
 
+def _refresh_credentials(
+    cfg: Settings, data: dict[str, str]
+) -> tuple[str | None, int | None]:
+    """Refresh one token with Google and return ``(access_token, expires_at)``."""
+    creds = Credentials(
+        data["access_token"],
+        refresh_token=data["refresh_token"],
+        token_uri="https://oauth2.googleapis.com/token",
+        client_id=cfg.google_client_id,
+        client_secret=cfg.google_client_secret,
+    )
+    creds.expiry = datetime.fromtimestamp(int(data["expires_at"]), UTC)
+    creds.refresh(Request())
+    new_exp = int(creds.expiry.timestamp()) if creds.expiry else None
+    return creds.token, new_exp
+
+
 @celery_app.task
 def refresh_tokens_task(threshold_seconds: int = 300) -> int:
     """Refresh OAuth tokens nearing expiration."""
@@ -253,30 +290,31 @@ def refresh_tokens_task(threshold_seconds: int = 300) -> int:
         cfg = Settings()
         manager = StateManager()
         now = int(datetime.now(UTC).timestamp())
+        due = [
+            (user_id, data)
+            for user_id, data in manager.expiring_tokens(now + threshold_seconds)
+            if data.get("refresh_token") and data.get("expires_at")
+        ]
+        if not due:
+            return 0
         refreshed = 0
-        for user_id, data in manager.iter_tokens():
-            expires_at = int(data.get("expires_at", 0)) if data.get("expires_at") else 0
-            refresh_token = data.get("refresh_token")
-            if not refresh_token or not expires_at:
-                continue
-            if expires_at - now > threshold_seconds:
-                continue
-            creds = Credentials(
-                data["access_token"],
-                refresh_token=refresh_token,
-                token_uri="https://oauth2.googleapis.com/token",
-                client_id=cfg.google_client_id,
-                client_secret=cfg.google_client_secret,
-            )
-            creds.expiry = datetime.fromtimestamp(expires_at, UTC)
-            try:
-                creds.refresh(Request())
-            except Exception as exc:  # pragma: no cover - network errors
-                logger.bind(user_id=user_id, error=str(exc)).warning("refresh_failed")
-                continue
-            new_exp = int(creds.expiry.timestamp()) if creds.expiry else None
-            manager.set_token(user_id, creds.token, refresh_token, new_exp)
-            refreshed += 1
+        workers = max(1, min(cfg.token_refresh_concurrency, len(due)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(_refresh_credentials, cfg, data): (user_id, data)
+                for user_id, data in due
+            }
+            for future in as_completed(futures):
+                user_id, data = futures[future]
+                try:
+                    token, new_exp = future.result()
+                except Exception as exc:  # pragma: no cover - network errors
+                    logger.bind(user_id=user_id, error=str(exc)).warning(
+                        "refresh_failed"
+                    )
+                    continue
+                manager.set_token(user_id, token, data["refresh_token"], new_exp)
+                refreshed += 1
         return refreshed
 
 
@@ -312,11 +350,20 @@ def delete_call_record(call_id: int) -> bool:
             audio = DEFAULT_OUTPUT_DIR / f"{transcript.stem}.mp3"
             transcript.unlink(missing_ok=True)
             audio.unlink(missing_ok=True)
+            call_sid = call.call_sid
             session.delete(call)
             session.commit()
+        forget_calls([call_sid])
         return True
 
 
+@celery_app.task
+def sync_vectors_task(batch_size: int = 256) -> int:
+    """Upsert call summaries changed since the last sync into the vector store."""
+    with monitor_task("sync_vectors_task"):
+        return asyncio.run(sync_vectors(batch_size))
+
+
 @celery_app.task
 def clear_cache_task(pattern: str = "cache:*") -> int:
     """Clear cached entries matching ``pattern``."""
@@ -324,3 +371,12 @@ def clear_cache_task(pattern: str = "cache:*") -> int:
 
     with monitor_task("clear_cache_task"):
         return clear_cache(pattern)
+
+
+@celery_app.task
+def invalidate_cache_tags_task(tags: list[str]) -> None:
+    """Invalidate cached entries recorded under any of ``tags``."""
+    from .cache import invalidate_tags
+
+    with monitor_task("invalidate_cache_tags_task"):
+        invalidate_tags(*tags)
@@ -0,0 +1,114 @@
+"""Versioned AES-GCM envelope used to store OAuth tokens in Redis."""
+from __future__ import annotations
+
+import base64
+import os
+from typing import Dict, Mapping, Optional
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from .settings import ConfigError
+
+__all__ = ["TokenCodec", "load_key", "parse_key_ring"]
+
+# Envelope layout: MAGIC | key version (1 byte) | 12-byte nonce | ciphertext.
+# Base64 text never contains a NUL byte, so legacy blobs are unambiguous.
+MAGIC = b"\x00"
+# Prefix marking a base64-wrapped envelope when Redis decodes responses.
+TEXT_PREFIX = "~"
+NONCE_SIZE = 12
+
+
+def load_key(key_b64: str, name: str = "TOKEN_ENCRYPTION_KEY") -> bytes:
+    """Decode ``key_b64`` and validate it as a 128-bit AES key."""
+    if not key_b64:
+        raise ConfigError(f"Missing required environment variable: {name}")
+    try:
+        key_bytes = base64.b64decode(key_b64)
+    except Exception as exc:  # pragma: no cover - invalid base64 rare
+        raise ConfigError(f"Invalid {name} format") from exc
+    if len(key_bytes) != 16:
+        raise ConfigError(f"{name} must decode to 16 bytes (128-bit AES key)")
+    return key_bytes
+
+
+def parse_key_ring(spec: str) -> Dict[int, bytes]:
+    """Parse ``"version:base64,version:base64"`` into a key ring."""
+    keys: Dict[int, bytes] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        version, _, key_b64 = item.partition(":")
+        try:
+            number = int(version)
+        except ValueError as exc:
+            raise ConfigError("Invalid TOKEN_ENCRYPTION_OLD_KEYS format") from exc
+        keys[number] = load_key(key_b64, "TOKEN_ENCRYPTION_OLD_KEYS")
+    return keys
+
+
+class TokenCodec:
+    """Encrypt token payloads with the current key and decrypt any known key.
+
+    Ciphers are built once per key. Blobs written before versioning existed
+    (base64 of ``nonce + ciphertext``) are still readable and are reported
+    as stale so callers can re-encrypt them.
+    """
+
+    def __init__(
+        self,
+        current_key: bytes,
+        version: int = 1,
+        old_keys: Optional[Mapping[int, bytes]] = None,
+    ) -> None:
+        if not 0 <= version <= 255:
+            raise ConfigError("TOKEN_ENCRYPTION_KEY_VERSION must be between 0 and 255")
+        self.version = version
+        self._ciphers: Dict[int, AESGCM] = {
+            v: AESGCM(k) for v, k in (old_keys or {}).items()
+        }
+        self._ciphers[version] = AESGCM(current_key)
+
+    def encrypt(self, data: str, *, binary: bool = False) -> bytes | str:
+        """Return an envelope for ``data``; base64 text unless ``binary``."""
+        nonce = os.urandom(NONCE_SIZE)
+        ciphertext = self._ciphers[self.version].encrypt(nonce, data.encode(), None)
+        envelope = MAGIC + bytes([self.version]) + nonce + ciphertext
+        if binary:
+            return envelope
+        return TEXT_PREFIX + base64.b64encode(envelope).decode()
+
+    def decrypt(self, blob: bytes | str) -> str:
+        """Return the plaintext stored in ``blob``."""
+        version, raw = self._unwrap(blob)
+        nonce, ciphertext = raw[:NONCE_SIZE], raw[NONCE_SIZE:]
+        if version is not None:
+            return self._cipher(version).decrypt(nonce, ciphertext, None).decode()
+        # Legacy blobs carry no key id: try the current key first.
+        error: Exception | None = None
+        for v in sorted(self._ciphers, key=lambda v: v != self.version):
+            try:
+                return self._ciphers[v].decrypt(nonce, ciphertext, None).decode()
+            except Exception as exc:  # noqa: BLE001
+                error = exc
+        raise ValueError("token blob could not be decrypted") from error
+
+    def is_stale(self, blob: bytes | str) -> bool:
+        """Return ``True`` if ``blob`` was not written with the current key."""
+        return self._unwrap(blob)[0] != self.version
+
+    def _cipher(self, version: int) -> AESGCM:
+        cipher = self._ciphers.get(version)
+        if cipher is None:
+            raise ValueError(f"unknown token key version {version}")
+        return cipher
+
+    @staticmethod
+    def _unwrap(blob: bytes | str) -> tuple[Optional[int], bytes]:
+        """Split ``blob`` into ``(key_version, nonce + ciphertext)``."""
+        if isinstance(blob, str):
+            if blob.startswith(TEXT_PREFIX):
+                blob = base64.b64decode(blob[len(TEXT_PREFIX) :])
+            else:
+                return None, base64.b64decode(blob)
+        if blob[:1] == MAGIC:
+            return blob[1], blob[2:]
+        return None, base64.b64decode(blob)
@@ -1,8 +1,19 @@
 """Wrapper around ChromaDB for semantic search storage."""
 from __future__ import annotations
 
-from typing import Iterable, List, Sequence, Optional
+import json
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Sequence, Optional, Tuple
 
+from server.embedding_cache import (
+    CachedEmbeddingFunction,
+    EmbeddingCache,
+    text_digest,
+)
+from server.metrics import vector_writes
 from server.settings import Settings
 from util import call_with_retries
 from logging_config import logger
@@ -63,8 +74,102 @@ class STEmbeddingFunction(EmbeddingFunction):
         return vectors.tolist()
 
 
+# Embedding functions keyed by ``(provider, model name)`` so each model is
+# loaded once per process and shared by every ``VectorDB``.
+_embedding_functions: Dict[Tuple[str, str], EmbeddingFunction] = {}
+_embedding_caches: Dict[str, EmbeddingCache] = {}
+_registry_lock = threading.Lock()
+
+
+def _resolve(provider: Optional[str], model_name: Optional[str]) -> Tuple[str, str]:
+    cfg = Settings()
+    provider = (provider or cfg.embedding_provider).lower()
+    if provider == "openai":
+        return provider, model_name or cfg.openai_embedding_model
+    return "sentence_transformers", model_name or cfg.embedding_model_name
+
+
+def get_embedding_function(
+    provider: Optional[str] = None, model_name: Optional[str] = None
+) -> EmbeddingFunction:
+    """Return the process-wide embedding function for ``provider``/``model_name``.
+
+    Defaults come from ``EMBEDDING_PROVIDER`` and the matching model setting.
+    With ``EMBEDDING_CACHE_PATH`` set, vectors are persisted there and each
+    distinct text is embedded once per model.
+    """
+    key = _resolve(provider, model_name)
+    with _registry_lock:
+        func = _embedding_functions.get(key)
+        if func is None:
+            provider, name = key
+            if provider == "openai":
+                func = OpenAIEmbeddingFunction(model_name=name)
+            else:
+                func = STEmbeddingFunction(model_name=name)
+            cache_path = Settings().embedding_cache_path
+            if cache_path:
+                cache = _embedding_caches.get(cache_path)
+                if cache is None:
+                    cache = _embedding_caches[cache_path] = EmbeddingCache(cache_path)
+                func = CachedEmbeddingFunction(func, cache, f"{provider}:{name}")
+            _embedding_functions[key] = func
+    return func
+
+
+def warm_up_embeddings(
+    provider: Optional[str] = None, model_name: Optional[str] = None
+) -> None:
+    """Load the embedding model now so the first query does not pay for it."""
+    key = _resolve(provider, model_name)
+    start = time.perf_counter()
+    func = get_embedding_function(*key)
+    if key[0] != "openai":
+        # One encode initialises lazy weights and kernels; OpenAI has none.
+        # The persistent cache would answer the probe after the first run.
+        if isinstance(func, CachedEmbeddingFunction):
+            func = func.inner
+        func(["warm up"])
+    logger.bind(
+        provider=key[0], model=key[1], duration=time.perf_counter() - start
+    ).info("embedding_warmup_complete")
+
+
+def clear_embedding_models() -> None:
+    """Forget every loaded embedding function and cache (mainly for tests)."""
+    with _registry_lock:
+        _embedding_functions.clear()
+        for cache in _embedding_caches.values():
+            cache.close()
+        _embedding_caches.clear()
+
+
+# Maps collection names to the Chroma collection currently serving them, so
+# :meth:`VectorDB.promote` can swap one in without a gap.
+ALIASES_FILE = "collections.json"
+
+
+def _load_aliases(path: Path) -> Dict[str, str]:
+    try:
+        return dict(json.loads(path.read_text()))
+    except (OSError, ValueError, TypeError):
+        return {}
+
+
+def _save_aliases(path: Path, aliases: Dict[str, str]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(aliases))
+    tmp.replace(path)
+
+
 class VectorDB:
-    """Wrapper around ChromaDB for semantic memory."""
+    """Wrapper around ChromaDB for semantic memory.
+
+    ``collection_name`` is resolved through the aliases file next to the
+    store on every access, so open handles follow a :meth:`promote` made by
+    any process.
+    """
 
     def __init__(
         self,
@@ -78,32 +183,157 @@ class VectorDB:
         persist_directory = persist_directory or cfg.vector_db_path
         self.client = chromadb.PersistentClient(path=persist_directory)
         if not embedding_function:
-            provider = cfg.embedding_provider
-            if provider.lower() == "openai":
-                embedding_function = OpenAIEmbeddingFunction(model_name=model_name)
-            else:
-                embedding_function = STEmbeddingFunction(model_name=model_name)
+            embedding_function = get_embedding_function(model_name=model_name)
 
-        self.collection = self.client.get_or_create_collection(
-            collection_name,
-            embedding_function=embedding_function,
+        self.embedding_function = embedding_function
+        self.name = collection_name
+        self._aliases = Path(persist_directory) / ALIASES_FILE
+        self._aliases_stamp: Optional[Tuple[int, int]] = None
+        self._collection = self._open()
+
+    def _stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = self._aliases.stat()
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _open(self) -> Any:
+        self._aliases_stamp = self._stamp()
+        target = _load_aliases(self._aliases).get(self.name, self.name)
+        return self.client.get_or_create_collection(
+            target, embedding_function=self.embedding_function
         )
 
+    @property
+    def collection(self) -> Any:
+        """The Chroma collection ``name`` currently resolves to."""
+        if self._stamp() != self._aliases_stamp:
+            self._collection = self._open()
+        return self._collection
+
+    def reset(self) -> None:
+        """Drop every vector by recreating this collection."""
+        target = self.collection.name
+        self.client.delete_collection(target)
+        self._collection = self.client.get_or_create_collection(
+            target, embedding_function=self.embedding_function
+        )
+
+    def promote(self, name: str) -> None:
+        """Make this collection serve ``name`` in place of the current one.
+
+        Used to swap a freshly built shadow collection into place. The
+        collection is moved to a generation of its own and ``name`` is
+        repointed at it in one atomic write; the replaced collection is kept
+        as ``<name>__retired`` until the next promote.
+        """
+        generation = f"{name}__{uuid.uuid4().hex[:12]}"
+        self.collection.modify(name=generation)
+        aliases = _load_aliases(self._aliases)
+        previous = aliases.get(f"{name}__retired")
+        aliases[f"{name}__retired"] = aliases.get(name, name)
+        aliases[name] = generation
+        _save_aliases(self._aliases, aliases)
+        self.name = name
+        self._collection = self._open()
+        if previous and previous not in aliases.values():
+            self._drop_if_exists(previous)
+
+    def _drop_if_exists(self, name: str) -> None:
+        try:
+            self.client.delete_collection(name)
+        except Exception:  # noqa: BLE001 - chroma raises when it is missing
+            pass
+
     def add_texts(
         self,
         texts: Iterable[str],
         ids: Optional[Iterable[str]] = None,
         *,
-        metadatas: Optional[Iterable[dict[str, str]]] = None,
-    ) -> None:
+        metadatas: Optional[Iterable[dict[str, Any]]] = None,
+    ) -> Dict[str, int]:
+        """Upsert ``texts`` and return counts of what was written.
+
+        ``ids`` default to the SHA-256 of each text, so re-adding a text
+        reuses its id. Within one call the last occurrence of an id wins;
+        earlier ones count as ``duplicate``. Texts whose stored document and
+        metadata (when given) already match count as ``unchanged`` and are
+        not re-embedded; the rest are ``added`` or ``updated``.
+        """
+        stats = {"added": 0, "updated": 0, "unchanged": 0, "duplicate": 0}
         docs = list(texts)
         if not docs:
+            return stats
+        id_list = list(ids) if ids is not None else [text_digest(d) for d in docs]
+        metas: List[Optional[dict[str, Any]]] = (
+            list(metadatas) if metadatas is not None else [None] * len(docs)
+        )
+        batch: Dict[str, Tuple[str, Optional[dict[str, Any]]]] = {}
+        for id_, doc, meta in zip(id_list, docs, metas):
+            batch.pop(id_, None)
+            batch[id_] = (doc, meta)
+        stats["duplicate"] = len(docs) - len(batch)
+
+        existing = self.collection.get(
+            ids=list(batch), include=["documents", "metadatas"]
+        )
+        stored = {
+            id_: (doc, meta or None)
+            for id_, doc, meta in zip(
+                existing.get("ids") or [],
+                existing.get("documents") or [],
+                existing.get("metadatas") or [],
+            )
+        }
+        changed = [
+            id_
+            for id_, (doc, meta) in batch.items()
+            if id_ not in stored
+            or stored[id_][0] != doc
+            or (meta is not None and stored[id_][1] != meta)
+        ]
+        stats["unchanged"] = len(batch) - len(changed)
+        stats["updated"] = sum(1 for id_ in changed if id_ in stored)
+        stats["added"] = len(changed) - stats["updated"]
+        if changed:
+            kwargs: dict[str, object] = {}
+            if metadatas is not None:
+                kwargs["metadatas"] = [batch[id_][1] for id_ in changed]
+            self.collection.upsert(
+                documents=[batch[id_][0] for id_ in changed], ids=changed, **kwargs
+            )
+        for result, count in stats.items():
+            if count:
+                vector_writes.labels(self.collection.name, result).inc(count)
+        return stats
+
+    def upsert_texts(
+        self,
+        texts: Sequence[str],
+        ids: Sequence[str],
+        *,
+        metadatas: Optional[Sequence[dict[str, Any]]] = None,
+        embeddings: Optional[Embeddings] = None,
+    ) -> None:
+        """Insert or overwrite ``texts`` under ``ids``.
+
+        ``embeddings`` may be supplied when they were computed elsewhere,
+        e.g. in a worker pool; otherwise the collection embeds the texts.
+        """
+        if not texts:
             return
-        id_list = list(ids) if ids is not None else [str(hash(doc)) for doc in docs]
         kwargs: dict[str, object] = {}
         if metadatas is not None:
             kwargs["metadatas"] = list(metadatas)
-        self.collection.add(documents=docs, ids=id_list, **kwargs)
+        if embeddings is not None:
+            kwargs["embeddings"] = list(embeddings)
+        self.collection.upsert(documents=list(texts), ids=list(ids), **kwargs)
+
+    def delete_texts(self, ids: Sequence[str]) -> None:
+        """Remove the vectors stored under ``ids``; unknown ids are ignored."""
+        if ids:
+            self.collection.delete(ids=list(ids))
 
     def search(
         self,
@@ -119,3 +349,88 @@ class VectorDB:
             query_texts=[query], n_results=n_results, **kwargs
         )
         return result.get("documents", [[]])[0]
+
+    def search_many(
+        self,
+        queries: Sequence[str],
+        n_results: int = 3,
+        *,
+        where: Optional[dict[str, Any]] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """Return the nearest records for each of ``queries``.
+
+        Distinct queries are embedded in one batch and sent as one collection
+        query. Each result list holds ``{"id", "document", "metadata",
+        "distance"}`` records, nearest first, in the order of ``queries``.
+        """
+        unique = list(dict.fromkeys(queries))
+        if not unique:
+            return []
+        kwargs: dict[str, object] = {}
+        if where is not None:
+            kwargs["where"] = where
+        result = self.collection.query(
+            query_embeddings=list(self.embedding_function(unique)),
+            n_results=n_results,
+            include=["documents", "metadatas", "distances"],
+            **kwargs,
+        )
+        columns = [
+            result.get(field) or [[] for _ in unique]
+            for field in ("ids", "documents", "metadatas", "distances")
+        ]
+        by_query = {
+            query: [
+                {
+                    "id": id_,
+                    "document": doc,
+                    "metadata": meta or {},
+                    "distance": distance,
+                }
+                for id_, doc, meta, distance in zip(ids, docs, metas, distances)
+            ]
+            for query, ids, docs, metas, distances in zip(unique, *columns)
+        }
+        return [by_query[query] for query in queries]
+
+    def get_by_metadata(
+        self,
+        where: dict[str, Any],
+        *,
+        limit: Optional[int] = None,
+        order_by: Optional[str] = None,
+        descending: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """Return stored records matching ``where`` without embedding anything.
+
+        Each record is ``{"id", "document", "metadata"}``. Chroma cannot sort,
+        so with ``order_by`` every match is fetched and sorted on that
+        metadata field (records lacking it sort last) before ``limit`` is
+        applied.
+        """
+        kwargs: dict[str, object] = {"where": where}
+        if limit is not None and order_by is None:
+            kwargs["limit"] = limit
+        result = self.collection.get(include=["documents", "metadatas"], **kwargs)
+        records = [
+            {"id": id_, "document": doc, "metadata": meta or {}}
+            for id_, doc, meta in zip(
+                result.get("ids") or [],
+                result.get("documents") or [],
+                result.get("metadatas") or [],
+            )
+        ]
+        if order_by is not None:
+            missing = float("-inf") if descending else float("inf")
+            records.sort(
+                key=lambda r: r["metadata"].get(order_by, missing),
+                reverse=descending,
+            )
+        return records[:limit] if limit is not None else records
+
+    def caller_memory(self, from_number: str, limit: int = 3) -> List[str]:
+        """Return the caller's most recent stored summaries, newest first."""
+        records = self.get_by_metadata(
+            {"from_number": from_number}, limit=limit, order_by="created_at"
+        )
+        return [r["document"] for r in records]
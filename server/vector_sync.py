@@ -0,0 +1,147 @@
+"""Keep the summaries vector collection in step with the ``calls`` table.
+
+:func:`sync_vectors` embeds summaries of calls created or changed since
+the previous run, tracked by a high-water mark on ``calls.updated_at``
+stored next to the vector store. Deleted calls are removed eagerly with
+:func:`forget_calls`.
+"""
+from __future__ import annotations
+
+import json
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, or_, select
+
+from logging_config import logger
+
+from . import database as db
+from .settings import Settings
+from .vector_db import VectorDB
+
+__all__ = [
+    "sync_vectors",
+    "forget_calls",
+    "rewind_sync",
+    "summary_metadata",
+    "SUMMARIES",
+]
+
+SUMMARIES = "summaries"
+STATE_FILE = "sync_state.json"
+
+# ``updated_at`` is stamped before the transaction commits, so a slow writer
+# can make a row visible behind the mark. Each run re-reads this window;
+# rows whose vectors already match are skipped, so nothing is re-embedded.
+OVERLAP = timedelta(minutes=5)
+
+
+def summary_metadata(
+    from_number: str, created_at: Optional[datetime]
+) -> Dict[str, Any]:
+    """Return the vector metadata stored with a call summary.
+
+    ``created_at`` is kept as epoch seconds so callers can rank by recency.
+    """
+    metadata: Dict[str, Any] = {"from_number": from_number}
+    if created_at is not None:
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=UTC)
+        metadata["created_at"] = created_at.timestamp()
+    return metadata
+
+
+def _load_mark(path: Path) -> Optional[Tuple[datetime, int]]:
+    try:
+        state = json.loads(path.read_text())
+        return datetime.fromisoformat(state["updated_at"]), int(state["id"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _save_mark(path: Path, updated_at: datetime, call_id: int) -> None:
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"updated_at": updated_at.isoformat(), "id": call_id}))
+    tmp.replace(path)
+
+
+async def sync_vectors(batch_size: int = 256, *, vdb: Optional[VectorDB] = None) -> int:
+    """Embed summaries changed since the last run and return how many."""
+    cfg = Settings()
+    state = Path(cfg.vector_db_path) / STATE_FILE
+    state.parent.mkdir(parents=True, exist_ok=True)
+    vdb = vdb or VectorDB(collection_name=SUMMARIES)
+
+    mark = _load_mark(state)
+    cursor = mark
+    if mark is not None and OVERLAP:
+        cursor = (mark[0] - OVERLAP, 0)
+    synced = 0
+    while True:
+        query = (
+            select(
+                db.Call.id,
+                db.Call.call_sid,
+                db.Call.summary,
+                db.Call.from_number,
+                db.Call.created_at,
+                db.Call.updated_at,
+            )
+            .where(db.Call.updated_at.is_not(None))
+            .order_by(db.Call.updated_at, db.Call.id)
+            .limit(batch_size)
+        )
+        if cursor is not None:
+            since, last_id = cursor
+            query = query.where(
+                or_(
+                    db.Call.updated_at > since,
+                    and_(db.Call.updated_at == since, db.Call.id > last_id),
+                )
+            )
+        async with db.get_session_async() as session:
+            rows = (await session.execute(query)).all()
+        if not rows:
+            break
+        stats = vdb.add_texts(
+            [row.summary for row in rows],
+            ids=[row.call_sid for row in rows],
+            metadatas=[
+                summary_metadata(row.from_number, row.created_at) for row in rows
+            ],
+        )
+        synced += stats["added"] + stats["updated"]
+        cursor = (rows[-1].updated_at, rows[-1].id)
+        _save_mark(state, *cursor)
+        if len(rows) < batch_size:
+            break
+    logger.bind(synced=synced).info("vector_sync_complete")
+    return synced
+
+
+def rewind_sync(since: datetime, vector_path: Optional[Path] = None) -> None:
+    """Make the next :func:`sync_vectors` re-read calls changed after ``since``.
+
+    Called when a rebuilt collection is promoted: writes that reached the
+    old collection while it was being built are not in the new one.
+    """
+    state = Path(vector_path or Settings().vector_db_path) / STATE_FILE
+    mark = _load_mark(state)
+    if since.tzinfo is not None:
+        # ``updated_at`` is read back naive, in UTC.
+        since = since.astimezone(UTC).replace(tzinfo=None)
+    if mark is not None and mark[0] > since:
+        _save_mark(state, since, 0)
+
+
+def forget_calls(call_sids: Sequence[str]) -> None:
+    """Drop the vectors of deleted calls, logging instead of raising."""
+    if not call_sids:
+        return
+    try:
+        VectorDB(collection_name=SUMMARIES).delete_texts(call_sids)
+    except Exception as exc:  # noqa: BLE001 - a full rebuild repairs the index
+        logger.bind(error=str(exc), count=len(call_sids)).warning(
+            "vector_delete_failed"
+        )
@@ -17,9 +17,17 @@ chroma = types.ModuleType("chromadb")
 
 
 class _DummyCollection:
+    name = "dummy"
+
     def add(self, **_: object) -> None:
         pass
 
+    def upsert(self, **_: object) -> None:
+        pass
+
+    def get(self, **_: object):
+        return {"ids": [], "documents": [], "metadatas": []}
+
     def query(self, **_: object):
         return {"documents": [[]]}
 
@@ -53,6 +61,15 @@ os.environ.setdefault("NOTIFY_EMAIL", "notify@test")
 os.environ.setdefault("USE_FAKE_SERVICES", "true")
 
 
+@pytest.fixture(autouse=True)
+def _fresh_embedding_models():
+    """Drop shared embedding models so each test's stubs take effect."""
+    vector_db = sys.modules.get("server.vector_db")
+    if vector_db is not None:
+        vector_db.clear_embedding_models()
+    yield
+
+
 @pytest.fixture
 def celery_setup(monkeypatch, tmp_path):
     """Configure Celery and database for tests."""
@@ -93,6 +93,20 @@ def test_agent_status(monkeypatch, tmp_path):
     assert data["active_sessions"] >= 1
 
 
+def test_list_active_sessions(monkeypatch, tmp_path):
+    client, key, _ = setup_app(monkeypatch, tmp_path)
+    resp = client.get(
+        "/v1/admin/sessions?page=1&page_size=5", headers={"X-API-Key": key}
+    )
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["total"] == len(data["items"])
+    assert all("last_active" in item for item in data["items"])
+
+    resp = client.get("/v1/admin/sessions?page=0", headers={"X-API-Key": key})
+    assert resp.status_code == 400
+
+
 def test_agent_config(monkeypatch, tmp_path):
     client, key, _ = setup_app(monkeypatch, tmp_path)
 
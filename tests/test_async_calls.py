@@ -26,16 +26,17 @@ def test_async_inbound_call(monkeypatch, tmp_path):
     from server.settings import Settings
 
     class DummyStateManager:
-        def create_session(self, *a, **k):
+        async def create_session(self, *a, **k):
             pass
 
-        def is_escalation_required(self, *_: object) -> bool:
+        async def is_escalation_required(self, *_: object) -> bool:
             return False
 
-        def get_summary(self, *_: object) -> str:
+        async def get_summary(self, *_: object) -> str:
             return ""
 
     monkeypatch.setattr(server_app, "StateManager", lambda: DummyStateManager())
+    monkeypatch.setattr(server_app, "AsyncStateManager", lambda: DummyStateManager())
 
     monkeypatch.setattr(
         server_app,
@@ -69,19 +70,23 @@ def test_async_recording_status(monkeypatch):
     monkeypatch.setattr(server_app, "verify_api_key", lambda *_: True)
 
     class DummyStateManager:
-        def create_session(self, *_: object, **__: object) -> None:
+        async def create_session(self, *_: object, **__: object) -> None:
             pass
 
-        def get_session(self, *_: object) -> dict[str, str]:
+        async def get_session(self, *_: object) -> dict[str, str]:
             return {}
 
-        def is_escalation_required(self, *_: object) -> bool:
+        async def end_session(self, *_: object) -> None:
+            pass
+
+        async def is_escalation_required(self, *_: object) -> bool:
             return False
 
-        def get_summary(self, *_: object) -> str:
+        async def get_summary(self, *_: object) -> str:
             return ""
 
     monkeypatch.setattr(server_app, "StateManager", lambda: DummyStateManager())
+    monkeypatch.setattr(server_app, "AsyncStateManager", lambda: DummyStateManager())
 
     called: dict[str, tuple] = {}
 
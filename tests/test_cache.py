@@ -1,10 +1,17 @@
 from __future__ import annotations
 
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+
 import fakeredis
+import pytest
 
 from tools import weather
 from server import self_reflection
 from server import cache
+from server.settings import ConfigError
 
 
 class DummyClient:
@@ -60,3 +67,366 @@ def test_self_reflection_cached(monkeypatch):
     r2 = self_reflection.generate_self_critique("hi", client=client)
     assert r1 == r2
     assert client.calls == 1
+
+
+def test_async_function_cached(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        cache, "_aredis", fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    )
+    calls = []
+
+    @cache.redis_cache(ttl=60)
+    async def lookup(city: str) -> dict:
+        calls.append(city)
+        return {"city": city}
+
+    async def run():
+        return await lookup("Paris"), await lookup("Paris")
+
+    r1, r2 = asyncio.run(run())
+    assert r1 == r2 == {"city": "Paris"}
+    assert calls == ["Paris"]
+
+
+def test_concurrent_misses_call_once(monkeypatch):
+    monkeypatch.setattr(cache, "_redis", fakeredis.FakeRedis(decode_responses=True))
+    calls = []
+
+    @cache.redis_cache(ttl=60)
+    def slow(x: int) -> int:
+        calls.append(x)
+        time.sleep(0.1)
+        return x * 2
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(slow(3))) for _ in range(10)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [6] * 10
+    assert calls == [3]
+
+
+def test_concurrent_async_misses_call_once(monkeypatch):
+    monkeypatch.setattr(
+        cache, "_aredis", fakeredis.FakeAsyncRedis(decode_responses=True)
+    )
+    calls = []
+
+    @cache.redis_cache(ttl=60)
+    async def slow(x: int) -> int:
+        calls.append(x)
+        await asyncio.sleep(0.05)
+        return x * 2
+
+    async def run():
+        return await asyncio.gather(*(slow(4) for _ in range(10)))
+
+    assert asyncio.run(run()) == [8] * 10
+    assert calls == [4]
+
+
+def test_lock_holder_result_is_shared(monkeypatch):
+    fake = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(cache, "_redis", fake)
+    monkeypatch.setattr(cache, "_POLL_INTERVAL", 0.01)
+    calls = []
+
+    @cache.redis_cache(ttl=60)
+    def value() -> str:
+        calls.append(1)
+        return "fresh"
+
+    # Another worker holds the lock and publishes its result shortly after.
+    key = cache._make_key(f"{value.__module__}.value", (), {})
+    fake.set(cache._lock_key(key), "other", px=1000)
+    threading.Timer(0.05, lambda: fake.set(key, '"remote"')).start()
+    assert value() == "remote"
+    assert calls == []
+
+
+def test_local_tier_serves_hits_until_cleared(monkeypatch):
+    fake = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(cache, "_redis", fake)
+    monkeypatch.setattr(cache, "_listener", object())
+    calls = []
+
+    @cache.redis_cache(ttl=60, local_size=8, local_ttl=60)
+    def lookup(city: str) -> str:
+        calls.append(city)
+        return city.upper()
+
+    assert lookup("oslo") == "OSLO"
+    fake.flushall()
+    # Served from process memory without touching Redis.
+    assert lookup("oslo") == "OSLO"
+    assert calls == ["oslo"]
+
+    cache.clear_cache()
+    assert lookup("oslo") == "OSLO"
+    assert calls == ["oslo", "oslo"]
+
+
+def test_local_tier_invalidated_by_peer(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        cache, "_redis", fakeredis.FakeRedis(server=server, decode_responses=True)
+    )
+    monkeypatch.setattr(cache, "_listener", None)
+    calls = []
+
+    @cache.redis_cache(ttl=60, local_size=8, local_ttl=60)
+    def lookup(city: str) -> str:
+        calls.append(city)
+        return city.upper()
+
+    try:
+        lookup("rome")
+        peer = fakeredis.FakeRedis(server=server, decode_responses=True)
+        peer.delete(*peer.keys("cache:*"))
+        peer.publish(cache._INVALIDATION_CHANNEL, "cache:*lookup*")
+        deadline = time.monotonic() + 2
+        while lookup("rome") and len(calls) == 1 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert calls == ["rome", "rome"]
+    finally:
+        cache._listener.stop()
+
+
+def test_negative_and_uncacheable_results(monkeypatch):
+    fake = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(cache, "_redis", fake)
+    calls = []
+
+    @cache.redis_cache(ttl=3600, negative_ttl=30)
+    def fetch(kind: str) -> str:
+        calls.append(kind)
+        if kind == "down":
+            return cache.negative("sorry")
+        return cache.uncacheable("later")
+
+    assert fetch("down") == fetch("down") == "sorry"
+    assert calls == ["down"]
+    (key,) = fake.keys("cache:*fetch*")
+    assert 0 < fake.ttl(key) <= 30
+
+    assert fetch("skip") == fetch("skip") == "later"
+    assert calls == ["down", "skip", "skip"]
+
+
+def test_weather_failure_cached_briefly(monkeypatch):
+    fake = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(cache, "_redis", fake)
+
+    def boom(*_a, **_k):
+        raise RuntimeError("down")
+
+    monkeypatch.setattr(weather, "call_with_retries", boom)
+    assert weather.get_weather("Lima").startswith("Sorry")
+    (key,) = fake.keys("cache:*get_weather*")
+    assert fake.ttl(key) < 3600
+
+
+def test_stale_entry_served_while_refreshing(monkeypatch):
+    fake = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(cache, "_redis", fake)
+    values = iter(["old", "new"])
+
+    @cache.redis_cache(ttl=60, stale_ttl=30)
+    def current() -> str:
+        return next(values)
+
+    assert current() == "old"
+    (key,) = fake.keys("cache:*current*")
+    assert 60 < fake.ttl(key) <= 90
+    # Age the entry past its soft TTL.
+    fake.expire(key, 10)
+
+    assert current() == "old"
+    deadline = time.monotonic() + 2
+    while fake.get(key) != '"new"' and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert current() == "new"
+
+
+def test_failed_refresh_keeps_stale_entry(monkeypatch):
+    fake = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(cache, "_redis", fake)
+    results = iter(["old", cache.negative("down"), cache.uncacheable("busy")])
+    refreshed = threading.Event()
+
+    @cache.redis_cache(ttl=60, stale_ttl=30, negative_ttl=10)
+    def current() -> str:
+        try:
+            return next(results)
+        finally:
+            refreshed.set()
+
+    assert current() == "old"
+    (key,) = fake.keys("cache:*current*")
+    for _ in range(2):
+        fake.expire(key, 20)
+        refreshed.clear()
+        assert current() == "old"
+        assert refreshed.wait(2)
+        deadline = time.monotonic() + 2
+        while fake.exists(key + ":lock") and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert fake.get(key) == '"old"'
+        assert 10 < fake.ttl(key) <= 20
+
+
+def test_negative_entry_not_extended_by_stale_ttl(monkeypatch):
+    fake = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(cache, "_redis", fake)
+
+    @cache.redis_cache(ttl=60, stale_ttl=300, negative_ttl=10)
+    def fetch() -> str:
+        return cache.negative("sorry")
+
+    assert fetch() == "sorry"
+    (key,) = fake.keys("cache:*fetch*")
+    assert 0 < fake.ttl(key) <= 10
+
+
+def test_invalidate_tags_drops_group(monkeypatch):
+    fake = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(cache, "_redis", fake)
+    monkeypatch.setattr(cache, "_listener", object())
+    calls = []
+
+    @cache.redis_cache(ttl=60, tags=("geo",), local_size=8)
+    def city(name: str) -> str:
+        calls.append(name)
+        return name.title()
+
+    @cache.redis_cache(ttl=60, tags=("other",))
+    def unrelated() -> int:
+        calls.append("unrelated")
+        return 1
+
+    city("kyiv"), city("kyiv"), unrelated()
+    assert calls == ["kyiv", "unrelated"]
+
+    cache.invalidate_tags("geo")
+    city("kyiv"), unrelated()
+    assert calls == ["kyiv", "unrelated", "kyiv"]
+    assert fake.get("cache_tag:geo") == "1"
+
+
+def test_clear_cache_scans_in_batches(monkeypatch):
+    fake = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(cache, "_redis", fake)
+    for i in range(25):
+        fake.set(f"cache:mod.fn:{i}", i)
+    fake.set("cache_tag:geo", 3)
+    fake.set("other", 1)
+
+    assert cache.clear_cache("cache:mod.*", batch_size=10) == 25
+    assert fake.keys("cache:*") == []
+    assert fake.get("cache_tag:geo") == "3"
+    assert fake.get("other") == "1"
+
+
+def test_clear_cache_notifies_peers_without_local_caches(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        cache, "_redis", fakeredis.FakeRedis(server=server, decode_responses=True)
+    )
+    monkeypatch.setattr(cache, "_local_caches", [])
+    peer = fakeredis.FakeRedis(server=server, decode_responses=True).pubsub()
+    peer.subscribe(cache._INVALIDATION_CHANNEL)
+    peer.get_message(timeout=1)
+
+    cache.clear_cache("cache:mod.*")
+    message = peer.get_message(timeout=1)
+    assert message is not None and message["data"] == "cache:mod.*"
+
+
+def test_cache_metrics_summarised(monkeypatch):
+    from server.metrics import cache_errors, cache_hit_ratios
+
+    monkeypatch.setattr(cache, "_redis", fakeredis.FakeRedis(decode_responses=True))
+
+    @cache.redis_cache(ttl=60)
+    def measured(x: int) -> int:
+        return x
+
+    @cache.redis_cache(ttl=60)
+    def unserialisable() -> object:
+        return {1, 2}
+
+    measured(1), measured(1), measured(1), measured(2)
+    stats = cache_hit_ratios()[f"{__name__}.measured"]
+    assert stats["hit"] == 2 and stats["miss"] == 2
+    assert stats["hit_ratio"] == 0.5
+
+    assert unserialisable() == {1, 2}
+    prefix = f"{__name__}.unserialisable"
+    assert cache_errors.labels(prefix, "serialize")._value.get() == 1
+
+
+def test_msgpack_codec_round_trips_rich_values(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        cache, "_redis", fakeredis.FakeRedis(server=server, decode_responses=True)
+    )
+    when = datetime(2024, 5, 1, 9, 30, tzinfo=timezone.utc)
+    calls = []
+
+    @cache.redis_cache(ttl=60, codec="msgpack", compress_threshold=100)
+    def events(big: bool) -> dict:
+        calls.append(big)
+        return {"start": when, "raw": b"\x00\x01", "text": "x" * (500 if big else 5)}
+
+    for big in (False, True):
+        first, second = events(big), events(big)
+        assert first == second
+        assert second["start"] == when and second["raw"] == b"\x00\x01"
+    assert calls == [False, True]
+
+    raw = fakeredis.FakeRedis(server=server)
+    markers = sorted(raw.get(k)[:1] for k in raw.keys("cache:*events*"))
+    assert markers == [b"\x01", b"\x02"]
+
+
+def test_async_msgpack_codec(monkeypatch):
+    # FakeAsyncRedis ignores NEVER_DECODE, so use a client that never decodes.
+    monkeypatch.setattr(cache, "_aredis", fakeredis.FakeAsyncRedis())
+
+    @cache.redis_cache(ttl=60, codec="msgpack")
+    async def page(url: str) -> str:
+        return f"text of {url}"
+
+    async def run():
+        return await page("a"), await page("a")
+
+    assert asyncio.run(run()) == ("text of a", "text of a")
+
+
+def test_json_codec_reads_entries_written_by_msgpack(monkeypatch):
+    monkeypatch.setattr(cache, "_redis", fakeredis.FakeRedis(decode_responses=True))
+    calls = []
+
+    def decorated(codec: str):
+        @cache.redis_cache(ttl=60, codec=codec)
+        def profile(name: str) -> dict:
+            calls.append(codec)
+            return {"name": name}
+
+        return profile
+
+    assert decorated("msgpack")("ada") == {"name": "ada"}
+    assert decorated("json")("ada") == {"name": "ada"}
+    assert calls == ["msgpack"]
+
+
+def test_codec_errors_name_the_decorator_argument():
+    with pytest.raises(ConfigError, match="Unknown codec: pickle"):
+        cache.redis_cache(codec="pickle")
+    with pytest.raises(ConfigError, match="compress_threshold requires codec="):
+        cache.redis_cache(codec="json", compress_threshold=10)
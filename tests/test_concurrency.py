@@ -29,16 +29,19 @@ def test_concurrent_call_performance(
     key = db.create_api_key("tester")
 
     class DummyStateManager:
-        def create_session(self, *a: object, **k: object) -> None:  # pragma: no cover
+        async def create_session(
+            self, *a: object, **k: object
+        ) -> None:  # pragma: no cover
             pass
 
-        def is_escalation_required(self, *_: object) -> bool:
+        async def is_escalation_required(self, *_: object) -> bool:
             return False
 
-        def get_summary(self, *_: object) -> str:
+        async def get_summary(self, *_: object) -> str:
             return ""
 
     monkeypatch.setattr(server_app, "StateManager", lambda: DummyStateManager())
+    monkeypatch.setattr(server_app, "AsyncStateManager", lambda: DummyStateManager())
 
     async def delayed_route(**_: object):
         await asyncio.sleep(0.2)
@@ -25,16 +25,17 @@ def test_concurrent_inbound_calls(monkeypatch, tmp_path):
     key = db.create_api_key("tester")
 
     class DummyStateManager:
-        def create_session(self, *a, **k):
+        async def create_session(self, *a, **k):
             pass
 
-        def is_escalation_required(self, *_: object) -> bool:
+        async def is_escalation_required(self, *_: object) -> bool:
             return False
 
-        def get_summary(self, *_: object) -> str:
+        async def get_summary(self, *_: object) -> str:
             return ""
 
     monkeypatch.setattr(server_app, "StateManager", lambda: DummyStateManager())
+    monkeypatch.setattr(server_app, "AsyncStateManager", lambda: DummyStateManager())
 
     async def delayed_route(**_: object):
         await asyncio.sleep(0.2)
@@ -39,16 +39,20 @@ def test_full_call_flow(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None
     key = db_module.create_api_key("tester")
 
     class DummyStateManager:
-        def create_session(self, *_: object, **__: object) -> None:
+        async def create_session(self, *_: object, **__: object) -> None:
             pass
 
-        def is_escalation_required(self, __: str) -> bool:
+        async def is_escalation_required(self, __: str) -> bool:
             return True
 
-        def get_summary(self, __: str) -> str:
+        async def get_summary(self, __: str) -> str:
             return "summary"
 
+        async def end_session(self, __: str) -> None:
+            pass
+
     monkeypatch.setattr(server_app, "StateManager", lambda: DummyStateManager())
+    monkeypatch.setattr(server_app, "AsyncStateManager", lambda: DummyStateManager())
     monkeypatch.setattr(
         server_app,
         "build_core_agent",
@@ -9,9 +9,17 @@ chroma = types.ModuleType("chromadb")
 
 
 class _DummyCollection:
+    name = "dummy"
+
     def add(self, **_: object) -> None:  # pragma: no cover - stub
         pass
 
+    def upsert(self, **_: object) -> None:  # pragma: no cover - stub
+        pass
+
+    def get(self, **_: object):  # pragma: no cover - stub
+        return {"ids": [], "documents": [], "metadatas": []}
+
     def query(self, **_: object):  # pragma: no cover - stub
         return {"documents": [[]]}
 
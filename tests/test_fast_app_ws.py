@@ -7,16 +7,16 @@ from .db_utils import migrate_sqlite
 
 
 class DummyStateManager:
-    def create_session(self, *_, **__):
+    async def create_session(self, *_, **__):
         pass
 
-    def append_history(self, *_, **__):
+    async def append_history(self, *_, **__):
         pass
 
-    def get_summary(self, *_):
+    async def get_summary(self, *_):
         return ""
 
-    def is_escalation_required(self, *_):
+    async def is_escalation_required(self, *_):
         return False
 
 
@@ -37,7 +37,7 @@ def test_fast_app_chat_ws(monkeypatch, tmp_path):
     from server.fast_app import create_app
     from server.settings import Settings
 
-    monkeypatch.setattr(server_app, "StateManager", lambda: DummyStateManager())
+    monkeypatch.setattr(server_app, "AsyncStateManager", lambda: DummyStateManager())
     monkeypatch.setattr(
         server_app, "build_core_agent", lambda *_: types.SimpleNamespace(agent=None)
     )
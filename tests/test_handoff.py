@@ -47,16 +47,17 @@ def test_inbound_call_escalation(monkeypatch: pytest.MonkeyPatch, tmp_path) -> N
     key = db.create_api_key("tester")
 
     class DummyStateManager:
-        def create_session(self, *args: object, **kwargs: object) -> None:
+        async def create_session(self, *args: object, **kwargs: object) -> None:
             pass
 
-        def is_escalation_required(self, _: str) -> bool:
+        async def is_escalation_required(self, _: str) -> bool:
             return True
 
-        def get_summary(self, _: str) -> str:
+        async def get_summary(self, _: str) -> str:
             return "summary"
 
     monkeypatch.setattr(server_app, "StateManager", lambda: DummyStateManager())
+    monkeypatch.setattr(server_app, "AsyncStateManager", lambda: DummyStateManager())
     monkeypatch.setattr(
         server_app,
         "build_core_agent",
@@ -13,9 +13,17 @@ chroma = types.ModuleType("chromadb")
 
 
 class _DummyCollection:
+    name = "dummy"
+
     def add(self, **_: object) -> None:
         pass
 
+    def upsert(self, **_: object) -> None:
+        pass
+
+    def get(self, **_: object):
+        return {"ids": [], "documents": [], "metadatas": []}
+
     def query(self, **_: object):
         return {"documents": [[]]}
 
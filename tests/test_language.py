@@ -39,19 +39,20 @@ def test_language_switch(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> Non
     key, db_module = _setup_env(monkeypatch, tmp_path)
 
     class DummyStateManager:
-        def create_session(self, *_, **__):
+        async def create_session(self, *_, **__):
             pass
 
-        def update_session(self, *_, **__):
+        async def update_session(self, *_, **__):
             pass
 
-        def is_escalation_required(self, _sid: str) -> bool:
+        async def is_escalation_required(self, _sid: str) -> bool:
             return False
 
-        def get_summary(self, _sid: str) -> str:
+        async def get_summary(self, _sid: str) -> str:
             return ""
 
     monkeypatch.setattr(server_app, "StateManager", lambda: DummyStateManager())
+    monkeypatch.setattr(server_app, "AsyncStateManager", lambda: DummyStateManager())
     monkeypatch.setattr(
         server_app, "echo", types.SimpleNamespace(delay=lambda *a, **k: None)
     )
@@ -119,19 +120,20 @@ def test_inbound_call_speech_detection(
     key, db_module = _setup_env(monkeypatch, tmp_path)
 
     class DummyStateManager:
-        def create_session(self, *_: object, **__: object) -> None:
+        async def create_session(self, *_: object, **__: object) -> None:
             pass
 
-        def update_session(self, *_: object, **__: object) -> None:
+        async def update_session(self, *_: object, **__: object) -> None:
             pass
 
-        def is_escalation_required(self, _sid: str) -> bool:
+        async def is_escalation_required(self, _sid: str) -> bool:
             return False
 
-        def get_summary(self, _sid: str) -> str:
+        async def get_summary(self, _sid: str) -> str:
             return ""
 
     monkeypatch.setattr(server_app, "StateManager", lambda: DummyStateManager())
+    monkeypatch.setattr(server_app, "AsyncStateManager", lambda: DummyStateManager())
     monkeypatch.setattr(
         server_app, "echo", types.SimpleNamespace(delay=lambda *a, **k: None)
     )
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from server import vector_db as vdb
+from tests.utils.fake_chroma import shared_client_factory
+
+from .db_utils import migrate_sqlite
+
+
+class DummyModel:
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def encode(self, texts: list[str]):
+        import numpy as np
+
+        return np.array([[float(len(t)), 1.0] for t in texts])
+
+
+@pytest.fixture
+def setup(monkeypatch, tmp_path):
+    monkeypatch.setenv("VECTOR_DB_PATH", str(tmp_path / "vectors"))
+    monkeypatch.setattr(vdb, "SentenceTransformer", DummyModel)
+    monkeypatch.setattr(vdb.chromadb, "PersistentClient", shared_client_factory())
+    db = migrate_sqlite(monkeypatch, tmp_path)
+    for i in range(5):
+        db.save_call_summary(f"CA{i}", f"+1{i % 2}", "+2", "t.txt", f"summary {i}")
+
+    from scripts import rebuild_vector_store as rvs
+
+    return rvs, tmp_path / "vectors"
+
+
+def _live(path):
+    return vdb.VectorDB(persist_directory=str(path), collection_name="summaries")
+
+
+def test_rebuild_swaps_in_shadow_collection(setup):
+    rvs, path = setup
+    opened = _live(path)
+    opened.upsert_texts(["stale"], ids=["gone"])
+    checkpoint = path / "ck.json"
+
+    count = asyncio.run(rvs.rebuild(path, checkpoint, batch_size=2))
+
+    assert count == 5
+    for live in (_live(path), opened):
+        assert sorted(live.collection.get()["ids"]) == [f"CA{i}" for i in range(5)]
+    (metadata,) = _live(path).collection.get(ids=["CA1"])["metadatas"]
+    assert metadata["from_number"] == "+11"
+    assert metadata["created_at"] > 0
+    retired = vdb.VectorDB(
+        persist_directory=str(path), collection_name="summaries__retired"
+    )
+    assert retired.collection.get()["ids"] == ["gone"]
+    assert not checkpoint.exists()
+
+
+def test_second_rebuild_drops_older_generation(setup):
+    rvs, path = setup
+    checkpoint = path / "ck.json"
+    asyncio.run(rvs.rebuild(path, checkpoint, batch_size=2))
+    first = _live(path).collection.name
+    asyncio.run(rvs.rebuild(path, checkpoint, batch_size=2))
+
+    live = _live(path)
+    assert live.collection.name != first
+    assert set(live.client.collections) == {first, live.collection.name}
+    assert live.collection.count() == 5
+
+
+def test_rebuild_rewinds_vector_sync(setup):
+    rvs, path = setup
+    from server import vector_sync
+
+    state = path / vector_sync.STATE_FILE
+    assert asyncio.run(vector_sync.sync_vectors()) == 5
+    # A sync that ran while the rebuild was in progress moved the mark on.
+    late = vector_sync._load_mark(state)[0] + timedelta(hours=1)
+    vector_sync._save_mark(state, late, 7)
+    before = datetime.now(UTC).replace(tzinfo=None)
+
+    asyncio.run(rvs.rebuild(path, path / "ck.json", batch_size=2))
+
+    since, last_id = vector_sync._load_mark(state)
+    assert before <= since < late and last_id == 0
+
+
+def test_rebuild_resumes_from_checkpoint(setup, monkeypatch):
+    rvs, path = setup
+    checkpoint = path / "ck.json"
+    original = rvs._Writer.write
+    batches = []
+
+    def flaky(self, rows, embeddings):
+        if len(batches) == 1:
+            raise RuntimeError("interrupted")
+        batches.append([r[1] for r in rows])
+        original(self, rows, embeddings)
+
+    monkeypatch.setattr(rvs._Writer, "write", flaky)
+    with pytest.raises(RuntimeError):
+        asyncio.run(rvs.rebuild(path, checkpoint, batch_size=2))
+    state = rvs._load_checkpoint(checkpoint)
+    assert (state["last_id"], state["count"]) == (2, 2)
+    assert _live(path).collection.count() == 0
+
+    monkeypatch.setattr(rvs._Writer, "write", original)
+    count = asyncio.run(rvs.rebuild(path, checkpoint, batch_size=2, resume=True))
+    assert count == 5
+    assert _live(path).collection.count() == 5
@@ -25,13 +25,17 @@ def _setup(monkeypatch: pytest.MonkeyPatch, tmp_path):
         def __init__(self) -> None:
             self.data = {}
 
-        def create_session(self, sid: str, info: dict) -> None:
+        async def create_session(self, sid: str, info: dict) -> None:
             self.data[sid] = info
 
-        def get_session(self, sid: str) -> dict:
+        async def get_session(self, sid: str) -> dict:
             return self.data.get(sid, {})
 
+        async def end_session(self, sid: str) -> None:
+            self.data.pop(sid, None)
+
     monkeypatch.setattr(server_app, "StateManager", lambda: DummyStateManager())
+    monkeypatch.setattr(server_app, "AsyncStateManager", lambda: DummyStateManager())
     return key
 
 
@@ -1,7 +1,11 @@
 from __future__ import annotations
 
+import asyncio
 import base64
 import json
+import os
+import threading
+import time
 from typing import Any
 import concurrent.futures
 import pytest
@@ -10,9 +14,12 @@ import fakeredis
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
 from pathlib import Path
+from sqlalchemy import select
 
-from server.state_manager import StateManager
+from server import state_manager
+from server.state_manager import AsyncStateManager, StateManager, get_async_pool
 from server.settings import ConfigError
+from server.token_codec import TokenCodec
 
 
 def _make_manager(monkeypatch: Any, tmp_path: Path) -> StateManager:
@@ -52,6 +59,23 @@ def test_history_and_summary(monkeypatch: Any, tmp_path: Path) -> None:
     assert manager.get_summary("call") == "greeting"
 
 
+def test_summary_metadata_stable_across_reprocessing(
+    monkeypatch: Any, tmp_path: Path
+) -> None:
+    manager = _make_manager(monkeypatch, tmp_path)
+    written: list[Any] = []
+    monkeypatch.setattr(
+        manager._summary_db,
+        "add_texts",
+        lambda texts, ids=None, *, metadatas=None: written.append(metadatas),
+    )
+    manager.create_session("call", {"from": "+1"})
+    started = int(manager.get_session("call")["created_at"])
+    manager.set_summary("call", "greeting", from_number="+1")
+    manager.set_summary("call", "greeting", from_number="+1")
+    assert written == [[{"from_number": "+1", "created_at": float(started)}]] * 2
+
+
 def test_similar_summaries(monkeypatch: Any, tmp_path: Path) -> None:
     manager = _make_manager(monkeypatch, tmp_path)
     manager.set_summary(
@@ -72,10 +96,12 @@ def test_create_session_loads_history(monkeypatch: Any, tmp_path: Path) -> None:
     manager.set_summary("c1", "Previous conversation", from_number="123")
     monkeypatch.setattr(
         manager._summary_db,
-        "search",
+        "caller_memory",
         lambda *_, **__: ["Previous conversation"],
     )
     manager.create_session("new", {"from": "123"})
+    assert "similar_summaries" not in manager.get_session("new")
+    assert manager.load_similar_summaries("new") == ["Previous conversation"]
     sess = manager.get_session("new")
     sims = json.loads(sess.get("similar_summaries", "[]"))
     assert sims == ["Previous conversation"]
@@ -123,3 +149,631 @@ def test_concurrent_session_updates(monkeypatch: Any, tmp_path: Path) -> None:
 
     sess = manager.get_session("call")
     assert sess["foo"] == sess["bar"]
+
+
+def test_history_range_reads(monkeypatch: Any, tmp_path: Path) -> None:
+    manager = _make_manager(monkeypatch, tmp_path)
+    for i in range(5):
+        manager.append_history("call", "user", f"msg{i}")
+    assert manager.history_length("call") == 5
+    tail = manager.get_history("call", start=-2)
+    assert [h["text"] for h in tail] == ["msg3", "msg4"]
+    head = manager.get_history("call", start=0, end=1)
+    assert [h["text"] for h in head] == ["msg0", "msg1"]
+
+
+def test_legacy_history_migrated(monkeypatch: Any, tmp_path: Path) -> None:
+    manager = _make_manager(monkeypatch, tmp_path)
+    legacy = [{"speaker": "user", "text": "old1"}, {"speaker": "bot", "text": "old2"}]
+    manager._redis.hset(manager._key("call"), "history", json.dumps(legacy))
+    assert manager.get_history("call") == legacy
+
+    manager.append_history("call", "user", "new")
+    history = manager.get_history("call")
+    assert [h["text"] for h in history] == ["old1", "old2", "new"]
+    assert manager._redis.hget(manager._key("call"), "history") is None
+
+
+def test_hash_history_backend(monkeypatch: Any, tmp_path: Path) -> None:
+    monkeypatch.setenv("HISTORY_BACKEND", "hash")
+    manager = _make_manager(monkeypatch, tmp_path)
+    manager.append_history("call", "user", "hi")
+    manager.append_history("call", "bot", "hello")
+    assert manager.get_history("call", start=-1) == [
+        {"speaker": "bot", "text": "hello"}
+    ]
+    assert manager._redis.exists(manager._history_key("call")) == 0
+
+
+def _make_async_manager(monkeypatch: Any, tmp_path: Path) -> AsyncStateManager:
+    key = AESGCM.generate_key(bit_length=128)
+    monkeypatch.setenv("TOKEN_ENCRYPTION_KEY", base64.b64encode(key).decode())
+    monkeypatch.setenv("VECTOR_DB_PATH", str(tmp_path / "vectors"))
+    monkeypatch.setenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+    manager = AsyncStateManager(url="redis://localhost:6379/0")
+    manager._redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    return manager
+
+
+@pytest.mark.asyncio
+async def test_async_manager_session_and_history(
+    monkeypatch: Any, tmp_path: Path
+) -> None:
+    manager = _make_async_manager(monkeypatch, tmp_path)
+    await manager.create_session("call", {"to": "+2"})
+    await manager.update_session("call", escalation_required="true")
+    assert (await manager.get_session("call"))["to"] == "+2"
+    assert await manager.is_escalation_required("call")
+
+    await asyncio.gather(
+        *(manager.append_history("call", "user", f"msg{i}") for i in range(5))
+    )
+    assert await manager.history_length("call") == 5
+    assert {h["text"] for h in await manager.get_history("call")} == {
+        f"msg{i}" for i in range(5)
+    }
+    assert await manager.list_sessions() == ["call"]
+
+    await manager.delete_session("call")
+    assert await manager.get_history("call") == []
+
+
+@pytest.mark.asyncio
+async def test_async_manager_tokens_and_oauth(monkeypatch: Any, tmp_path: Path) -> None:
+    manager = _make_async_manager(monkeypatch, tmp_path)
+    await manager.set_token("user1", "at", "rt", expires_at=123)
+    assert await manager.get_token("user1") == {
+        "access_token": "at",
+        "refresh_token": "rt",
+        "expires_at": "123",
+    }
+    assert [uid async for uid, _ in manager.iter_tokens()] == ["user1"]
+    await manager.set_oauth_state("abc", "user1")
+    assert await manager.pop_oauth_state("abc") == "user1"
+    assert await manager.pop_oauth_state("abc") is None
+
+
+def test_async_pool_is_shared() -> None:
+    pool = get_async_pool("redis://localhost:6379/5")
+    assert get_async_pool("redis://localhost:6379/5") is pool
+
+
+@pytest.mark.asyncio
+async def test_async_create_session_enriches_in_background(
+    monkeypatch: Any, tmp_path: Path
+) -> None:
+    manager = _make_async_manager(monkeypatch, tmp_path)
+    monkeypatch.setattr(
+        manager._summary_db,
+        "caller_memory",
+        lambda *_, **__: ["Previous conversation"],
+    )
+    await manager.create_session("new", {"from": "123"})
+    await asyncio.gather(*manager._pending)
+    sess = await manager.get_session("new")
+    assert json.loads(sess["similar_summaries"]) == ["Previous conversation"]
+
+
+@pytest.mark.asyncio
+async def test_similar_summaries_timeout(monkeypatch: Any, tmp_path: Path) -> None:
+    manager = _make_async_manager(monkeypatch, tmp_path)
+    manager.similar_summaries_timeout = 0.01
+
+    def slow_lookup(*_: Any, **__: Any) -> list[str]:
+        time.sleep(0.2)
+        return ["late"]
+
+    monkeypatch.setattr(manager._summary_db, "caller_memory", slow_lookup)
+    await manager.create_session("new", {"from": "123"})
+    assert await manager.load_similar_summaries("new") == []
+    assert "similar_summaries" not in await manager.get_session("new")
+
+
+@pytest.mark.asyncio
+async def test_ended_session_not_recreated_by_lookup(
+    monkeypatch: Any, tmp_path: Path
+) -> None:
+    monkeypatch.setenv("ARCHIVE_SESSIONS", "false")
+    manager = _make_async_manager(monkeypatch, tmp_path)
+
+    def slow_lookup(*_: Any, **__: Any) -> list[str]:
+        time.sleep(0.05)
+        return ["late"]
+
+    monkeypatch.setattr(manager._summary_db, "caller_memory", slow_lookup)
+    await manager.create_session("sms", {"from": "123"})
+    await manager.end_session("sms")
+    await asyncio.gather(*manager._pending, return_exceptions=True)
+    assert await manager._redis.exists(manager._key("sms")) == 0
+    assert manager._lookups == {}
+
+    # A lookup started elsewhere finishing after the session ended.
+    assert await manager.load_similar_summaries("gone", "123") == ["late"]
+    assert await manager._redis.exists(manager._key("gone")) == 0
+
+
+def test_sync_lookup_skips_ended_session(monkeypatch: Any, tmp_path: Path) -> None:
+    manager = _make_manager(monkeypatch, tmp_path)
+    monkeypatch.setattr(manager._summary_db, "caller_memory", lambda *_, **__: ["x"])
+    assert manager.load_similar_summaries("gone", "123") == ["x"]
+    assert manager._redis.exists(manager._key("gone")) == 0
+
+
+def test_session_idle_ttl_refreshed(monkeypatch: Any, tmp_path: Path) -> None:
+    monkeypatch.setenv("SESSION_IDLE_TTL", "100")
+    monkeypatch.setenv("SESSION_MAX_TTL", "0")
+    manager = _make_manager(monkeypatch, tmp_path)
+    manager.create_session("call", {"from": "+1"})
+    manager.append_history("call", "user", "hi")
+    assert 0 < manager._redis.ttl(manager._key("call")) <= 100
+    assert 0 < manager._redis.ttl(manager._history_key("call")) <= 100
+    manager._redis.expire(manager._key("call"), 5)
+    manager.update_session("call", state="speaking")
+    assert manager._redis.ttl(manager._key("call")) > 5
+
+
+def test_session_absolute_ttl_caps_idle(monkeypatch: Any, tmp_path: Path) -> None:
+    monkeypatch.setenv("SESSION_IDLE_TTL", "100")
+    monkeypatch.setenv("SESSION_MAX_TTL", "1000")
+    manager = _make_manager(monkeypatch, tmp_path)
+    manager.create_session("call", {})
+    manager._redis.hset(manager._key("call"), "created_at", int(time.time()) - 950)
+    manager.append_history("call", "user", "hi")
+    assert manager._redis.ttl(manager._key("call")) <= 50
+    assert manager._redis.ttl(manager._history_key("call")) <= 50
+
+
+def test_token_batches_and_expiry_index(monkeypatch: Any, tmp_path: Path) -> None:
+    manager = _make_manager(monkeypatch, tmp_path)
+    for i in range(7):
+        manager.set_token(f"user{i}", "at", "rt", expires_at=100 * i)
+    manager.set_token("forever", "at")
+
+    batches = list(manager.iter_token_batches(batch_size=3))
+    assert sum(len(b) for b in batches) == 8
+    assert {uid for uid, _ in manager.iter_tokens()} == {
+        *(f"user{i}" for i in range(7)),
+        "forever",
+    }
+
+    due = manager.expiring_tokens(250, batch_size=2)
+    assert sorted(uid for uid, _ in due) == ["user0", "user1", "user2"]
+    manager.delete_token("user1")
+    assert sorted(uid for uid, _ in manager.expiring_tokens(250)) == [
+        "user0",
+        "user2",
+    ]
+
+
+def test_expiring_tokens_backfills_index(monkeypatch: Any, tmp_path: Path) -> None:
+    manager = _make_manager(monkeypatch, tmp_path)
+    manager.set_token("legacy", "at", "rt", expires_at=10)
+    manager._redis.delete(manager._token_expiry_key())
+    assert [uid for uid, _ in manager.expiring_tokens(20)] == ["legacy"]
+    assert manager._redis.zscore(manager._token_expiry_key(), "legacy") == 10
+
+
+def test_backfill_runs_even_if_index_exists(monkeypatch: Any, tmp_path: Path) -> None:
+    manager = _make_manager(monkeypatch, tmp_path)
+    manager.set_token("legacy", "at", "rt", expires_at=10)
+    manager._redis.delete(manager._token_expiry_key())
+    # A token written after deploy creates the index before the first refresh.
+    manager.set_token("fresh", "at", "rt", expires_at=15)
+    assert sorted(uid for uid, _ in manager.expiring_tokens(20)) == [
+        "fresh",
+        "legacy",
+    ]
+    assert manager._redis.exists(manager._token_backfill_key())
+
+
+def test_token_codec_envelope() -> None:
+    key = AESGCM.generate_key(bit_length=128)
+    codec = TokenCodec(key, version=3)
+    raw = codec.encrypt("secret", binary=True)
+    assert isinstance(raw, bytes) and raw[:2] == b"\x00\x03"
+    assert codec.decrypt(raw) == "secret"
+    text = codec.encrypt("secret")
+    assert codec.decrypt(text) == "secret"
+    assert not codec.is_stale(text)
+
+    nonce = os.urandom(12)
+    legacy = base64.b64encode(nonce + AESGCM(key).encrypt(nonce, b"old", None)).decode()
+    assert codec.decrypt(legacy) == "old"
+    assert codec.is_stale(legacy)
+
+
+def test_token_key_rotation(monkeypatch: Any, tmp_path: Path) -> None:
+    manager = _make_manager(monkeypatch, tmp_path)
+    old_key = os.environ["TOKEN_ENCRYPTION_KEY"]
+    manager.set_token("lazy", "at1")
+    manager.set_token("bulk", "at2")
+
+    new_key = base64.b64encode(AESGCM.generate_key(bit_length=128)).decode()
+    monkeypatch.setenv("TOKEN_ENCRYPTION_KEY", new_key)
+    monkeypatch.setenv("TOKEN_ENCRYPTION_KEY_VERSION", "2")
+    monkeypatch.setenv("TOKEN_ENCRYPTION_OLD_KEYS", f"1:{old_key}")
+    rotated = StateManager(url="redis://localhost:6379/0")
+    rotated._redis = manager._redis
+
+    assert rotated.get_token("lazy") == {"access_token": "at1"}
+    assert not rotated._codec.is_stale(rotated._redis.get(rotated._token_key("lazy")))
+    assert rotated.reencrypt_tokens() == 1
+    assert rotated.reencrypt_tokens() == 0
+
+    monkeypatch.setenv("TOKEN_ENCRYPTION_OLD_KEYS", "")
+    fresh = StateManager(url="redis://localhost:6379/0")
+    fresh._redis = manager._redis
+    assert fresh.get_token("bulk") == {"access_token": "at2"}
+
+
+def _wait_for(predicate: Any, timeout: float = 2.0) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_session_near_cache_invalidation(monkeypatch: Any, tmp_path: Path) -> None:
+    monkeypatch.setenv("SESSION_CACHE_SIZE", "10")
+    monkeypatch.setattr(state_manager, "_session_listeners", {})
+    server = fakeredis.FakeServer()
+    reader = _make_manager(monkeypatch, tmp_path)
+    writer = _make_manager(monkeypatch, tmp_path)
+    reader._redis = fakeredis.FakeRedis(server=server, decode_responses=True)
+    writer._redis = fakeredis.FakeRedis(server=server, decode_responses=True)
+
+    writer.create_session("call", {"from": "+1"})
+    assert reader.get_session("call")["from"] == "+1"
+    # A raw write that bypasses the manager is not seen until invalidated.
+    writer._redis.hset(writer._key("call"), "escalation_required", "true")
+    assert not reader.is_escalation_required("call")
+    writer._redis.hset(writer._key("call"), "escalation_required", "false")
+
+    writer.flag_escalation("call")
+    assert _wait_for(lambda: reader.is_escalation_required("call"))
+
+    reader.update_session("call", state="speaking")
+    assert reader.get_session("call")["state"] == "speaking"
+    writer.delete_session("call")
+    assert _wait_for(lambda: reader.get_session("call") == {})
+    reader._listener.stop()
+
+
+def test_session_listener_shared_between_managers(
+    monkeypatch: Any, tmp_path: Path
+) -> None:
+    monkeypatch.setenv("SESSION_CACHE_SIZE", "10")
+    monkeypatch.setattr(state_manager, "_session_listeners", {})
+    server = fakeredis.FakeServer()
+    writer = _make_manager(monkeypatch, tmp_path)
+    writer._redis = fakeredis.FakeRedis(server=server, decode_responses=True)
+    writer.create_session("call", {"from": "+1"})
+    before = threading.active_count()
+
+    readers = []
+    for _ in range(5):
+        reader = _make_manager(monkeypatch, tmp_path)
+        reader._redis = fakeredis.FakeRedis(server=server, decode_responses=True)
+        assert reader.get_session("call")["from"] == "+1"
+        readers.append(reader)
+    assert threading.active_count() <= before + 1
+
+    writer.update_session("call", state="speaking")
+    for reader in readers:
+        assert _wait_for(lambda: reader.get_session("call").get("state") == "speaking")
+    readers[0]._listener.stop()
+
+
+@pytest.mark.asyncio
+async def test_async_session_near_cache(monkeypatch: Any, tmp_path: Path) -> None:
+    monkeypatch.setenv("SESSION_CACHE_SIZE", "10")
+    server = fakeredis.FakeServer()
+    reader = _make_async_manager(monkeypatch, tmp_path)
+    writer = _make_async_manager(monkeypatch, tmp_path)
+    reader._redis = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    writer._redis = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+
+    await writer.create_session("call", {"to": "+2"})
+    assert (await reader.get_session("call"))["to"] == "+2"
+    assert reader._near_cache is not None and len(reader._near_cache) == 1
+
+    await writer.update_session("call", to="+3")
+    for _ in range(200):
+        if (await reader.get_session("call"))["to"] == "+3":
+            break
+        await asyncio.sleep(0.01)
+    assert (await reader.get_session("call"))["to"] == "+3"
+    reader._listener.cancel()
+
+
+class _FakeCluster(fakeredis.FakeRedis):
+    """Single-node stand-in exposing the cluster-only helpers we call."""
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs: Any) -> "_FakeCluster":
+        kwargs.pop("read_from_replicas", None)
+        return cls(**kwargs)
+
+    def mget_nonatomic(self, keys: list[str]) -> list[Any]:
+        return self.mget(keys)
+
+
+def test_cluster_mode_hash_tags_keys(monkeypatch: Any, tmp_path: Path) -> None:
+    import server.state_manager as sm
+
+    monkeypatch.setenv("REDIS_CLUSTER", "true")
+    monkeypatch.setattr(sm, "RedisCluster", _FakeCluster)
+    manager = _make_manager(monkeypatch, tmp_path)
+    manager._redis = _FakeCluster(decode_responses=True)
+    assert manager._key("CA1") == "session:{CA1}"
+    assert manager._history_key("CA1") == "history:{CA1}"
+
+    manager.create_session("CA1", {"from": "+1"})
+    manager.append_history("CA1", "user", "hi")
+    assert manager.get_history("CA1") == [{"speaker": "user", "text": "hi"}]
+    assert manager.migrate_history("CA1") == 0
+    manager.set_token("u1", "at", "rt", expires_at=5)
+    assert [uid for uid, _ in manager.expiring_tokens(10)] == ["u1"]
+    assert [uid for uid, _ in manager.iter_tokens()] == ["u1"]
+
+    monkeypatch.setenv("HISTORY_BACKEND", "hash")
+    with pytest.raises(ConfigError):
+        StateManager(url="redis://localhost:6379/0")
+
+
+def test_history_reads_from_replica(monkeypatch: Any, tmp_path: Path) -> None:
+    monkeypatch.setenv("HISTORY_READ_REPLICA", "true")
+    monkeypatch.setenv("REDIS_REPLICA_URL", "redis://replica:6379/0")
+    manager = _make_manager(monkeypatch, tmp_path)
+    assert manager._replica_client is not None
+    replica = fakeredis.FakeRedis(decode_responses=True)
+    manager._replica_client = replica
+    manager.append_history("call", "user", "hi")
+    assert manager.get_history("call") == []
+    replica.rpush(manager._history_key("call"), json.dumps({"speaker": "bot"}))
+    assert manager.history_length("call") == 1
+    assert manager.get_history("call") == [{"speaker": "bot"}]
+
+
+def test_msgpack_history_codec(monkeypatch: Any, tmp_path: Path) -> None:
+    pytest.importorskip("msgpack")
+    pytest.importorskip("zstandard")
+    monkeypatch.setenv("STATE_CODEC", "msgpack")
+    monkeypatch.setenv("STATE_COMPRESS_THRESHOLD", "64")
+    manager = _make_manager(monkeypatch, tmp_path)
+    key = manager._history_key("call")
+    manager._redis.rpush(key, json.dumps({"speaker": "user", "text": "legacy"}))
+    manager.append_history("call", "bot", "short")
+    manager.append_history("call", "user", "long " * 100)
+
+    raw = manager._raw(manager._redis, "LRANGE", key, 0, -1)
+    assert raw[1][:1] == b"\x01" and raw[2][:1] == b"\x02"
+    assert len(raw[2]) < 100
+    assert [h["text"] for h in manager.get_history("call")] == [
+        "legacy",
+        "short",
+        "long " * 100,
+    ]
+
+
+def test_payload_codec_rejects_unknown(monkeypatch: Any, tmp_path: Path) -> None:
+    monkeypatch.setenv("STATE_CODEC", "pickle")
+    with pytest.raises(ConfigError):
+        _make_manager(monkeypatch, tmp_path)
+
+
+def test_pop_oauth_state_is_single_use(monkeypatch: Any, tmp_path: Path) -> None:
+    manager = _make_manager(monkeypatch, tmp_path)
+    manager.set_oauth_state("st", "user")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda _: manager.pop_oauth_state("st"), range(8)))
+    assert results.count("user") == 1
+    assert manager.pop_oauth_state("missing") is None
+
+
+def test_history_capped_append(monkeypatch: Any, tmp_path: Path) -> None:
+    monkeypatch.setenv("HISTORY_MAX_ENTRIES", "3")
+    monkeypatch.setenv("SESSION_IDLE_TTL", "100")
+    manager = _make_manager(monkeypatch, tmp_path)
+    manager.create_session("call", {})
+    manager._redis.script_flush()
+    for i in range(5):
+        manager.append_history("call", "user", f"m{i}")
+    assert [h["text"] for h in manager.get_history("call")] == ["m2", "m3", "m4"]
+    assert 0 < manager._redis.ttl(manager._history_key("call")) <= 100
+    assert manager.list_sessions() == ["call"]
+    manager.append_history("call", "user", "all", max_entries=0)
+    assert manager.history_length("call") == 4
+
+
+def test_flag_escalation_once(monkeypatch: Any, tmp_path: Path) -> None:
+    manager = _make_manager(monkeypatch, tmp_path)
+    manager.create_session("call", {})
+    assert manager.flag_escalation("call", summary="needs a human")
+    assert not manager.flag_escalation("call", summary="second")
+    assert manager.is_escalation_required("call")
+    assert manager.get_summary("call") == "needs a human"
+
+
+@pytest.mark.asyncio
+async def test_async_lua_operations(monkeypatch: Any, tmp_path: Path) -> None:
+    manager = _make_async_manager(monkeypatch, tmp_path)
+    await manager.create_session("call", {})
+    await manager.set_oauth_state("st", "user")
+    assert await manager.pop_oauth_state("st") == "user"
+    assert await manager.pop_oauth_state("st") is None
+    assert await manager.flag_escalation("call")
+    assert not await manager.flag_escalation("call")
+    for i in range(4):
+        await manager.append_history("call", "bot", f"m{i}", max_entries=2)
+    assert [h["text"] for h in await manager.get_history("call")] == ["m2", "m3"]
+
+
+def test_history_window_compaction(monkeypatch: Any, tmp_path: Path) -> None:
+    import server.state_manager as sm
+
+    monkeypatch.setenv("HISTORY_WINDOW", "3")
+    manager = _make_manager(monkeypatch, tmp_path)
+    submitted: list[Any] = []
+
+    class _Pool:
+        def submit(self, fn: Any, *args: Any) -> None:
+            submitted.append(args)
+
+    monkeypatch.setattr(sm, "_compaction_executor", lambda: _Pool())
+    for i in range(6):
+        manager.append_history("call", "user", f"turn{i}")
+    assert submitted == [("call",)]
+
+    assert manager.compact_history("call")
+    window = manager.get_history_window("call")
+    assert window["summary"] == "turn0 turn1 turn2"
+    assert [t["text"] for t in window["turns"]] == ["turn3", "turn4", "turn5"]
+    assert manager.history_length("call") == 3
+    assert not manager.compact_history("call")
+
+    manager._redis.set(manager._compact_lock_key("call"), "1")
+    for i in range(6, 9):
+        manager.append_history("call", "user", f"turn{i}")
+    assert not manager.compact_history("call")
+
+
+def test_compaction_keeps_lock_taken_over_by_another_worker(
+    monkeypatch: Any, tmp_path: Path
+) -> None:
+    import server.escalation as escalation
+    import server.state_manager as sm
+
+    monkeypatch.setenv("HISTORY_WINDOW", "2")
+    manager = _make_manager(monkeypatch, tmp_path)
+    monkeypatch.setattr(sm, "_compaction_executor", lambda: None)
+    for i in range(3):
+        manager.append_history("call", "user", f"turn{i}")
+    lock = manager._compact_lock_key("call")
+
+    def slow_roll(previous: str, entries: Any, words: int) -> str:
+        # Our lock expires mid-compaction and another worker acquires it.
+        manager._redis.set(lock, "other-worker")
+        return "summary"
+
+    monkeypatch.setattr(escalation, "roll_summary", slow_roll)
+    assert not manager.compact_history("call")
+    assert manager._redis.get(lock) == "other-worker"
+    # Nothing is trimmed or summarised without the lock.
+    assert manager.history_length("call") == 3
+    assert manager.get_history_window("call")["summary"] == ""
+
+
+def test_compaction_skips_head_folded_by_another_worker(
+    monkeypatch: Any, tmp_path: Path
+) -> None:
+    import server.escalation as escalation
+    import server.state_manager as sm
+
+    monkeypatch.setenv("HISTORY_WINDOW", "2")
+    manager = _make_manager(monkeypatch, tmp_path)
+    monkeypatch.setattr(sm, "_compaction_executor", lambda: None)
+    for i in range(3):
+        manager.append_history("call", "user", f"turn{i}")
+
+    def slow_roll(previous: str, entries: Any, words: int) -> str:
+        # A worker that took over the expired lock folds the same head.
+        manager._redis.ltrim(manager._history_key("call"), 1, -1)
+        return "summary"
+
+    monkeypatch.setattr(escalation, "roll_summary", slow_roll)
+    assert not manager.compact_history("call")
+    texts = [t["text"] for t in manager.get_history_window("call")["turns"]]
+    assert texts == ["turn1", "turn2"]
+
+
+@pytest.mark.asyncio
+async def test_async_history_window_compaction(
+    monkeypatch: Any, tmp_path: Path
+) -> None:
+    monkeypatch.setenv("HISTORY_WINDOW", "2")
+    manager = _make_async_manager(monkeypatch, tmp_path)
+    for i in range(4):
+        await manager.append_history("call", "user", f"t{i}")
+    await asyncio.gather(*manager._pending)
+    window = await manager.get_history_window("call")
+    assert window == {
+        "summary": "t0 t1",
+        "turns": [
+            {"speaker": "user", "text": "t2"},
+            {"speaker": "user", "text": "t3"},
+        ],
+    }
+
+
+def test_history_window_conflicts_with_cap(monkeypatch: Any, tmp_path: Path) -> None:
+    monkeypatch.setenv("HISTORY_WINDOW", "2")
+    monkeypatch.setenv("HISTORY_MAX_ENTRIES", "5")
+    with pytest.raises(ConfigError):
+        _make_manager(monkeypatch, tmp_path)
+
+
+def test_active_session_index(monkeypatch: Any, tmp_path: Path) -> None:
+    monkeypatch.setenv("SESSION_IDLE_TTL", "100")
+    manager = _make_manager(monkeypatch, tmp_path)
+    manager.create_session("old", {})
+    manager.create_session("new", {})
+    manager._redis.zadd(manager._index_key(), {"old": time.time() - 50})
+    assert manager.list_sessions() == ["new", "old"]
+    assert manager.count_sessions(within=10) == 1
+    assert [sid for sid, _ in manager.recent_sessions(offset=1, limit=1)] == ["old"]
+
+    manager.append_history("old", "user", "hi")
+    assert manager.list_sessions()[0] == "old"
+
+    manager._redis.zadd(manager._index_key(), {"stale": time.time() - 500})
+    assert manager.count_sessions() == 2
+    manager.create_session("another", {})
+    assert manager._redis.zscore(manager._index_key(), "stale") is None
+
+    manager.delete_session("new")
+    assert "new" not in manager.list_sessions()
+
+
+def test_session_index_trimmed_without_idle_ttl(
+    monkeypatch: Any, tmp_path: Path
+) -> None:
+    monkeypatch.setenv("SESSION_IDLE_TTL", "0")
+    monkeypatch.setenv("SESSION_MAX_TTL", "100")
+    manager = _make_manager(monkeypatch, tmp_path)
+    manager.create_session("live", {})
+    manager.create_session("expired", {})
+    # The hash expired by TTL without end_session running.
+    manager._redis.delete(manager._key("expired"))
+    manager._redis.zadd(manager._index_key(), {"ancient": time.time() - 500})
+
+    assert manager.list_sessions() == ["live"]
+    assert manager._redis.zscore(manager._index_key(), "expired") is None
+    manager.create_session("another", {})
+    assert manager._redis.zscore(manager._index_key(), "ancient") is None
+
+
+def test_end_session_archives_to_sql(monkeypatch: Any, tmp_path: Path) -> None:
+    from .db_utils import migrate_sqlite
+
+    db = migrate_sqlite(monkeypatch, tmp_path)
+    manager = _make_manager(monkeypatch, tmp_path)
+    manager.create_session("call", {"from": "+1"})
+    manager.append_history("call", "user", "hi")
+    manager.end_session("call")
+
+    assert manager.get_session("call") == {}
+    assert manager.get_history("call") == []
+
+    async def fetch() -> Any:
+        async with db.get_session_async() as session:
+            result = await session.execute(
+                select(db.SessionArchive).filter_by(call_sid="call")
+            )
+            return result.scalar_one()
+
+    archived = asyncio.run(fetch())
+    assert archived.data["from"] == "+1"
+    assert archived.history == [{"speaker": "user", "text": "hi"}]
@@ -70,7 +70,10 @@ def test_transcribe_audio(monkeypatch, tmp_path):
     )
 
     saved: list[tuple] = []
-    monkeypatch.setattr(tasks, "save_call_summary", lambda *args: saved.append(args))
+    when = datetime(2024, 1, 1, tzinfo=UTC)
+    monkeypatch.setattr(
+        tasks, "save_call_summary", lambda *args: saved.append(args) or when
+    )
 
     sent: dict[str, str | None] = {}
     monkeypatch.setattr(
@@ -92,13 +95,23 @@ def test_transcribe_audio(monkeypatch, tmp_path):
     monkeypatch.setattr(tasks.send_transcript_email, "delay", capture_delay)
 
     summaries: list[tuple[str, str, str]] = []
+    stamps: list[datetime | None] = []
 
     class DummyManager:
         def set_summary(
-            self, cid: str, text: str, from_number: str | None = None
+            self,
+            cid: str,
+            text: str,
+            from_number: str | None = None,
+            created_at: datetime | None = None,
         ) -> None:  # noqa: D401
             summaries.append((cid, text, from_number))
+            stamps.append(created_at)
+
+        def end_session(self, cid: str) -> None:
+            ended.append(cid)
 
+    ended: list[str] = []
     monkeypatch.setattr(tasks, "StateManager", DummyManager)
 
     path = tasks.transcribe_audio("audio.wav", "CA1", "+100", "+200")
@@ -109,6 +122,18 @@ def test_transcribe_audio(monkeypatch, tmp_path):
     assert saved[0][0] == "CA1"
     assert saved[0][-1] == 0.0
     assert summaries[0] == ("CA1", "summary", "+100")
+    assert stamps == [when]
+    assert ended == ["CA1"]
+
+    def unavailable() -> None:
+        raise ConnectionError("redis down")
+
+    # The call row is already saved, so a missing state store must not fail
+    # the task and make Celery retry it.
+    monkeypatch.setattr(tasks, "StateManager", unavailable)
+    assert tasks.transcribe_audio("audio.wav", "CA2", "+100", "+200") == path
+    assert [row[0] for row in saved] == ["CA1", "CA2"]
+    assert ended == ["CA1"]
 
 
 def test_process_recording(monkeypatch, tmp_path):
@@ -229,6 +254,36 @@ def test_cleanup_old_calls(celery_worker, monkeypatch, tmp_path):
         assert calls[0].call_sid == "new"
 
 
+def test_refresh_tokens_task(monkeypatch, tmp_path):
+    import base64
+
+    import fakeredis
+    import server.tasks as tasks
+    from server.state_manager import StateManager
+
+    monkeypatch.setenv("TOKEN_ENCRYPTION_KEY", base64.b64encode(b"0" * 16).decode())
+    monkeypatch.setenv("VECTOR_DB_PATH", str(tmp_path / "vectors"))
+    manager = StateManager(url="redis://localhost:6379/0")
+    manager._redis = fakeredis.FakeRedis(decode_responses=True)
+    now = int(datetime.now(UTC).timestamp())
+    manager.set_token("due", "old", "rt", expires_at=now + 60)
+    manager.set_token("later", "old", "rt", expires_at=now + 3600)
+    manager.set_token("broken", "old", "rt", expires_at=now)
+
+    def fake_refresh(cfg, data):
+        if data["access_token"] == "old" and int(data["expires_at"]) <= now:
+            raise RuntimeError("boom")
+        return "new", now + 3600
+
+    monkeypatch.setattr(tasks, "StateManager", lambda: manager)
+    monkeypatch.setattr(tasks, "_refresh_credentials", fake_refresh)
+
+    assert tasks.refresh_tokens_task(threshold_seconds=300) == 1
+    assert manager.get_token("due")["access_token"] == "new"
+    assert manager.get_token("later")["access_token"] == "old"
+    assert manager.get_token("broken")["access_token"] == "old"
+
+
 def test_backup_data(celery_worker, tmp_path):
     tasks, _ = celery_worker
 
@@ -77,3 +77,180 @@ def test_vector_db_openai_provider(tmp_path, monkeypatch: pytest.MonkeyPatch) ->
     db = vdb.VectorDB(persist_directory=str(tmp_path))
     db.add_texts(["x"])
     assert db.search("x")[0] == "x"
+
+
+def test_embedding_model_loaded_once(tmp_path, monkeypatch) -> None:
+    loads: list[str] = []
+
+    class CountingModel(DummyModel):
+        def __init__(self, name: str) -> None:
+            loads.append(name)
+            super().__init__(name)
+
+    monkeypatch.setenv("EMBEDDING_MODEL_NAME", "dummy-model")
+    monkeypatch.setattr(vdb, "SentenceTransformer", CountingModel)
+    vdb.warm_up_embeddings()
+    vdb.VectorDB(persist_directory=str(tmp_path / "a"))
+    vdb.VectorDB(persist_directory=str(tmp_path / "b"), collection_name="summaries")
+    assert vdb.get_embedding_function() is vdb.get_embedding_function(
+        "sentence_transformers", "dummy-model"
+    )
+    vdb.get_embedding_function(model_name="other-model")
+    assert loads == ["dummy-model", "other-model"]
+
+
+def test_embedding_cache_skips_repeated_texts(tmp_path) -> None:
+    from server.embedding_cache import CachedEmbeddingFunction, EmbeddingCache
+
+    seen: list[list[str]] = []
+
+    def inner(texts):
+        seen.append(list(texts))
+        return [[float(len(t)), 0.5] if t else [0.0, 0.0] for t in texts]
+
+    path = str(tmp_path / "emb.sqlite3")
+    func = CachedEmbeddingFunction(inner, EmbeddingCache(path), "st:m")
+    assert func(["ab", "abc", "ab"]) == [[2.0, 0.5], [3.0, 0.5], [2.0, 0.5]]
+    assert seen == [["ab", "abc"]]
+
+    # A fresh process sees the persisted vectors; zero fallbacks are not kept.
+    again = CachedEmbeddingFunction(inner, EmbeddingCache(path), "st:m")
+    assert again(["abc", ""]) == [[3.0, 0.5], [0.0, 0.0]]
+    assert seen[-1] == [""]
+    assert len(again.cache) == 2
+    other_model = CachedEmbeddingFunction(inner, again.cache, "st:other")
+    other_model(["ab"])
+    assert seen[-1] == ["ab"]
+
+
+def test_registry_wraps_embedding_cache(tmp_path, monkeypatch) -> None:
+    class OnesModel(DummyModel):
+        def encode(self, texts: list[str]):
+            import numpy as np
+
+            return np.ones((len(texts), 2))
+
+    monkeypatch.setenv("EMBEDDING_MODEL_NAME", "dummy-model")
+    monkeypatch.setenv("EMBEDDING_CACHE_PATH", str(tmp_path / "emb.sqlite3"))
+    monkeypatch.setattr(vdb, "SentenceTransformer", OnesModel)
+    func = vdb.get_embedding_function()
+    assert func(["hi"]) == [[1.0, 1.0]]
+    assert len(func.cache) == 1
+
+    vdb.clear_embedding_models()
+    assert vdb._embedding_caches == {}
+    assert vdb.get_embedding_function().cache is not func.cache
+
+
+def test_warm_up_bypasses_embedding_cache(tmp_path, monkeypatch) -> None:
+    encoded: list[list[str]] = []
+
+    class RecordingModel(DummyModel):
+        def encode(self, texts: list[str]):
+            import numpy as np
+
+            encoded.append(list(texts))
+            return np.ones((len(texts), 2))
+
+    monkeypatch.setenv("EMBEDDING_MODEL_NAME", "dummy-model")
+    monkeypatch.setenv("EMBEDDING_CACHE_PATH", str(tmp_path / "emb.sqlite3"))
+    monkeypatch.setattr(vdb, "SentenceTransformer", RecordingModel)
+    vdb.warm_up_embeddings()
+    # Like a restart: the probe must reach the model, not the persistent cache.
+    vdb.clear_embedding_models()
+    vdb.warm_up_embeddings()
+    assert encoded == [["warm up"], ["warm up"]]
+
+
+def test_add_texts_upserts_content_addressed_ids(tmp_path, monkeypatch) -> None:
+    from server.embedding_cache import text_digest
+    from tests.utils.fake_chroma import shared_client_factory
+
+    monkeypatch.setattr(vdb, "SentenceTransformer", DummyModel)
+    monkeypatch.setattr(vdb.chromadb, "PersistentClient", shared_client_factory())
+    db = vdb.VectorDB(persist_directory=str(tmp_path), collection_name="summaries")
+
+    stats = db.add_texts(["hello", "bye", "hello"])
+    assert stats == {"added": 2, "updated": 0, "unchanged": 0, "duplicate": 1}
+    assert sorted(db.collection.get()["ids"]) == sorted(
+        [text_digest("hello"), text_digest("bye")]
+    )
+
+    # Reprocessing the same content keeps the index size constant.
+    assert db.add_texts(["hello", "bye"])["unchanged"] == 2
+    assert db.collection.count() == 2
+
+    db.add_texts(["first"], ids=["CA1"], metadatas=[{"from_number": "+1"}])
+    upserts = db.collection.calls.count("upsert")
+    assert db.add_texts(["first"], ids=["CA1"])["unchanged"] == 1
+    assert db.collection.calls.count("upsert") == upserts
+    stats = db.add_texts(["second"], ids=["CA1"], metadatas=[{"from_number": "+1"}])
+    assert stats["updated"] == 1
+    assert db.collection.get(ids=["CA1"])["documents"] == ["second"]
+    assert db.collection.count() == 3
+
+
+def test_caller_memory_uses_metadata_lookup(tmp_path, monkeypatch) -> None:
+    from tests.utils.fake_chroma import shared_client_factory
+
+    monkeypatch.setattr(vdb, "SentenceTransformer", DummyModel)
+    monkeypatch.setattr(vdb.chromadb, "PersistentClient", shared_client_factory())
+    db = vdb.VectorDB(persist_directory=str(tmp_path), collection_name="summaries")
+    db.add_texts(
+        ["old", "newest", "other caller", "undated", "middle"],
+        ids=["c1", "c2", "c3", "c4", "c5"],
+        metadatas=[
+            {"from_number": "+1", "created_at": 10.0},
+            {"from_number": "+1", "created_at": 30.0},
+            {"from_number": "+2", "created_at": 40.0},
+            {"from_number": "+1"},
+            {"from_number": "+1", "created_at": 20.0},
+        ],
+    )
+    db.collection.calls.clear()
+
+    assert db.caller_memory("+1", limit=3) == ["newest", "middle", "old"]
+    assert db.collection.calls == ["get"]
+    records = db.get_by_metadata({"from_number": "+1"}, order_by="created_at")
+    assert [r["id"] for r in records] == ["c2", "c5", "c1", "c4"]
+    assert len(db.get_by_metadata({"from_number": "+1"}, limit=2)) == 2
+
+
+def test_search_many_batches_queries(tmp_path, monkeypatch) -> None:
+    from tests.utils.fake_chroma import shared_client_factory
+
+    batches: list[list[str]] = []
+
+    class RecordingModel(DummyModel):
+        def encode(self, texts: list[str]):
+            import numpy as np
+
+            batches.append(list(texts))
+            return np.array([[float(len(t)), 0.0] for t in texts])
+
+    monkeypatch.setattr(vdb, "SentenceTransformer", RecordingModel)
+    monkeypatch.setattr(vdb.chromadb, "PersistentClient", shared_client_factory())
+    db = vdb.VectorDB(persist_directory=str(tmp_path), collection_name="summaries")
+    db.add_texts(
+        ["ab", "abcd", "abcdef"],
+        ids=["c1", "c2", "c3"],
+        metadatas=[{"from_number": "+1"}, {"from_number": "+2"}, {"from_number": "+1"}],
+    )
+    batches.clear()
+    db.collection.calls.clear()
+
+    results = db.search_many(["abc", "abcdef", "abc"], n_results=2)
+
+    assert batches == [["abc", "abcdef"]]
+    assert db.collection.calls == ["query"]
+    assert [r["id"] for r in results[0]] == ["c1", "c2"]
+    assert results[1][0] == {
+        "id": "c3",
+        "document": "abcdef",
+        "metadata": {"from_number": "+1"},
+        "distance": 0.0,
+    }
+    assert results[2] == results[0]
+    filtered = db.search_many(["abcd"], n_results=2, where={"from_number": "+1"})
+    assert [r["id"] for r in filtered[0]] == ["c1", "c3"]
+    assert db.search_many([]) == []
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import update
+
+from server import vector_db as vdb
+from tests.utils.fake_chroma import shared_client_factory
+
+from .db_utils import migrate_sqlite
+
+
+class DummyModel:
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def encode(self, texts: list[str]):
+        import numpy as np
+
+        return np.array([[float(len(t)), 1.0] for t in texts])
+
+
+@pytest.fixture
+def setup(monkeypatch, tmp_path):
+    monkeypatch.setenv("VECTOR_DB_PATH", str(tmp_path / "vectors"))
+    monkeypatch.setattr(vdb, "SentenceTransformer", DummyModel)
+    monkeypatch.setattr(vdb.chromadb, "PersistentClient", shared_client_factory())
+    db = migrate_sqlite(monkeypatch, tmp_path)
+    for i in range(3):
+        db.save_call_summary(f"CA{i}", "+1", "+2", "t.txt", f"summary {i}")
+
+    from server import vector_sync
+
+    return db, vector_sync, vdb.VectorDB(collection_name="summaries")
+
+
+def test_sync_upserts_only_changed_calls(setup, monkeypatch):
+    db, vector_sync, store = setup
+    monkeypatch.setattr(vector_sync, "OVERLAP", timedelta(0))
+
+    assert asyncio.run(vector_sync.sync_vectors(batch_size=2)) == 3
+    assert asyncio.run(vector_sync.sync_vectors(batch_size=2)) == 0
+
+    async def edit() -> None:
+        async with db.get_session_async() as session:
+            await session.execute(
+                update(db.Call)
+                .where(db.Call.call_sid == "CA1")
+                .values(summary="edited")
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+
+    asyncio.run(edit())
+    db.save_call_summary("CA3", "+1", "+2", "t.txt", "summary 3")
+
+    assert asyncio.run(vector_sync.sync_vectors(batch_size=2)) == 2
+    assert store.collection.count() == 4
+    assert store.collection.get(ids=["CA1"])["documents"] == ["edited"]
+
+
+def test_overlap_does_not_duplicate_vectors(setup):
+    _, vector_sync, store = setup
+
+    asyncio.run(vector_sync.sync_vectors())
+    asyncio.run(vector_sync.sync_vectors())
+
+    assert store.collection.count() == 3
+    (metadata,) = store.collection.get(ids=["CA0"])["metadatas"]
+    assert metadata["from_number"] == "+1"
+
+
+def test_overlap_does_not_re_embed(setup, monkeypatch):
+    _, vector_sync, store = setup
+    encoded: list[str] = []
+    encode = DummyModel.encode
+
+    def counting_encode(self, texts):
+        encoded.extend(texts)
+        return encode(self, texts)
+
+    monkeypatch.setattr(DummyModel, "encode", counting_encode)
+
+    assert asyncio.run(vector_sync.sync_vectors(vdb=store)) == 3
+    assert len(encoded) == 3
+    assert asyncio.run(vector_sync.sync_vectors(vdb=store)) == 0
+    assert len(encoded) == 3
+
+
+def test_forget_calls_removes_vectors(setup):
+    _, vector_sync, store = setup
+    asyncio.run(vector_sync.sync_vectors())
+
+    vector_sync.forget_calls(["CA0", "missing"])
+
+    assert sorted(store.collection.get()["ids"]) == ["CA1", "CA2"]
@@ -0,0 +1,153 @@
+"""Small in-memory stand-in for the parts of ``chromadb`` used by VectorDB."""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+
+def _matches(metadata: Optional[dict], where: Optional[dict]) -> bool:
+    if not where:
+        return True
+    if "$and" in where:
+        return all(_matches(metadata, w) for w in where["$and"])
+    metadata = metadata or {}
+    for key, cond in where.items():
+        value = metadata.get(key)
+        if isinstance(cond, dict):
+            ((op, target),) = cond.items()
+            if op == "$eq" and value != target:
+                return False
+            if op == "$in" and value not in target:
+                return False
+            if op == "$gt" and not (value is not None and value > target):
+                return False
+        elif value != cond:
+            return False
+    return True
+
+
+class FakeCollection:
+    def __init__(self, name: str, embedding_function: Any = None) -> None:
+        self.name = name
+        self.embedding_function = embedding_function
+        self.items: Dict[str, dict] = {}
+        self.calls: List[str] = []
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        if self.embedding_function is None:
+            return [[float(len(t)), 0.0] for t in texts]
+        return [list(v) for v in self.embedding_function(texts)]
+
+    def add(self, *, ids, documents, metadatas=None, embeddings=None) -> None:
+        dupes = [i for i in ids if i in self.items]
+        if dupes:
+            raise ValueError(f"IDs already exist: {dupes}")
+        self.upsert(
+            ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings
+        )
+
+    def upsert(self, *, ids, documents, metadatas=None, embeddings=None) -> None:
+        self.calls.append("upsert")
+        embeddings = embeddings or self._embed(list(documents))
+        metadatas = metadatas or [None] * len(ids)
+        for i, doc, meta, emb in zip(ids, documents, metadatas, embeddings):
+            self.items[i] = {"document": doc, "metadata": meta, "embedding": emb}
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=None):
+        self.calls.append("get")
+        keys = [i for i in (ids or self.items) if i in self.items]
+        keys = [k for k in keys if _matches(self.items[k]["metadata"], where)]
+        keys = keys[offset or 0 :]
+        if limit is not None:
+            keys = keys[:limit]
+        return {
+            "ids": keys,
+            "documents": [self.items[k]["document"] for k in keys],
+            "metadatas": [self.items[k]["metadata"] for k in keys],
+        }
+
+    def delete(self, ids=None, where=None) -> None:
+        for key in list(ids or self.items):
+            item = self.items.get(key)
+            if item is not None and _matches(item["metadata"], where):
+                del self.items[key]
+
+    def query(
+        self,
+        query_texts=None,
+        query_embeddings=None,
+        n_results: int = 10,
+        where=None,
+        include=None,
+    ):
+        self.calls.append("query")
+        if query_embeddings is None:
+            query_embeddings = self._embed(list(query_texts))
+        result: Dict[str, list] = {
+            "ids": [],
+            "documents": [],
+            "metadatas": [],
+            "distances": [],
+        }
+        for q in query_embeddings:
+            scored = sorted(
+                (
+                    sum((a - b) ** 2 for a, b in zip(q, item["embedding"])),
+                    key,
+                )
+                for key, item in self.items.items()
+                if _matches(item["metadata"], where)
+            )[:n_results]
+            result["ids"].append([k for _, k in scored])
+            result["documents"].append([self.items[k]["document"] for _, k in scored])
+            result["metadatas"].append([self.items[k]["metadata"] for _, k in scored])
+            result["distances"].append([d for d, _ in scored])
+        return result
+
+    def count(self) -> int:
+        return len(self.items)
+
+    def modify(self, name: Optional[str] = None, **_: Any) -> None:
+        if name:
+            self._client._rename(self.name, name)
+
+
+class FakeClient:
+    def __init__(self, *_: Any, **__: Any) -> None:
+        self.collections: Dict[str, FakeCollection] = {}
+
+    def get_or_create_collection(self, name: str, embedding_function=None, **_: Any):
+        if name not in self.collections:
+            collection = FakeCollection(name, embedding_function)
+            collection._client = self
+            self.collections[name] = collection
+        return self.collections[name]
+
+    def get_collection(self, name: str, **_: Any) -> FakeCollection:
+        if name not in self.collections:
+            raise ValueError(f"Collection {name} does not exist.")
+        return self.collections[name]
+
+    def delete_collection(self, name: str) -> None:
+        if name not in self.collections:
+            raise ValueError(f"Collection {name} does not exist.")
+        del self.collections[name]
+
+    def _rename(self, old: str, new: str) -> None:
+        if new in self.collections:
+            raise ValueError(f"Collection {new} already exists.")
+        collection = self.collections.pop(old)
+        collection.name = new
+        self.collections[new] = collection
+
+    def heartbeat(self) -> int:
+        return 1
+
+
+def shared_client_factory():
+    """Return a ``PersistentClient`` replacement keyed by ``path``."""
+    clients: Dict[str, FakeClient] = {}
+
+    def factory(path: str = "", **_: Any) -> FakeClient:
+        return clients.setdefault(path, FakeClient())
+
+    return factory
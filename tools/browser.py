@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from logging_config import logger
 from bs4 import BeautifulSoup
-from server.cache import redis_cache
+from server.cache import negative, redis_cache, uncacheable
 from .base import Tool
 
 try:
@@ -13,11 +13,11 @@ except Exception:  # pragma: no cover - optional dep
 __all__ = ["browse_url", "BrowserTool"]
 
 
-@redis_cache(ttl=600)
+@redis_cache(ttl=600, codec="msgpack", compress_threshold=512)
 async def browse_url(url: str) -> str:
     """Return plain text from ``url`` using browser-use."""
     if BrowserSession is None:
-        return "Browser integration is unavailable."
+        return uncacheable("Browser integration is unavailable.")
     session = BrowserSession()
     try:
         await session.navigate(url)
@@ -27,7 +27,7 @@ async def browse_url(url: str) -> str:
         return text[:1000]
     except Exception as exc:  # noqa: BLE001
         logger.bind(url=url, error=str(exc)).error("browser_use_failed")
-        return "Sorry, I'm unable to access that page right now."
+        return negative("Sorry, I'm unable to access that page right now.")
     finally:
         await session.close()
 
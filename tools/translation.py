@@ -3,7 +3,7 @@ from __future__ import annotations
 
 from deep_translator import GoogleTranslator
 from logging_config import logger
-from server.cache import redis_cache
+from server.cache import negative, redis_cache
 from .base import Tool
 
 __all__ = ["translate_text", "TranslateTool"]
@@ -17,7 +17,7 @@ def translate_text(text: str, target_lang: str, source_lang: str | None = None)
         return translator.translate(text)
     except Exception as exc:  # noqa: BLE001
         logger.bind(target_lang=target_lang, error=str(exc)).error("translate_failed")
-        return "Sorry, I'm unable to translate that right now."
+        return negative("Sorry, I'm unable to translate that right now.")
 
 
 class TranslateTool(Tool):
@@ -3,14 +3,14 @@ from __future__ import annotations
 
 import requests
 from logging_config import logger
-from server.cache import redis_cache
+from server.cache import negative, redis_cache
 from .base import Tool
 from util import call_with_retries
 
 __all__ = ["get_weather", "WeatherTool"]
 
 
-@redis_cache(ttl=3600)
+@redis_cache(ttl=3600, stale_ttl=900)
 def get_weather(location: str) -> str:
     """Return a simple weather report for the given location."""
     url = f"https://wttr.in/{location}?format=j1"
@@ -27,7 +27,7 @@ def get_weather(location: str) -> str:
         )
     except Exception as exc:  # noqa: BLE001
         logger.bind(location=location, error=str(exc)).error("weather_failed")
-        return "Sorry, I'm unable to retrieve the weather right now."
+        return negative("Sorry, I'm unable to retrieve the weather right now.")
 
 
 class WeatherTool(Tool):